@@ -0,0 +1,67 @@
+"""ヘッダー解析（probe_file）のベンチマーク
+
+python -m bench.audio_probe_corpus [音声ファイル...]
+
+各ファイルの解析結果と所要時間を表示する。ファイルを指定しない場合は長さの異なる
+WAVファイルを一時ディレクトリに作成し、全体を読み込んでデコードした場合と比べる。
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import wave
+from typing import List
+from utils.audio_probe import probe_file
+
+SAMPLE_RATE = 16000
+CORPUS_SECONDS = [1, 10, 60, 300, 1200]
+
+def _create_corpus(directory: str) -> List[str]:
+    """無音のWAVファイルを長さごとに作成"""
+    paths = []
+    for seconds in CORPUS_SECONDS:
+        path = os.path.join(directory, f'{seconds}s.wav')
+        with wave.open(path, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            w.writeframes(b'\0\0' * SAMPLE_RATE * seconds)
+        paths.append(path)
+    return paths
+
+def _decode_duration(path: str) -> float:
+    """比較用: 全フレームを読み込んで長さを求める"""
+    with wave.open(path, 'rb') as w:
+        frames = len(w.readframes(w.getnframes())) // (w.getsampwidth() * w.getnchannels())
+        return frames / w.getframerate()
+
+def main(paths: List[str]):
+    directory = None
+    if not paths:
+        directory = tempfile.mkdtemp(prefix='probe-bench-')
+        paths = _create_corpus(directory)
+    
+    try:
+        total = 0.0
+        for path in paths:
+            started = time.perf_counter()
+            info = probe_file(path)
+            elapsed = time.perf_counter() - started
+            total += elapsed
+            line = f"{elapsed * 1000:8.3f} ms  {path}: {info}"
+            if directory:
+                started = time.perf_counter()
+                duration = _decode_duration(path)
+                decoded = time.perf_counter() - started
+                assert info is not None and abs(info.duration - duration) < 0.01, (info, duration)
+                line += f"  (full read {decoded * 1000:.3f} ms)"
+            print(line)
+        if paths:
+            print(f"{len(paths)} files, {total * 1000:.3f} ms total, {total * 1000 / len(paths):.3f} ms/file")
+    finally:
+        if directory:
+            shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""OpenAIServiceの同時実行ベンチマーク
+
+python -m bench.openai_concurrency [件数] [最大遅延秒]
+
+ローカルの擬似Whisperサーバー（OPENAI_BASE_URLで差し替え）に対して、
+N件の文字起こしを1件ずつ順に送った場合と同時に送った場合の所要時間を比べる。
+同時に送った場合は最も遅い1件とほぼ同じ時間で終わり、その間もイベントループが
+止まらない（ハートビートの遅れが小さい）ことを確認する。
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from aiohttp import web
+
+async def _start_server(max_delay: float):
+    """clip{i}.ogg の i に応じて応答を遅らせる擬似Whisperサーバー"""
+    async def transcriptions(request: web.Request) -> web.Response:
+        form = await request.post()
+        upload = form['file']
+        index = int(upload.filename[len('clip'):].split('.')[0])
+        count = int(request.headers.get('X-Bench-Count', '1'))
+        await asyncio.sleep(max_delay * (index + 1) / count)
+        return web.json_response({'text': f'clip {index}'})
+    
+    app = web.Application()
+    app.router.add_post('/audio/transcriptions', transcriptions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+async def _heartbeat(interval: float, gaps: list):
+    """イベントループが止まっていないかを一定間隔の遅れで測る"""
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        gaps.append(time.perf_counter() - started - interval)
+
+async def main(count: int = 8, max_delay: float = 1.0):
+    logging.disable(logging.INFO)
+    runner, port = await _start_server(max_delay)
+    os.environ['OPENAI_API_KEY'] = 'bench'
+    os.environ['OPENAI_BASE_URL'] = f'http://127.0.0.1:{port}'
+    
+    from services.openai_service import OpenAIService
+    
+    # リミッターは件数で固定する（同時実行数の自動調整は別の検証対象）
+    service = OpenAIService({'concurrency': {'initial_limit': count, 'min_limit': count, 'max_limit': count}})
+    await service.initialize()
+    service.session.headers['X-Bench-Count'] = str(count)
+    audio = b'\0' * 32 * 1024
+    delays = [max_delay * (i + 1) / count for i in range(count)]
+    
+    async def run(label: str, concurrent: bool):
+        gaps = []
+        ticker = asyncio.create_task(_heartbeat(0.05, gaps))
+        started = time.perf_counter()
+        if concurrent:
+            results = await asyncio.gather(*[
+                service.transcribe_audio(audio, f'clip{i}.ogg') for i in range(count)
+            ])
+        else:
+            results = [await service.transcribe_audio(audio, f'clip{i}.ogg') for i in range(count)]
+        elapsed = time.perf_counter() - started
+        ticker.cancel()
+        
+        ok = sum(result is not None for result in results)
+        print(f"{label:<12} {elapsed:6.2f}s  ok={ok}/{count}  "
+              f"max loop lag={max(gaps, default=0.0) * 1000:.1f}ms")
+        return elapsed
+    
+    print(f"{count} clips, slowest {max(delays):.2f}s, sum {sum(delays):.2f}s")
+    sequential = await run('sequential', False)
+    concurrent = await run('concurrent', True)
+    print(f"speedup {sequential / concurrent:.1f}x "
+          f"(concurrent / slowest = {concurrent / max(delays):.2f})")
+    
+    await service.close()
+    await runner.cleanup()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 8, float(args[1]) if len(args) > 1 else 1.0))
\ No newline at end of file
@@ -0,0 +1,120 @@
+"""Rangeリクエストによる事前解析（AttachmentDownloader.probe_remote）の確認
+
+python -m bench.range_probe [音声の長さ(分)]
+
+ローカルの代替CDNにWAVファイルを置き、Range対応・非対応の2通りで probe_remote を実行する。
+
+  Range対応     先頭・末尾の2回の206応答だけで長さが分かり、送信量がprobe_kbの2倍程度に
+                収まること（全体をダウンロードした結果と長さが一致すること）
+  Range非対応   先頭の200応答の本文を読まずにNoneを返し、末尾は要求せずに
+                全体のダウンロードに任せること（リクエストは1回だけ）
+
+サーバー側で送信したバイト数を数え、全体のダウンロードと比べて表示する。Range非対応の
+場合の送信量は、クライアントが接続を閉じるまでにソケットのバッファへ書き込めた量。
+"""
+import asyncio
+import io
+import logging
+import sys
+import time
+import wave
+from aiohttp import web
+from utils.downloader import AttachmentDownloader
+
+SAMPLE_RATE = 16000
+
+def _wav_bytes(seconds: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(b'\0\0' * SAMPLE_RATE * seconds)
+    return buffer.getvalue()
+
+def _parse_range(header: str, size: int):
+    """bytes=start-end / bytes=-suffix を (start, end) に変換（endは含まない）"""
+    spec = header.split('=', 1)[1]
+    start, end = spec.split('-', 1)
+    if not start:
+        return max(0, size - int(end)), size
+    return int(start), min(size, int(end) + 1) if end else size
+
+async def _start_cdn(body: bytes, stats: dict):
+    """/ranged はRangeに対応し、/plain はRangeを無視して常に全体を返す"""
+    async def serve(request: web.Request, ranged: bool) -> web.StreamResponse:
+        stats['requests'] += 1
+        byte_range = request.headers.get('Range') if ranged else None
+        if byte_range:
+            start, end = _parse_range(byte_range, len(body))
+            status = 206
+            headers = {'Content-Range': f'bytes {start}-{end - 1}/{len(body)}'}
+        else:
+            start, end = 0, len(body)
+            status = 200
+            headers = {}
+        
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = end - start
+        await response.prepare(request)
+        # クライアントが本文を読まずに切断した場合は送信を打ち切る
+        try:
+            for offset in range(start, end, 64 * 1024):
+                chunk = body[offset:min(end, offset + 64 * 1024)]
+                await response.write(chunk)
+                stats['bytes'] += len(chunk)
+            await response.write_eof()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        return response
+    
+    app = web.Application()
+    app.router.add_get('/ranged/clip.wav', lambda request: serve(request, True))
+    app.router.add_get('/plain/clip.wav', lambda request: serve(request, False))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+async def main(minutes: int = 10):
+    logging.disable(logging.WARNING)
+    body = _wav_bytes(minutes * 60)
+    stats = {'requests': 0, 'bytes': 0}
+    runner, base_url = await _start_cdn(body, stats)
+    downloader = AttachmentDownloader()
+    
+    async def measure(label: str, call):
+        stats['requests'] = stats['bytes'] = 0
+        started = time.perf_counter()
+        result = await call()
+        elapsed = time.perf_counter() - started
+        # 打ち切られた応答の送信が終わるのを待ってから数える
+        await asyncio.sleep(0.1)
+        print(f"{label:<20} {elapsed * 1000:8.1f} ms  requests={stats['requests']}  "
+              f"sent={stats['bytes'] / 1024:,.0f} KB")
+        return result, stats['bytes']
+    
+    try:
+        print(f"{minutes} min WAV, {len(body) / 1024 / 1024:.1f} MB, probe_kb={downloader.probe_size // 1024}")
+        
+        info, sent = await measure('probe (Range)', lambda: downloader.probe_remote(f'{base_url}/ranged/clip.wav', len(body)))
+        assert info is not None and info.duration == minutes * 60, info
+        assert sent <= downloader.probe_size * 2, sent
+        
+        audio, full = await measure('full download', lambda: downloader.download(f'{base_url}/ranged/clip.wav', 'clip.wav'))
+        assert audio is not None and audio.duration == info.duration, audio
+        audio.cleanup()
+        
+        info, _ = await measure('probe (no Range)', lambda: downloader.probe_remote(f'{base_url}/plain/clip.wav', len(body)))
+        assert info is None, info
+        assert stats['requests'] == 1, stats
+        
+        print(f"probe fetched {sent / full:.2%} of the file; durations match")
+    finally:
+        await downloader.close()
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 10))
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""サーキットブレーカーと再試行の障害注入デモ
+
+python -m bench.resilience_faults
+
+ローカルの障害注入サーバーに対してResilience.callを呼び、1件ごとの結果・所要時間・
+ブレーカーの状態を表示する。サーバーは 正常 → 429(Retry-After) → 503 → 応答停止 → 回復
+の順に振る舞いを変える。ブレーカーが開いている間は即座に失敗（fail fast）することを確認する。
+"""
+import asyncio
+import logging
+import time
+import aiohttp
+from aiohttp import web
+from utils.resilience import CircuitOpenError, Resilience, UpstreamError, raise_for_status
+
+async def main():
+    logging.disable(logging.INFO)
+    mode = {'value': 'ok'}
+    
+    async def handler(request: web.Request) -> web.Response:
+        if mode['value'] == '503':
+            return web.Response(status=503, text='unavailable')
+        if mode['value'] == '429':
+            mode['value'] = 'ok'
+            return web.Response(status=429, text='slow down', headers={'Retry-After': '1'})
+        if mode['value'] == 'hang':
+            await asyncio.sleep(5)
+        return web.json_response({'text': 'ok'})
+    
+    app = web.Application()
+    app.router.add_post('/audio', handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    
+    resilience = Resilience('demo', {
+        'base_delay_seconds': 0.05,
+        'max_delay_seconds': 0.2,
+        'failure_threshold': 3,
+        'reset_timeout_seconds': 1.0
+    })
+    
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=0.5)) as session:
+        async def attempt():
+            async with session.post(f'http://127.0.0.1:{port}/audio', data=b'x') as response:
+                await raise_for_status(response)
+                return await response.json()
+        
+        async def request(label: str):
+            started = time.perf_counter()
+            try:
+                await resilience.call('audio', attempt)
+                outcome = 'ok'
+            except CircuitOpenError:
+                outcome = 'fail fast'
+            except UpstreamError as e:
+                outcome = f'error ({e.status or "network"})'
+            elapsed = (time.perf_counter() - started) * 1e6
+            print(f"{label:<10} {outcome:<14} {elapsed:>10.0f} us  breaker={resilience.breaker('audio').state}")
+        
+        await request('healthy')
+        mode['value'] = '429'
+        await request('429')
+        for phase in ('503', 'hang'):
+            mode['value'] = phase
+            for i in range(3):
+                await request(phase)
+            await asyncio.sleep(1.1)
+        mode['value'] = 'ok'
+        await request('recovered')
+        await request('recovered')
+    
+    await runner.cleanup()
+    print(resilience.metrics())
+
+if __name__ == '__main__':
+    asyncio.run(main())
\ No newline at end of file
@@ -1,8 +1,32 @@
 import discord
 from discord.ext import commands
-import json
-import os
+from typing import Any, Mapping, Optional
 from utils.logger import setup_logger
+from utils.config_service import ConfigError, require
+from utils.cache import LRUCache
+from utils.single_flight import SingleFlight
+
+# リアクション設定のデフォルト（config/reactions.jsonがない場合に作成）
+DEFAULT_REACTIONS = {
+    "📝": {
+        "name": "summarize",
+        "description": "文字起こし結果を要約",
+        "enabled": True
+    },
+    "🌐": {
+        "name": "translate",
+        "description": "英語に翻訳",
+        "enabled": True
+    }
+}
+
+def validate_reaction_config(config: Mapping[str, Any]):
+    """reactions.jsonの検証"""
+    for emoji, info in config.items():
+        if not isinstance(info, dict):
+            raise ConfigError(f"{emoji} must be an object")
+        require(info, 'name', str, f"{emoji}.")
+        require(info, 'enabled', bool, f"{emoji}.")
 
 class ReactionHandler(commands.Cog):
     """リアクションベースの機能を処理"""
@@ -10,32 +34,69 @@ class ReactionHandler(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = setup_logger('ReactionHandler')
-        self.reaction_config = self._load_reaction_config()
+        
+        # リアクション設定（変更は再起動なしで反映）
+        bot.config.register('reactions', 'config/reactions.json', default=DEFAULT_REACTIONS,
+                            validate=validate_reaction_config)
+        
+        # 文字起こし結果メッセージID → 全文のインデックス（fetch_messageを不要にする）
+        reaction_settings = bot.settings.get('reactions', {})
+        self.result_index = LRUCache(max_size=reaction_settings.get('result_index_size', 2048))
+        # インデックスにないため取得して確認した、結果ではないメッセージ（再取得しない）
+        self.non_results = LRUCache(max_size=reaction_settings.get('result_index_size', 2048))
+        # これより前のメッセージは起動前の結果の可能性があるため、インデックスになければ取得して確認する
+        self.started_at = discord.utils.utcnow()
+        
+        # 同じ文字起こしへの要約・翻訳をまとめて1回のAPI呼び出しにする
+        self.action_flights = SingleFlight(
+            max_size=reaction_settings.get('action_cache_size', 512),
+            ttl=reaction_settings.get('action_cache_ttl_minutes', 60) * 60
+        )
     
-    def _load_reaction_config(self) -> dict:
-        """リアクション設定を読み込み"""
-        config_path = 'config/reactions.json'
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                return json.load(f)
-        else:
-            # デフォルト設定
-            default = {
-                "📝": {
-                    "name": "summarize",
-                    "description": "文字起こし結果を要約",
-                    "enabled": True
-                },
-                "🌐": {
-                    "name": "translate",
-                    "description": "英語に翻訳",
-                    "enabled": True
-                }
-            }
-            os.makedirs(os.path.dirname(config_path), exist_ok=True)
-            with open(config_path, 'w') as f:
-                json.dump(default, f, indent=2)
-            return default
+    @property
+    def reaction_config(self) -> Mapping[str, Any]:
+        """現在のリアクション設定（config/reactions.jsonの変更を反映したスナップショット）"""
+        return self.bot.config.get('reactions')
+    
+    def register_result(self, message_id: int, transcription: str, transcription_id: Optional[int] = None):
+        """文字起こし結果メッセージを登録"""
+        self.result_index.set(message_id, {
+            'transcription': transcription,
+            'transcription_id': transcription_id
+        })
+    
+    async def lookup_result(self, message_id: int, channel_id: Optional[int] = None) -> Optional[dict]:
+        """文字起こし結果メッセージを検索
+        
+        データベースがないため、インデックスにない場合はメッセージを取得してEmbedから読む。
+        取得するのは起動前のメッセージか、インデックスから追い出された可能性がある場合だけ
+        （それ以外のメッセージへのリアクションではREST呼び出しをしない）。
+        """
+        result = self.result_index.get(message_id)
+        if result is not None:
+            return result
+        
+        if channel_id is None or message_id in self.non_results:
+            return None
+        if discord.utils.snowflake_time(message_id) >= self.started_at and not self.result_index.evictions:
+            return None
+        
+        try:
+            channel = self.bot.get_channel(channel_id) or await self.bot.fetch_channel(channel_id)
+            message = await channel.fetch_message(message_id)
+        except (discord.NotFound, discord.Forbidden):
+            self.non_results.set(message_id, True)
+            return None
+        
+        # Botが送った文字起こし結果のEmbedかチェック
+        if (message.author != self.bot.user or not message.embeds
+                or message.embeds[0].title != "📝 文字起こし結果" or not message.embeds[0].description):
+            self.non_results.set(message_id, True)
+            return None
+        
+        # 全文はEmbedの4000文字までしか残っていない
+        self.register_result(message_id, message.embeds[0].description)
+        return self.result_index.get(message_id)
     
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
@@ -54,42 +115,36 @@ class ReactionHandler(commands.Cog):
         if not reaction_info.get('enabled', False):
             return
         
-        # メッセージを取得
-        channel = self.bot.get_channel(payload.channel_id)
-        if not channel:
-            return
-        
         try:
-            message = await channel.fetch_message(payload.message_id)
-            
-            # Botのメッセージかチェック
-            if message.author != self.bot.user:
+            # 文字起こし結果メッセージかチェック（通常はREST呼び出しなし）
+            result = await self.lookup_result(payload.message_id, payload.channel_id)
+            if not result:
                 return
             
-            # 文字起こし結果のEmbedかチェック
-            if not message.embeds or not message.embeds[0].title == "📝 文字起こし結果":
-                return
+            # メッセージ本体は取得せず、部分メッセージとして扱う
+            channel = self.bot.get_partial_messageable(payload.channel_id, guild_id=payload.guild_id)
+            message = channel.get_partial_message(payload.message_id)
             
             # リアクションを処理
             await self.process_reaction(
                 message=message,
                 emoji=emoji,
                 user_id=payload.user_id,
-                reaction_info=reaction_info
+                reaction_info=reaction_info,
+                result=result
             )
             
         except Exception as e:
             self.logger.error(f"Error processing reaction: {str(e)}")
     
-    async def process_reaction(self, message: discord.Message, emoji: str, 
-                             user_id: int, reaction_info: dict):
+    async def process_reaction(self, message: discord.PartialMessage, emoji: str, 
+                             user_id: int, reaction_info: dict, result: dict):
         """リアクションに基づいて処理を実行"""
         action = reaction_info['name']
         self.logger.info(f"Processing reaction {emoji} ({action}) from user {user_id}")
         
-        # 元の文字起こしテキストを取得
-        original_embed = message.embeds[0]
-        transcription = original_embed.description
+        # 元の文字起こしテキスト（Embedの4000文字制限前の全文）
+        transcription = result['transcription']
         self.logger.info(f"Extracted transcription text: {transcription[:100] if transcription else 'None'}")
         
         # アクションに応じて処理
@@ -98,7 +153,7 @@ class ReactionHandler(commands.Cog):
         elif action == "translate":
             await self.translate_transcription(message, transcription, user_id)
     
-    async def summarize_transcription(self, message: discord.Message, transcription: str, user_id: int):
+    async def summarize_transcription(self, message: discord.PartialMessage, transcription: str, user_id: int):
         """文字起こし結果を要約"""
         user = self.bot.get_user(user_id)
         if not user:
@@ -113,7 +168,10 @@ class ReactionHandler(commands.Cog):
             self.logger.info(f"Generating summary for text: {transcription[:50]}...")
             
             try:
-                summary = voice_handler.openai_service.summarize_text(transcription)
+                summary = await self.action_flights.run(
+                    SingleFlight.make_key(transcription, 'summarize'),
+                    lambda: voice_handler.openai_service.summarize_text(transcription)
+                )
                 if not summary:
                     summary = "要約の生成に失敗しました。"
                     self.logger.error("Summary generation returned None")
@@ -147,7 +205,7 @@ class ReactionHandler(commands.Cog):
             self.logger.error(f"Error sending summary: {str(e)}")
             await message.reply(f"エラーが発生しました: {str(e)}", delete_after=10)
     
-    async def translate_transcription(self, message: discord.Message, transcription: str, user_id: int):
+    async def translate_transcription(self, message: discord.PartialMessage, transcription: str, user_id: int):
         """文字起こし結果を翻訳"""
         user = self.bot.get_user(user_id)
         if not user:
@@ -162,7 +220,10 @@ class ReactionHandler(commands.Cog):
             self.logger.info(f"Generating translation for text: {transcription[:50]}...")
             
             try:
-                translation = voice_handler.openai_service.translate_text(transcription, "English")
+                translation = await self.action_flights.run(
+                    SingleFlight.make_key(transcription, 'translate', 'English'),
+                    lambda: voice_handler.openai_service.translate_text(transcription, "English")
+                )
                 if not translation:
                     translation = "翻訳の生成に失敗しました。"
                     self.logger.error("Translation generation returned None")
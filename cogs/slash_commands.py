@@ -92,6 +92,56 @@ class SlashCommands(commands.Cog):
             inline=True
         )
         
+        # 文字起こしキューの状態
+        if voice_handler:
+            queue_metrics = voice_handler.job_queue.metrics()
+            embed.add_field(
+                name="処理キュー",
+                value=(
+                    f"待機中: {queue_metrics['depth']}/{queue_metrics['max_depth']}\n"
+                    f"平均待ち時間: {queue_metrics['avg_wait']:.1f}秒\n"
+                    f"p95待ち時間: {queue_metrics['p95_wait']:.1f}秒"
+                ),
+                inline=True
+            )
+            
+            # 文字起こしバックエンドのレイテンシ
+            router_metrics = voice_handler.transcription_router.metrics()
+            embed.add_field(
+                name="文字起こしバックエンド",
+                value="\n".join(
+                    f"{name}: p50 {m['p50']:.1f}秒 / p95 {m['p95']:.1f}秒 / "
+                    f"エラー率 {m['error_rate'] * 100:.0f}% / ヘッジ {m['hedged']}回"
+                    for name, m in router_metrics.items()
+                ),
+                inline=False
+            )
+            
+            # 上流APIの同時実行数（自動調整）
+            limiter_metrics = voice_handler.openai_service.limiter.metrics()
+            embed.add_field(
+                name="同時実行数",
+                value=(
+                    f"上限: {limiter_metrics['limit']}\n"
+                    f"実行中: {limiter_metrics['in_flight']} / 待機中: {limiter_metrics['waiting']}\n"
+                    f"拒否: {limiter_metrics['rejected']}件"
+                ),
+                inline=True
+            )
+            
+            # 音声前処理の削減量
+            if voice_handler.preprocessor.enabled:
+                preprocess_metrics = voice_handler.preprocessor.metrics()
+                embed.add_field(
+                    name="音声前処理",
+                    value=(
+                        f"処理数: {preprocess_metrics['processed']}件\n"
+                        f"削減時間: {preprocess_metrics['saved_seconds'] / 60:.1f}分\n"
+                        f"削減容量: {preprocess_metrics['saved_bytes'] / 1024 / 1024:.1f} MB"
+                    ),
+                    inline=True
+                )
+        
         embed.add_field(
             name="バージョン",
             value="Phase 2 Simple (データベースなし版)",
@@ -1,28 +1,75 @@
 import discord
+import functools
 from discord.ext import commands
 from services.openai_service import OpenAIService
+from services.dify_service import DifyService
+from services.transcription_router import TranscriptionRouter, openai_backend, dify_backend
 from utils.logger import setup_logger, log_voice_processing, log_error
+from utils.job_queue import JobQueue
+from utils.transcription_cache import TranscriptionCache
+from utils.audio_chunker import AudioChunker
+from utils.downloader import AttachmentDownloader
+from utils.audio_preprocessor import AudioPreprocessor
 
 class VoiceHandler(commands.Cog):
     """音声メッセージの処理を担当"""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.openai_service = OpenAIService()
+        self.openai_service = OpenAIService(bot.settings.get('openai'))
+        self.dify_service = DifyService(bot.settings.get('dify'))
         self.logger = setup_logger('VoiceHandler')
         
+        # 文字起こしバックエンドの振り分け（Difyは認証情報がある場合のみ）
+        self.transcription_router = TranscriptionRouter(bot.settings.get('router'))
+        self.transcription_router.add_backend('openai', openai_backend(self.openai_service))
+        if self.dify_service.api_url and self.dify_service.api_key:
+            self.transcription_router.add_backend('dify', dify_backend(self.dify_service))
+        
         # サポートする音声フォーマット
         self.supported_formats = ('.ogg', '.mp3', '.wav', '.m4a', '.webm')
         
+        # 文字起こしジョブキュー
+        queue_settings = bot.settings.get('queue', {})
+        self.job_queue = JobQueue(
+            handler=self.process_voice_message,
+            workers=queue_settings.get('workers', 4),
+            max_depth=queue_settings.get('max_depth', 50),
+            name='TranscriptionQueue'
+        )
+        
+        # 添付ファイルのダウンロード（サイズ上限付き）
+        self.downloader = AttachmentDownloader(bot.settings.get('audio'))
+        
+        self.max_duration = bot.settings.get('audio', {}).get('max_duration_minutes', 30) * 60
+        
+        # 無音の除去・モノラル16kHz化（オプション）
+        self.preprocessor = AudioPreprocessor(bot.settings.get('preprocess'))
+        
+        # 長い音声の分割・並列文字起こし
+        self.audio_chunker = AudioChunker(bot.settings.get('chunking'))
+        
+        # 文字起こしキャッシュ（メモリのみ）
+        self.transcription_cache = TranscriptionCache(bot.settings.get('cache'))
+        
         # 処理中のメッセージIDを追跡
         self.processing_messages = set()
     
     async def cog_load(self):
         """Cogのロード時に実行"""
+        await self.openai_service.initialize()
+        await self.dify_service.initialize()
+        await self.downloader.initialize()
+        self.job_queue.start()
         self.logger.info("VoiceHandler cog loaded")
     
     async def cog_unload(self):
         """Cogのアンロード時に実行"""
+        await self.job_queue.stop()
+        await self.openai_service.close()
+        await self.dify_service.close()
+        await self.downloader.close()
+        self.preprocessor.close()
         self.logger.info("VoiceHandler cog unloaded")
     
     @commands.Cog.listener()
@@ -32,19 +79,29 @@ class VoiceHandler(commands.Cog):
         if message.author == self.bot.user:
             return
         
-        # 音声ファイルの処理
+        # 音声ファイルをキューに登録
+        guild_key = str(message.guild.id) if message.guild else 'DM'
         for attachment in message.attachments:
             if attachment.filename.lower().endswith(self.supported_formats):
-                await self.process_voice_message(message, attachment)
+                # ダウンロード前にサイズ上限をチェック
+                if self.downloader.is_too_large(attachment.size):
+                    await message.reply(f'❌ ファイルサイズが上限（{self.downloader.max_file_size // (1024 * 1024)}MB）を超えています。')
+                    continue
+                if not self.job_queue.submit(guild_key, message, attachment):
+                    await message.reply('⏳ 現在混雑しています。しばらくしてから再度お試しください。')
+                    break
     
     async def process_voice_message(self, message: discord.Message, attachment: discord.Attachment):
         """音声メッセージを処理"""
         # 重複処理を防ぐ
-        if message.id in self.processing_messages:
-            self.logger.warning(f"Message {message.id} is already being processed, skipping...")
+        processing_key = (message.id, attachment.id)
+        if processing_key in self.processing_messages:
+            self.logger.warning(f"Attachment {attachment.id} of message {message.id} is already being processed, skipping...")
             return
         
-        self.processing_messages.add(message.id)
+        self.processing_messages.add(processing_key)
+        audio = None
+        processed = None
         
         try:
             log_voice_processing(self.logger, message, attachment)
@@ -53,8 +110,22 @@ class VoiceHandler(commands.Cog):
             processing_msg = await message.reply('🎙️ 音声を処理中...')
             
             try:
-                # 音声ファイルをダウンロード
-                file_data = await attachment.read()
+                # 先頭・末尾だけを取得して長さをチェック（全体のダウンロード前）
+                remote_info = await self.downloader.probe_remote(attachment.url, attachment.size)
+                if remote_info and remote_info.duration is not None and remote_info.duration > self.max_duration:
+                    await processing_msg.edit(content=f'❌ 音声の長さが上限（{self.max_duration // 60}分）を超えています。')
+                    return
+                
+                # 音声ファイルを一時ファイルへチャンク単位でダウンロード
+                audio = await self.downloader.download(attachment.url, attachment.filename, attachment.content_type)
+                if audio is None:
+                    await processing_msg.edit(content='❌ 音声ファイルのダウンロードに失敗しました。')
+                    return
+                
+                # ヘッダーから取得した長さで上限をチェック（API呼び出し前）
+                if audio.duration is not None and audio.duration > self.max_duration:
+                    await processing_msg.edit(content=f'❌ 音声の長さが上限（{self.max_duration // 60}分）を超えています。')
+                    return
                 
                 # ユーザー情報
                 user_info = {
@@ -64,11 +135,20 @@ class VoiceHandler(commands.Cog):
                     'server': message.guild.name if message.guild else 'DM'
                 }
                 
-                # 文字起こし
-                transcription = await self.openai_service.transcribe_audio(
-                    file_data=file_data,
-                    filename=attachment.filename
-                )
+                # 文字起こし（同じ音声はキャッシュから返す）
+                # 時間圧縮の倍率はギルドごとに異なるためキーに含める
+                # （バックエンドはルーターがヘッジ・フェイルオーバーで選ぶため区別しない）
+                speed = self.preprocessor.speed_for(message.guild.id if message.guild else None, audio.duration)
+                cache_key = self.transcription_cache.key_from_digest(audio.digest, 'ja', None, speed)
+                transcription = await self.transcription_cache.get(cache_key)
+                if transcription is None:
+                    # 無音の除去・時間圧縮・圧縮（無効または効果がない場合は元の音声を送信）
+                    processed = await self.preprocessor.process(audio, speed)
+                    transcription = await self.audio_chunker.transcribe(
+                        processed or audio,
+                        functools.partial(self.transcription_router.transcribe_audio, user_info=user_info)
+                    )
+                    await self.transcription_cache.set(cache_key, transcription)
                 
                 # 処理中メッセージを削除
                 await processing_msg.delete()
@@ -84,6 +164,11 @@ class VoiceHandler(commands.Cog):
                     # メッセージを送信し、リアクションを追加
                     result_msg = await message.reply(embed=embed)
                     
+                    # リアクション処理用に結果メッセージを登録
+                    reaction_handler = self.bot.get_cog('ReactionHandler')
+                    if reaction_handler:
+                        reaction_handler.register_result(result_msg.id, transcription)
+                    
                     # リアクションを追加
                     await result_msg.add_reaction('📝')  # 要約
                     await result_msg.add_reaction('🌐')  # 翻訳
@@ -97,8 +182,12 @@ class VoiceHandler(commands.Cog):
                 log_error(self.logger, e, f"during voice processing of {attachment.filename}")
                 await processing_msg.edit(content=f'❌ エラーが発生しました: {str(e)}')
         finally:
-            # 処理完了後、メッセージIDを削除
-            self.processing_messages.discard(message.id)
+            # 処理完了後、メッセージIDと一時ファイルを削除
+            self.processing_messages.discard(processing_key)
+            if audio:
+                audio.cleanup()
+            if processed:
+                processed.cleanup()
     
     def create_transcription_embed(self, transcription: str, author: discord.User, 
                                  channel: discord.abc.Messageable) -> discord.Embed:
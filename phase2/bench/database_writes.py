@@ -0,0 +1,129 @@
+"""データベースの書き込みスループットのベンチマーク
+
+python -m bench.database_writes [件数] [同時実行数]
+
+同じスキーマに文字起こし履歴をN件書き込み、1秒あたりの書き込み件数を比べる。
+
+  per-call connect   以前の実装（書き込みごとに接続を開き、DELETEジャーナルでコミット）
+  shared WAL         1本の長寿命接続（WAL・synchronous=NORMAL）で書き込みごとにコミット
+  unbatched          現在のDatabase.save_transcriptionを書き出し単位1件で実行
+                     （daily_statsの集計更新を含む）
+  write-behind       現在のDatabase.save_transcription（バッファしてまとめてコミット。
+                     履歴はexecutemanyで挿入し、daily_statsは日・ギルドごとに1回だけ更新）
+
+write-behindは集計更新を含めてもshared WALより速いことを確認する。
+"""
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import aiosqlite
+from utils.database import Database
+
+INSERT = """INSERT INTO transcriptions
+            (message_id, user_id, guild_id, channel_id, file_name, file_size, transcription, language)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+def _row(i: int) -> tuple:
+    return (None, f'user{i % 50}', 'guild', f'channel{i % 5}', f'clip{i}.ogg', 100000 + i,
+            'これはベンチマーク用の文字起こしです。' * 5, 'ja')
+
+async def _create_schema(path: str):
+    database = Database(path)
+    await database.initialize()
+    await database.close()
+
+async def _run_concurrently(count: int, concurrency: int, write):
+    """count件をconcurrency個のタスクに分けて書き込み、所要時間を返す"""
+    async def worker(offset: int):
+        for i in range(offset, count, concurrency):
+            await write(i)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*[worker(offset) for offset in range(concurrency)])
+    return time.perf_counter() - started
+
+async def per_call_connect(path: str, count: int, concurrency: int) -> float:
+    async with aiosqlite.connect(path) as db:
+        await db.execute("PRAGMA journal_mode=DELETE")
+    
+    async def write(i: int):
+        async with aiosqlite.connect(path) as db:
+            await db.execute(INSERT, _row(i))
+            await db.commit()
+    
+    return await _run_concurrently(count, concurrency, write)
+
+async def shared_wal(path: str, count: int, concurrency: int) -> float:
+    db = await aiosqlite.connect(path, cached_statements=256)
+    await db.execute("PRAGMA journal_mode=WAL")
+    await db.execute("PRAGMA synchronous=NORMAL")
+    lock = asyncio.Lock()
+    
+    async def write(i: int):
+        async with lock:
+            await db.execute(INSERT, _row(i))
+            await db.commit()
+    
+    try:
+        return await _run_concurrently(count, concurrency, write)
+    finally:
+        await db.close()
+
+async def write_behind(path: str, count: int, concurrency: int, batch_size: int = 50) -> float:
+    database = Database(path, {'write_batch_size': batch_size})
+    await database.initialize()
+    
+    async def write(i: int):
+        _, user_id, guild_id, channel_id, file_name, file_size, transcription, language = _row(i)
+        await database.save_transcription(None, user_id, guild_id, channel_id, file_name,
+                                          file_size, transcription, language)
+        if batch_size == 1:
+            await database.flush()
+    
+    started = time.perf_counter()
+    await _run_concurrently(count, concurrency, write)
+    # 書き込みがディスクに反映されるまでを計測に含める
+    await database.flush()
+    elapsed = time.perf_counter() - started
+    await database.close()
+    return elapsed
+
+async def unbatched(path: str, count: int, concurrency: int) -> float:
+    return await write_behind(path, count, concurrency, batch_size=1)
+
+async def main(count: int = 2000, concurrency: int = 8):
+    logging.disable(logging.INFO)
+    directory = tempfile.mkdtemp(prefix='db-bench-')
+    try:
+        print(f"{count} transcription writes, {concurrency} concurrent writers")
+        baseline = None
+        rates = {}
+        for label, bench in (('per-call connect', per_call_connect),
+                             ('shared WAL', shared_wal),
+                             ('unbatched', unbatched),
+                             ('write-behind', write_behind)):
+            path = os.path.join(directory, f"{label.replace(' ', '_')}.db")
+            await _create_schema(path)
+            elapsed = await bench(path, count, concurrency)
+            
+            async with aiosqlite.connect(path) as db:
+                cursor = await db.execute("SELECT COUNT(*) FROM transcriptions")
+                written = (await cursor.fetchone())[0]
+            assert written == count, f"{label}: {written} rows"
+            
+            rate = count / elapsed
+            rates[label] = rate
+            baseline = baseline or rate
+            print(f"{label:<18} {elapsed:7.2f}s  {rate:9.0f} writes/s  ({rate / baseline:.1f}x)")
+        
+        assert rates['write-behind'] > rates['shared WAL'], "write-behind is slower than shared WAL"
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 2000, int(args[1]) if len(args) > 1 else 8))
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""Dify APIのローカル代替サーバーとストリーミングモードのベンチマーク
+
+python -m bench.dify_stream [チャンク数] [チャンク間隔秒]
+    blockingとstreamingで同じワークフローを実行し、最初のテキストが届くまでの
+    時間と全体の所要時間を比べる
+
+python -m bench.dify_stream serve [ポート]
+    代替サーバーだけを起動する（DIFY_BASE_URL=http://127.0.0.1:ポート でBotを接続）
+
+サーバーは /files/upload と /workflows/run を実装し、streamingではtext_chunkイベントを
+一定間隔でSSEとして送ってから workflow_finished を送る。
+"""
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from aiohttp import web
+
+TEXT = 'これはストリーミングの確認用の文字起こしです。'
+
+def create_app(chunks: int = 10, interval: float = 0.3) -> web.Application:
+    """Dify APIの代替アプリケーション（ワークフローはchunks × interval秒かかる）"""
+    async def upload(request: web.Request) -> web.Response:
+        form = await request.post()
+        return web.json_response({'id': f"file-{form['file'].filename}"}, status=201)
+    
+    async def run_workflow(request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        pieces = [TEXT[len(TEXT) * i // chunks:len(TEXT) * (i + 1) // chunks] for i in range(chunks)]
+        
+        if body.get('response_mode') != 'streaming':
+            await asyncio.sleep(chunks * interval)
+            return web.json_response({'data': {'status': 'succeeded', 'outputs': {'transcription': TEXT}}})
+        
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        
+        async def send(event: dict):
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+        
+        await send({'event': 'workflow_started', 'data': {}})
+        for piece in pieces:
+            await asyncio.sleep(interval)
+            await send({'event': 'text_chunk', 'data': {'text': piece}})
+        await send({'event': 'workflow_finished', 'data': {'status': 'succeeded', 'outputs': {'transcription': TEXT}}})
+        await response.write_eof()
+        return response
+    
+    app = web.Application()
+    app.router.add_post('/files/upload', upload)
+    app.router.add_post('/workflows/run', run_workflow)
+    return app
+
+async def start_server(chunks: int = 10, interval: float = 0.3, port: int = 0):
+    """代替サーバーを起動して (runner, ベースURL) を返す"""
+    runner = web.AppRunner(create_app(chunks, interval))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    return runner, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+async def main(chunks: int = 10, interval: float = 0.3):
+    logging.disable(logging.INFO)
+    runner, base_url = await start_server(chunks, interval)
+    os.environ['DIFY_API_KEY'] = 'bench'
+    os.environ['DIFY_BASE_URL'] = base_url
+    os.environ.pop('DIFY_API_URL', None)
+    
+    from services.dify_service import DifyService
+    
+    service = DifyService()
+    user_info = {'user_id': 'bench', 'username': 'bench'}
+    audio = b'\0' * 16 * 1024
+    
+    started = time.perf_counter()
+    text = await service.transcribe_audio(audio, 'bench.ogg', 'audio/ogg', user_info)
+    total = time.perf_counter() - started
+    assert text == TEXT, text
+    print(f"blocking   first text {total:5.2f}s  total {total:5.2f}s")
+    
+    started = time.perf_counter()
+    first = None
+    partials = 0
+    async for text, is_final in service.transcribe_audio_stream(audio, 'bench.ogg', 'audio/ogg', user_info):
+        if first is None:
+            first = time.perf_counter() - started
+        if is_final:
+            assert text == TEXT, text
+        else:
+            partials += 1
+    total = time.perf_counter() - started
+    print(f"streaming  first text {first:5.2f}s  total {total:5.2f}s  partial updates={partials}")
+    
+    await service.close()
+    await runner.cleanup()
+
+async def serve(port: int):
+    runner, base_url = await start_server(port=port)
+    print(f"Dify stand-in listening on {base_url} (Ctrl+C to stop)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args and args[0] == 'serve':
+        asyncio.run(serve(int(args[1]) if len(args) > 1 else 5001))
+    else:
+        asyncio.run(main(int(args[0]) if args else 10, float(args[1]) if len(args) > 1 else 0.3))
\ No newline at end of file
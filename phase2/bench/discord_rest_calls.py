@@ -0,0 +1,250 @@
+"""文字起こし1件・追加処理1回あたりのDiscord REST呼び出し数の計測
+
+python -m bench.discord_rest_calls [件数]
+
+VoiceBotをDiscordに接続せずに起動し、discord.pyのHTTPクライアントと
+インタラクション応答（Webhookアダプター）の呼び出しを記録する。
+添付ファイルとDify APIはローカルの代替サーバーで応答する。
+
+リアクションモードとボタンモードでそれぞれN件を文字起こしし、要約・翻訳を1回ずつ
+実行して呼び出しを数える。ボタンモードでは送信後にビューストアに残ったビューの数も表示する。
+"""
+import asyncio
+import io
+import itertools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import wave
+from collections import Counter
+from aiohttp import web
+import discord
+from discord.webhook.async_ import AsyncWebhookAdapter
+
+PHASE2_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PHASE2_DIR not in sys.path:
+    sys.path.insert(0, PHASE2_DIR)
+
+BOT_USER = {'id': '9000', 'username': 'voicebot', 'discriminator': '0', 'avatar': None, 'bot': True}
+USER = {'id': '1001', 'username': 'tester', 'discriminator': '0', 'avatar': None, 'global_name': None}
+CHANNEL_ID = '3000'
+DM_CHANNEL_ID = '3001'
+
+_ids = itertools.count(100000)
+
+def _message(channel_id: str, author: dict, **fields) -> dict:
+    data = {
+        'id': str(next(_ids)),
+        'channel_id': channel_id,
+        'author': author,
+        'content': '',
+        'timestamp': discord.utils.utcnow().isoformat(),
+        'edited_timestamp': None,
+        'tts': False,
+        'mention_everyone': False,
+        'mentions': [],
+        'mention_roles': [],
+        'attachments': [],
+        'embeds': [],
+        'components': [],
+        'pinned': False,
+        'type': 0
+    }
+    data.update(fields)
+    return data
+
+class RestRecorder:
+    """HTTPクライアントとWebhookアダプターの呼び出しを記録し、最小限の応答を返す"""
+    
+    def __init__(self):
+        self.calls = Counter()
+        self.messages = {}
+    
+    def _respond(self, method: str, path: str, payload: dict):
+        if path.startswith('/interactions/'):
+            return {'interaction': {'id': str(next(_ids)), 'type': 3, 'response_message_loading': True,
+                                    'response_message_ephemeral': True}}
+        if method == 'POST' and path == '/users/@me/channels':
+            return {'id': DM_CHANNEL_ID, 'type': 1, 'recipients': [USER]}
+        if method in ('POST', 'PATCH') and path.endswith('/messages') or 'webhooks' in path and method == 'POST':
+            message = _message(CHANNEL_ID, BOT_USER, content=payload.get('content') or '',
+                               embeds=payload.get('embeds') or [], components=payload.get('components') or [])
+            self.messages[message['id']] = message
+            return message
+        if method == 'PATCH':
+            return _message(CHANNEL_ID, BOT_USER, content=payload.get('content') or '')
+        if method == 'PUT' and path.startswith('/applications'):
+            return []
+        return None
+    
+    def install(self, bot: discord.Client):
+        recorder = self
+        
+        async def request(route, **kwargs):
+            recorder.calls[f"{route.method} {route.path}"] += 1
+            return recorder._respond(route.method, route.path, kwargs.get('json') or {})
+        
+        async def webhook_request(adapter, route, session, **kwargs):
+            recorder.calls[f"{route.method} {route.path}"] += 1
+            return recorder._respond(route.method, route.path, kwargs.get('payload') or {})
+        
+        bot.http.request = request
+        AsyncWebhookAdapter.request = webhook_request
+    
+    def followups(self) -> int:
+        return sum(count for name, count in self.calls.items() if name.startswith('POST /webhooks'))
+    
+    def take(self) -> Counter:
+        calls, self.calls = self.calls, Counter()
+        return calls
+
+def _wav_bytes(seconds: float = 1.0) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b'\0\0' * int(16000 * seconds))
+    return buffer.getvalue()
+
+async def _start_attachment_server(audio: bytes):
+    """Range要求に対応した添付ファイルの代替CDN"""
+    directory = tempfile.mkdtemp(prefix='cdn-')
+    with open(os.path.join(directory, 'clip.wav'), 'wb') as f:
+        f.write(audio)
+    app = web.Application()
+    app.router.add_static('/attachments', directory)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    return runner, directory, f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/attachments/clip.wav"
+
+def _format(calls: Counter, per: int) -> str:
+    total = sum(calls.values()) / per
+    detail = ', '.join(f"{name} x{count / per:g}" for name, count in sorted(calls.items()))
+    return f"{total:g} calls ({detail})"
+
+async def run_mode(mode: str, count: int, audio: bytes, attachment_url: str, workdir: str):
+    """指定モードでBotを起動し、文字起こしN件と追加処理の呼び出し数を計測"""
+    settings_path = os.path.join(workdir, 'config', 'settings.json')
+    with open(os.path.join(PHASE2_DIR, 'config', 'settings.json'), encoding='utf-8') as f:
+        settings = json.load(f)
+    settings['reactions']['mode'] = mode
+    os.makedirs(os.path.dirname(settings_path), exist_ok=True)
+    with open(settings_path, 'w', encoding='utf-8') as f:
+        json.dump(settings, f, ensure_ascii=False)
+    
+    from main import VoiceBot
+    
+    bot = VoiceBot()
+    recorder = RestRecorder()
+    recorder.install(bot)
+    state = bot._connection
+    state.user = discord.ClientUser(state=state, data=BOT_USER)
+    # membersインテントなしではユーザーがキャッシュされないため、直接登録する
+    # （キャッシュは弱参照なので計測中は参照を保持する）
+    user = discord.User(state=state, data=USER)
+    state._users[user.id] = user
+    await bot.setup_hook()
+    recorder.take()
+    
+    try:
+        voice_handler = bot.get_cog('VoiceHandler')
+        reaction_handler = bot.get_cog('ReactionHandler')
+        # 音声はサーバーのテキストチャンネルに投稿されたものとして扱う（ユーザーとのDMは未作成）
+        channel = bot.get_partial_messageable(int(CHANNEL_ID))
+        
+        results = []
+        for i in range(count):
+            attachment = {
+                'id': str(next(_ids)), 'filename': 'clip.wav', 'size': len(audio),
+                'url': attachment_url, 'proxy_url': attachment_url, 'content_type': 'audio/wav'
+            }
+            message = discord.Message(state=state, channel=channel,
+                                      data=_message(CHANNEL_ID, USER, attachments=[attachment]))
+            await voice_handler.process_voice_message(message, message.attachments[0])
+            results.append(max(recorder.messages, key=int))
+        transcription_calls = recorder.take()
+        
+        result_data = recorder.messages[results[-1]]
+        action_calls = []
+        if mode == 'reaction':
+            for emoji in ('📝', '🌐'):
+                payload = discord.RawReactionActionEvent(
+                    data={'message_id': result_data['id'], 'channel_id': CHANNEL_ID, 'user_id': USER['id'], 'type': 0},
+                    emoji=discord.PartialEmoji(name=emoji),
+                    event_type='REACTION_ADD'
+                )
+                await reaction_handler.on_raw_reaction_add(payload)
+                action_calls.append((emoji, recorder.take()))
+        else:
+            # インデックスから外れた結果でも、ボタンに埋め込まれたIDで引けることを確かめる
+            reaction_handler.result_index.clear()
+            for action in ('summarize', 'translate'):
+                custom_id = next(
+                    component['custom_id']
+                    for row in result_data['components'] for component in row['components']
+                    if component['custom_id'].split(':')[1] == action
+                )
+                state.parse_interaction_create({
+                    'id': str(next(_ids)), 'application_id': BOT_USER['id'], 'type': 3, 'token': 'token',
+                    'version': 1, 'channel_id': CHANNEL_ID, 'channel': {'id': CHANNEL_ID, 'type': 1},
+                    'user': USER, 'message': result_data, 'locale': 'ja', 'app_permissions': '0',
+                    'entitlements': [], 'authorizing_integration_owners': {}, 'attachment_size_limit': 8388608,
+                    'data': {'custom_id': custom_id, 'component_type': 2}
+                })
+                # DynamicItemのコールバックはタスクとして実行されるため、フォローアップの送信を待つ
+                followups = recorder.followups()
+                for _ in range(200):
+                    await asyncio.sleep(0.01)
+                    if recorder.followups() > followups:
+                        break
+                # 「見つかりませんでした」のテキストではなく結果のEmbedが返ること
+                assert recorder.messages[max(recorder.messages, key=int)]['embeds'], f"{action}: result not found"
+                action_calls.append((action, recorder.take()))
+        
+        store = state._view_store
+        print(f"[{mode}]")
+        print(f"  per transcription: {_format(transcription_calls, count)}")
+        for name, calls in action_calls:
+            print(f"  action {name:<10} {_format(calls, 1)}")
+        if mode == 'button':
+            print(f"  views retained after {count} results: {len(store._synced_message_views)} "
+                  f"(dispatch entries {len(store._views)}, dynamic item templates {len(store._dynamic_items)})")
+    
+    finally:
+        await bot.close()
+
+async def main(count: int = 5):
+    logging.disable(logging.INFO)
+    audio = _wav_bytes()
+    
+    from bench.dify_stream import start_server
+    
+    dify_runner, dify_url = await start_server(chunks=1, interval=0.0)
+    cdn_runner, cdn_directory, attachment_url = await _start_attachment_server(audio)
+    os.environ['DIFY_API_KEY'] = 'bench'
+    os.environ['DIFY_BASE_URL'] = dify_url
+    os.environ.pop('DIFY_API_URL', None)
+    
+    workdir = tempfile.mkdtemp(prefix='rest-bench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for mode in ('reaction', 'button'):
+            shutil.rmtree(os.path.join(workdir, 'data'), ignore_errors=True)
+            await run_mode(mode, count, audio, attachment_url, workdir)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+        shutil.rmtree(cdn_directory)
+        await dify_runner.cleanup()
+        await cdn_runner.cleanup()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 5))
\ No newline at end of file
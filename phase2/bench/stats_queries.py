@@ -0,0 +1,166 @@
+"""統計クエリのベンチマーク（大量の履歴がある場合）
+
+python -m bench.stats_queries [行数] [ギルド数] [ユーザー数]
+
+過去1年分の文字起こし履歴をN行（既定100万行）作成し、/voice_server_stats と
+/voice_stats が使う集計を以前のクエリ（date(created_at)での絞り込み・全件走査）と
+現在のDatabase.get_guild_stats / get_user_stats で比べる。
+"""
+import asyncio
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from utils.database import Database
+
+OLD_GUILD_QUERIES = [
+    """SELECT COUNT(*) as total_count,
+              COUNT(DISTINCT user_id) as unique_users,
+              SUM(file_size) as total_size,
+              AVG(LENGTH(transcription)) as avg_length
+       FROM transcriptions
+       WHERE guild_id = ? AND date(created_at) >= ?""",
+    """SELECT date(created_at) as date, COUNT(*) as count
+       FROM transcriptions
+       WHERE guild_id = ? AND date(created_at) >= ?
+       GROUP BY date(created_at)
+       ORDER BY date DESC""",
+    """SELECT user_id, COUNT(*) as count
+       FROM transcriptions
+       WHERE guild_id = ? AND date(created_at) >= ?
+       GROUP BY user_id
+       ORDER BY count DESC
+       LIMIT 10""",
+]
+
+OLD_USER_QUERIES = [
+    """SELECT COUNT(*) as monthly_count, SUM(file_size) as total_size
+       FROM transcriptions
+       WHERE user_id = ? AND date(created_at) >= ?""",
+    """SELECT channel_id, COUNT(*) as count
+       FROM transcriptions
+       WHERE user_id = ?
+       GROUP BY channel_id
+       ORDER BY count DESC
+       LIMIT 3""",
+]
+
+def _populate(path: str, rows: int, guilds: int, users: int):
+    """過去365日に分散した履歴を直接書き込む"""
+    rng = random.Random(0)
+    now = datetime.now()
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA synchronous=OFF")
+    db.executemany("INSERT OR IGNORE INTO users (user_id, last_reset) VALUES (?, ?)",
+                   [(f'user{u}', now.date().isoformat()) for u in range(users)])
+    
+    def generate():
+        for i in range(rows):
+            created = now - timedelta(seconds=rng.randrange(365 * 24 * 3600))
+            text = 'テスト' * rng.randrange(5, 40)
+            yield (f'user{rng.randrange(users)}', f'guild{rng.randrange(guilds)}',
+                   f'channel{rng.randrange(20)}', f'clip{i}.ogg', rng.randrange(10000, 5000000),
+                   rng.uniform(1, 300), text, 'ja', created.strftime('%Y-%m-%d %H:%M:%S'),
+                   created.date().isoformat(), len(text))
+    
+    db.executemany(
+        """INSERT INTO transcriptions
+           (user_id, guild_id, channel_id, file_name, file_size, duration, transcription,
+            language, created_at, created_day, transcription_length)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        generate()
+    )
+    db.commit()
+    db.execute("ANALYZE")
+    db.close()
+
+def _time_old(path: str, queries: list, repeat: int) -> float:
+    """(クエリ, パラメータ) の組を順に実行した1回あたりの時間"""
+    db = sqlite3.connect(path)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query, params in queries:
+            db.execute(query, params).fetchall()
+    elapsed = (time.perf_counter() - started) / repeat
+    db.close()
+    return elapsed
+
+async def _time_new(call, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        await call()
+    return (time.perf_counter() - started) / repeat
+
+async def main(rows: int = 1000000, guilds: int = 20, users: int = 2000):
+    logging.disable(logging.INFO)
+    directory = tempfile.mkdtemp(prefix='stats-bench-')
+    path = os.path.join(directory, 'bot.db')
+    try:
+        database = Database(path)
+        await database.initialize()
+        await database.close()
+        
+        started = time.perf_counter()
+        _populate(path, rows, guilds, users)
+        print(f"populated {rows:,} rows ({guilds} guilds, {users} users) in {time.perf_counter() - started:.1f}s")
+        
+        database = Database(path)
+        await database.initialize()
+    except BaseException:
+        shutil.rmtree(directory)
+        raise
+    try:
+        started = time.perf_counter()
+        await database.rebuild_daily_stats()
+        print(f"rebuilt daily_stats in {time.perf_counter() - started:.1f}s")
+        started = time.perf_counter()
+        await database.rebuild_daily_stats('guild0')
+        print(f"rebuilt daily_stats for guild0 in {time.perf_counter() - started:.1f}s\n")
+        
+        since = (datetime.now() - timedelta(days=30)).date().isoformat()
+        first_day = datetime.now().replace(day=1).date().isoformat()
+        
+        old = _time_old(path, [(query, ('guild0', since)) for query in OLD_GUILD_QUERIES], 3)
+        new = await _time_new(lambda: database.get_guild_stats('guild0', 30), 20)
+        print(f"guild stats (30 days)  old {old * 1000:9.1f}ms  new {new * 1000:7.2f}ms  ({old / new:,.0f}x)")
+        
+        old = _time_old(path, list(zip(OLD_USER_QUERIES, [('user0', first_day), ('user0',)])), 3)
+        new = await _time_new(lambda: database.get_user_stats('user0'), 20)
+        print(f"user stats (month)     old {old * 1000:9.1f}ms  new {new * 1000:7.2f}ms  ({old / new:,.0f}x)")
+        
+        stats = await database.get_guild_stats('guild0', 30)
+        db = sqlite3.connect(path)
+        exact = db.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT user_id) FROM transcriptions WHERE guild_id = ? AND created_day >= ?",
+            ('guild0', since)
+        ).fetchone()
+        print(f"\nguild0: {stats['total_transcriptions']} transcriptions (exact {exact[0]}), "
+              f"{stats['unique_users']} users (exact {exact[1]})")
+        
+        print("\nquery plans:")
+        for query, params in (
+            ("SELECT date, total_transcriptions FROM daily_stats WHERE guild_id = ? AND date >= ?", ('guild0', since)),
+            ("SELECT user_id, COUNT(*) FROM transcriptions WHERE guild_id = ? AND created_day >= ? GROUP BY user_id",
+             ('guild0', since)),
+            ("SELECT COUNT(*), SUM(file_size) FROM transcriptions WHERE user_id = ? AND created_day >= ?",
+             ('user0', first_day)),
+        ):
+            for row in db.execute(f"EXPLAIN QUERY PLAN {query}", params):
+                print(f"  {row[3]}")
+        db.close()
+    finally:
+        await database.close()
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    asyncio.run(main(
+        int(args[0]) if args else 1000000,
+        int(args[1]) if len(args) > 1 else 20,
+        int(args[2]) if len(args) > 2 else 2000
+    ))
\ No newline at end of file
@@ -1,8 +1,59 @@
 import discord
 from discord.ext import commands
-import json
-import os
+from typing import Any, Mapping, Optional
 from utils.logger import setup_logger
+from utils.config_service import ConfigError, require
+from utils.cache import LRUCache
+from utils.single_flight import SingleFlight
+
+# ボタンのcustom_idは "voice:<アクション>:<文字起こしID>" の形式
+BUTTON_PREFIX = 'voice'
+BUTTON_LABELS = {
+    'summarize': '要約',
+    'translate': '翻訳'
+}
+
+# リアクション設定のデフォルト（config/reactions.jsonがない場合に作成）
+DEFAULT_REACTIONS = {
+    "📝": {
+        "name": "summarize",
+        "description": "文字起こし結果を要約",
+        "enabled": True
+    },
+    "🌐": {
+        "name": "translate",
+        "description": "英語に翻訳",
+        "enabled": True
+    },
+    "📋": {
+        "name": "meeting_notes",
+        "description": "議事録形式に整形",
+        "enabled": False
+    },
+    "🔍": {
+        "name": "extract_actions",
+        "description": "アクションアイテムを抽出",
+        "enabled": False
+    },
+    "💬": {
+        "name": "create_thread",
+        "description": "スレッドを作成",
+        "enabled": False
+    },
+    "📊": {
+        "name": "analyze_sentiment",
+        "description": "感情分析",
+        "enabled": False
+    }
+}
+
+def validate_reaction_config(config: Mapping[str, Any]):
+    """reactions.jsonの検証"""
+    for emoji, info in config.items():
+        if not isinstance(info, dict):
+            raise ConfigError(f"{emoji} must be an object")
+        require(info, 'name', str, f"{emoji}.")
+        require(info, 'enabled', bool, f"{emoji}.")
 
 class ReactionHandler(commands.Cog):
     """リアクションベースの機能を処理"""
@@ -10,52 +61,72 @@ class ReactionHandler(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = setup_logger('ReactionHandler')
-        self.reaction_config = self._load_reaction_config()
-    
-    def _load_reaction_config(self) -> dict:
-        """リアクション設定を読み込み"""
-        config_path = 'config/reactions.json'
-        if os.path.exists(config_path):
-            with open(config_path, 'r') as f:
-                return json.load(f)
-        else:
-            # デフォルト設定
-            default = {
-                "📝": {
-                    "name": "summarize",
-                    "description": "文字起こし結果を要約",
-                    "enabled": True
-                },
-                "🌐": {
-                    "name": "translate",
-                    "description": "英語に翻訳",
-                    "enabled": True
-                },
-                "📋": {
-                    "name": "meeting_notes",
-                    "description": "議事録形式に整形",
-                    "enabled": False
-                },
-                "🔍": {
-                    "name": "extract_actions",
-                    "description": "アクションアイテムを抽出",
-                    "enabled": False
-                },
-                "💬": {
-                    "name": "create_thread",
-                    "description": "スレッドを作成",
-                    "enabled": False
-                },
-                "📊": {
-                    "name": "analyze_sentiment",
-                    "description": "感情分析",
-                    "enabled": False
-                }
-            }
-            os.makedirs(os.path.dirname(config_path), exist_ok=True)
-            with open(config_path, 'w') as f:
-                json.dump(default, f, indent=2)
-            return default
+        
+        # リアクション設定（変更は再起動なしで反映）
+        bot.config.register('reactions', 'config/reactions.json', default=DEFAULT_REACTIONS,
+                            validate=validate_reaction_config)
+        
+        # 文字起こし結果メッセージID → 全文のインデックス（fetch_messageを不要にする）
+        reaction_settings = bot.settings.get('reactions', {})
+        self.result_index = LRUCache(max_size=reaction_settings.get('result_index_size', 2048))
+        
+        # 同じ文字起こしへの要約・翻訳をまとめて1回のAPI呼び出しにする
+        self.action_flights = SingleFlight(
+            max_size=reaction_settings.get('action_cache_size', 512),
+            ttl=reaction_settings.get('action_cache_ttl_minutes', 60) * 60
+        )
+    
+    @property
+    def reaction_config(self) -> Mapping[str, Any]:
+        """現在のリアクション設定（config/reactions.jsonの変更を反映したスナップショット）"""
+        return self.bot.config.get('reactions')
+    
+    def register_result(self, message_id: int, transcription: str, transcription_id: Optional[int] = None):
+        """文字起こし結果メッセージを登録"""
+        self.result_index.set(message_id, {
+            'transcription': transcription,
+            'transcription_id': transcription_id
+        })
+    
+    async def lookup_result(self, message_id: int) -> Optional[dict]:
+        """文字起こし結果メッセージを検索（インデックスになければデータベース）"""
+        result = self.result_index.get(message_id)
+        if result is not None:
+            return result
+        
+        database = getattr(self.bot, 'database', None)
+        if not database:
+            return None
+        
+        transcription_data = await database.get_transcription_by_message(str(message_id))
+        if not transcription_data:
+            return None
+        
+        self.register_result(message_id, transcription_data['transcription'], transcription_data['id'])
+        return self.result_index.get(message_id)
+    
+    async def lookup_transcription(self, transcription_id: int, message_id: Optional[int] = None) -> Optional[dict]:
+        """ボタンに埋め込まれたIDで文字起こしを検索（インデックスはキャッシュとして使う）
+        
+        結果メッセージIDの書き込み前やインデックスから外れた後でも、IDで引けば見つかる。
+        """
+        if message_id is not None:
+            result = self.result_index.get(message_id)
+            if result is not None and result['transcription_id'] == transcription_id:
+                return result
+        
+        database = getattr(self.bot, 'database', None)
+        if not database:
+            return None
+        
+        transcription_data = await database.get_transcription(transcription_id)
+        if not transcription_data:
+            return None
+        
+        result = {'transcription': transcription_data['transcription'], 'transcription_id': transcription_id}
+        if message_id is not None:
+            self.result_index.set(message_id, result)
+        return result
     
     @commands.Cog.listener()
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
@@ -74,48 +145,42 @@ class ReactionHandler(commands.Cog):
         if not reaction_info.get('enabled', False):
             return
         
-        # メッセージを取得
-        channel = self.bot.get_channel(payload.channel_id)
-        if not channel:
-            return
-        
         try:
-            message = await channel.fetch_message(payload.message_id)
-            
-            # Botのメッセージかチェック
-            if message.author != self.bot.user:
+            # 文字起こし結果メッセージかチェック（REST呼び出しなし）
+            result = await self.lookup_result(payload.message_id)
+            if not result:
                 return
             
-            # 文字起こし結果のEmbedかチェック
-            if not message.embeds or not message.embeds[0].title == "📝 文字起こし結果":
-                return
+            # メッセージ本体は取得せず、部分メッセージとして扱う
+            channel = self.bot.get_partial_messageable(payload.channel_id, guild_id=payload.guild_id)
+            message = channel.get_partial_message(payload.message_id)
             
             # リアクションを処理
             await self.process_reaction(
                 message=message,
                 emoji=emoji,
                 user_id=payload.user_id,
-                reaction_info=reaction_info
+                reaction_info=reaction_info,
+                result=result
             )
             
         except Exception as e:
             self.logger.error(f"Error processing reaction: {str(e)}")
     
-    async def process_reaction(self, message: discord.Message, emoji: str, 
-                             user_id: int, reaction_info: dict):
+    async def process_reaction(self, message: discord.PartialMessage, emoji: str, 
+                             user_id: int, reaction_info: dict, result: dict):
         """リアクションに基づいて処理を実行"""
         action = reaction_info['name']
         self.logger.info(f"Processing reaction {emoji} ({action}) from user {user_id}")
         
-        # 元の文字起こしテキストを取得
-        original_embed = message.embeds[0]
-        transcription = original_embed.description
+        # 元の文字起こしテキスト（Embedの4000文字制限前の全文）
+        transcription = result['transcription']
         
         # アクションに応じて処理
         if action == "summarize":
-            await self.summarize_transcription(message, transcription, user_id)
+            await self.summarize_transcription(message, transcription, user_id, result.get('transcription_id'))
         elif action == "translate":
-            await self.translate_transcription(message, transcription, user_id)
+            await self.translate_transcription(message, transcription, user_id, result.get('transcription_id'))
         else:
             # 未実装の機能
             user = self.bot.get_user(user_id)
@@ -125,49 +190,17 @@ class ReactionHandler(commands.Cog):
                 except discord.Forbidden:
                     pass
     
-    async def summarize_transcription(self, message: discord.Message, transcription: str, user_id: int):
+    async def summarize_transcription(self, message: discord.PartialMessage, transcription: str, user_id: int,
+                                      transcription_id: Optional[int] = None):
         """文字起こし結果を要約"""
         user = self.bot.get_user(user_id)
         if not user:
             return
         
-        # DifyServiceで要約を生成
-        voice_handler = self.bot.get_cog('VoiceHandler')
-        if voice_handler:
-            dify_service = voice_handler.dify_service
-            summary = dify_service._generate_simple_summary(transcription)
-        else:
-            summary = "要約サービスが利用できません。"
-        
-        # データベースアクセス（オプション）
-        if hasattr(self.bot, 'database'):
-            db = self.bot.database
-            # メッセージIDから文字起こし情報を取得
-            result_msg_id = str(message.id)
-            transcription_data = await db.get_transcription_by_message(result_msg_id)
-            
-            if transcription_data:
-                # 要約を保存
-                await db.update_transcription_summary(transcription_data['id'], summary)
-                
-                # リアクション履歴を保存
-                await db.save_reaction_action(
-                    transcription_id=transcription_data['id'],
-                    user_id=str(user_id),
-                    reaction='📝',
-                    action_type='summarize',
-                    result='success'
-                )
+        summary = await self.generate_summary(transcription, user_id, transcription_id)
         
         # 要約をDMで送信
-        embed = discord.Embed(
-            title="📝 要約結果",
-            description=summary,
-            color=discord.Color.blue(),
-            timestamp=discord.utils.utcnow()
-        )
-        embed.add_field(name="元のメッセージ", value=f"[こちら]({message.jump_url})", inline=False)
-        embed.set_footer(text=f"文字数: {len(transcription)} → {len(summary)}")
+        embed = self.create_summary_embed(transcription, summary, message.jump_url)
         
         try:
             await user.send(embed=embed)
@@ -175,51 +208,189 @@ class ReactionHandler(commands.Cog):
         except discord.Forbidden:
             await message.reply(f"{user.mention} 要約結果をDMで送信しようとしましたが、DMを受け取る設定になっていません。", delete_after=10)
     
-    async def translate_transcription(self, message: discord.Message, transcription: str, user_id: int):
+    async def translate_transcription(self, message: discord.PartialMessage, transcription: str, user_id: int,
+                                      transcription_id: Optional[int] = None):
         """文字起こし結果を翻訳"""
         user = self.bot.get_user(user_id)
         if not user:
             return
         
-        # DifyServiceで翻訳
+        translation = await self.generate_translation(transcription, user_id, transcription_id)
+        
+        # 翻訳結果をDMで送信
+        embed = self.create_translation_embed(translation, message.jump_url)
+        
+        try:
+            await user.send(embed=embed)
+            await message.add_reaction('✅')
+        except discord.Forbidden:
+            await message.reply(f"{user.mention} 翻訳結果をDMで送信しようとしましたが、DMを受け取る設定になっていません。", delete_after=10)
+    
+    async def generate_summary(self, transcription: str, user_id: int,
+                               transcription_id: Optional[int] = None) -> str:
+        """要約を生成して履歴を保存"""
+        # DifyServiceで要約を生成
+        voice_handler = self.bot.get_cog('VoiceHandler')
+        if not voice_handler:
+            return "要約サービスが利用できません。"
+        
+        async def summarize() -> str:
+            return voice_handler.dify_service._generate_simple_summary(transcription)
+        
+        summary = await self.action_flights.run(
+            SingleFlight.make_key(transcription, 'summarize'),
+            summarize
+        )
+        
+        # データベースアクセス（オプション）
+        if getattr(self.bot, 'database', None) and transcription_id:
+            db = self.bot.database
+            
+            # 要約の生成は同じ本文の同時リクエストでまとめられるため、保存は呼び出し元の
+            # transcription_idごとに行う（同じ本文の再投稿でも各行に要約を残す）
+            await db.update_transcription_summary(transcription_id, summary)
+            
+            # リアクション履歴を保存（リクエストしたユーザーごと）
+            await db.save_reaction_action(
+                transcription_id=transcription_id,
+                user_id=str(user_id),
+                reaction='📝',
+                action_type='summarize',
+                result='success'
+            )
+        
+        return summary
+    
+    async def generate_translation(self, transcription: str, user_id: int,
+                                   transcription_id: Optional[int] = None) -> str:
+        """翻訳を生成して履歴を保存"""
+        # DifyServiceで翻訳（同じ文字起こしへの同時リクエストは1回にまとめる）
         voice_handler = self.bot.get_cog('VoiceHandler')
         if voice_handler:
-            dify_service = voice_handler.dify_service
-            translation = await dify_service.translate_text(transcription, "English")
+            translation = await self.action_flights.run(
+                SingleFlight.make_key(transcription, 'translate', 'English'),
+                lambda: voice_handler.dify_service.translate_text(transcription, "English")
+            )
         else:
             translation = "翻訳サービスが利用できません。"
         
         # データベースアクセス（オプション）
-        if hasattr(self.bot, 'database'):
+        if getattr(self.bot, 'database', None) and transcription_id:
             db = self.bot.database
-            result_msg_id = str(message.id)
-            transcription_data = await db.get_transcription_by_message(result_msg_id)
             
-            if transcription_data:
-                # リアクション履歴を保存
-                await db.save_reaction_action(
-                    transcription_id=transcription_data['id'],
-                    user_id=str(user_id),
-                    reaction='🌐',
-                    action_type='translate',
-                    result='success'
-                )
+            # リアクション履歴を保存（リクエストしたユーザーごと）
+            await db.save_reaction_action(
+                transcription_id=transcription_id,
+                user_id=str(user_id),
+                reaction='🌐',
+                action_type='translate',
+                result='success'
+            )
         
-        # 翻訳結果をDMで送信
+        return translation
+    
+    def create_summary_embed(self, transcription: str, summary: str, jump_url: str) -> discord.Embed:
+        """要約結果のEmbedを作成"""
+        embed = discord.Embed(
+            title="📝 要約結果",
+            description=summary,
+            color=discord.Color.blue(),
+            timestamp=discord.utils.utcnow()
+        )
+        embed.add_field(name="元のメッセージ", value=f"[こちら]({jump_url})", inline=False)
+        embed.set_footer(text=f"文字数: {len(transcription)} → {len(summary)}")
+        return embed
+    
+    def create_translation_embed(self, translation: str, jump_url: str) -> discord.Embed:
+        """翻訳結果のEmbedを作成"""
         embed = discord.Embed(
             title="🌐 翻訳結果（English）",
             description=translation,
             color=discord.Color.purple(),
             timestamp=discord.utils.utcnow()
         )
-        embed.add_field(name="元のメッセージ", value=f"[こちら]({message.jump_url})", inline=False)
+        embed.add_field(name="元のメッセージ", value=f"[こちら]({jump_url})", inline=False)
         embed.set_footer(text="※ 高度な翻訳機能は開発中です")
-        
+        return embed
+    
+    def create_action_view(self, transcription_id: int) -> discord.ui.View:
+        """ボタンモード用のビューを作成"""
+        return TranscriptionActionView(transcription_id, self.reaction_config)
+    
+    async def cog_load(self):
+        """Cogのロード時に実行（ボタンはcustom_idから復元して処理し、メッセージごとのビューは保持しない）"""
+        self.bot.add_dynamic_items(TranscriptionActionButton)
+    
+    async def cog_unload(self):
+        """Cogのアンロード時に実行"""
+        self.bot.remove_dynamic_items(TranscriptionActionButton)
+    
+    async def handle_action_button(self, interaction: discord.Interaction, action: str, transcription_id: int):
+        """ボタン押下時の処理"""
         try:
-            await user.send(embed=embed)
-            await message.add_reaction('✅')
-        except discord.Forbidden:
-            await message.reply(f"{user.mention} 翻訳結果をDMで送信しようとしましたが、DMを受け取る設定になっていません。", delete_after=10)
+            # 結果はエフェメラルで返す（DMチャンネルの作成やリアクションは不要）
+            await interaction.response.defer(ephemeral=True, thinking=True)
+            
+            # 文字起こしはボタンのcustom_idに埋め込まれたIDで引く（押されたメッセージの取得は不要）
+            message_id = interaction.message.id if interaction.message else None
+            result = await self.lookup_transcription(transcription_id, message_id)
+            if not result:
+                await interaction.followup.send("❌ 文字起こし結果が見つかりませんでした。", ephemeral=True)
+                return
+            
+            transcription = result['transcription']
+            jump_url = interaction.message.jump_url
+            
+            if action == "summarize":
+                summary = await self.generate_summary(transcription, interaction.user.id, transcription_id)
+                embed = self.create_summary_embed(transcription, summary, jump_url)
+            elif action == "translate":
+                translation = await self.generate_translation(transcription, interaction.user.id, transcription_id)
+                embed = self.create_translation_embed(translation, jump_url)
+            else:
+                await interaction.followup.send("🚧 この機能は現在開発中です。", ephemeral=True)
+                return
+            
+            await interaction.followup.send(embed=embed, ephemeral=True)
+            
+        except Exception as e:
+            self.logger.error(f"Error processing button interaction: {str(e)}")
+
+class TranscriptionActionButton(discord.ui.DynamicItem[discord.ui.Button],
+                                template=rf'{BUTTON_PREFIX}:(?P<action>\w+):(?P<id>\d+)'):
+    """文字起こし結果のボタン（custom_idから復元するため、Bot再起動後も処理できる）"""
+    
+    def __init__(self, action: str, transcription_id: int, emoji: Optional[str] = None):
+        super().__init__(discord.ui.Button(
+            label=BUTTON_LABELS.get(action, action),
+            emoji=emoji,
+            style=discord.ButtonStyle.secondary,
+            custom_id=f"{BUTTON_PREFIX}:{action}:{transcription_id}"
+        ))
+        self.action = action
+        self.transcription_id = transcription_id
+    
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match['action'], int(match['id']))
+    
+    async def callback(self, interaction: discord.Interaction):
+        reaction_handler = interaction.client.get_cog('ReactionHandler')
+        if reaction_handler:
+            await reaction_handler.handle_action_button(interaction, self.action, self.transcription_id)
+
+class TranscriptionActionView(discord.ui.View):
+    """文字起こし結果に付けるボタン
+    
+    すべてDynamicItemのため、送信後もメッセージごとのビューはビューストアに残らない。
+    """
+    
+    def __init__(self, transcription_id: int, reaction_config: Mapping[str, Any]):
+        super().__init__(timeout=None)
+        for emoji, info in reaction_config.items():
+            if not info.get('enabled', False) or info['name'] not in BUTTON_LABELS:
+                continue
+            self.add_item(TranscriptionActionButton(info['name'], transcription_id, emoji))
 
 async def setup(bot: commands.Bot):
     """Cogをセットアップ"""
@@ -2,7 +2,6 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from utils.logger import setup_logger, log_command_usage
-from utils.permissions import PermissionManager
 
 class SlashCommands(commands.Cog):
     """スラッシュコマンドの実装"""
@@ -10,7 +9,7 @@ class SlashCommands(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
         self.logger = setup_logger('SlashCommands')
-        self.permission_manager = PermissionManager()
+        self.permission_manager = bot.permission_manager
     
     @app_commands.command(name="voice_help", description="Voice Botのヘルプを表示")
     async def voice_help(self, interaction: discord.Interaction):
@@ -58,7 +57,8 @@ class SlashCommands(commands.Cog):
                 "`/voice_stats` - 利用統計を表示\n"
                 "`/voice_test` - Bot動作確認\n"
                 "`/voice_history` - 文字起こし履歴（開発中）\n"
-                "`/voice_server_stats` - サーバー統計（管理者用）"
+                "`/voice_server_stats` - サーバー統計（管理者用）\n"
+                "`/voice_rebuild_stats` - 統計の再構築（管理者用）"
             ),
             inline=False
         )
@@ -71,8 +71,9 @@ class SlashCommands(commands.Cog):
         log_command_usage(self.logger, interaction, "voice_test")
         
         # API設定確認
-        dify_configured = bool(self.bot.get_cog('VoiceHandler').dify_service.api_url and 
-                             self.bot.get_cog('VoiceHandler').dify_service.api_key)
+        voice_handler = self.bot.get_cog('VoiceHandler')
+        dify_configured = bool(voice_handler.dify_service.api_url and 
+                             voice_handler.dify_service.api_key)
         
         # ユーザー権限確認
         is_premium = False
@@ -104,6 +105,44 @@ class SlashCommands(commands.Cog):
             inline=True
         )
         
+        # 文字起こしキューの状態
+        if voice_handler:
+            queue_metrics = voice_handler.job_queue.metrics()
+            embed.add_field(
+                name="処理キュー",
+                value=(
+                    f"待機中: {queue_metrics['depth']}/{queue_metrics['max_depth']}\n"
+                    f"平均待ち時間: {queue_metrics['avg_wait']:.1f}秒\n"
+                    f"p95待ち時間: {queue_metrics['p95_wait']:.1f}秒"
+                ),
+                inline=True
+            )
+            
+            # 上流APIの同時実行数（自動調整）
+            limiter_metrics = voice_handler.dify_service.limiter.metrics()
+            embed.add_field(
+                name="同時実行数",
+                value=(
+                    f"上限: {limiter_metrics['limit']}\n"
+                    f"実行中: {limiter_metrics['in_flight']} / 待機中: {limiter_metrics['waiting']}\n"
+                    f"拒否: {limiter_metrics['rejected']}件"
+                ),
+                inline=True
+            )
+            
+            # 音声前処理の削減量
+            if voice_handler.preprocessor.enabled:
+                preprocess_metrics = voice_handler.preprocessor.metrics()
+                embed.add_field(
+                    name="音声前処理",
+                    value=(
+                        f"処理数: {preprocess_metrics['processed']}件\n"
+                        f"削減時間: {preprocess_metrics['saved_seconds'] / 60:.1f}分\n"
+                        f"削減容量: {preprocess_metrics['saved_bytes'] / 1024 / 1024:.1f} MB"
+                    ),
+                    inline=True
+                )
+        
         if interaction.guild:
             embed.add_field(
                 name="あなたの権限",
@@ -215,6 +254,7 @@ class SlashCommands(commands.Cog):
                 f"総文字起こし数: {guild_stats['total_transcriptions']}回\n"
                 f"ユニークユーザー: {guild_stats['unique_users']}人\n"
                 f"処理データ量: {guild_stats['total_size_mb']:.1f} MB\n"
+                f"音声時間: {guild_stats['total_duration_minutes']:.1f} 分\n"
                 f"平均文字数: {guild_stats['avg_transcription_length']}文字"
             ),
             inline=False
@@ -247,6 +287,29 @@ class SlashCommands(commands.Cog):
             )
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
+    
+    @app_commands.command(name="voice_rebuild_stats", description="このサーバーの統計の集計データを履歴から再構築（管理者用）")
+    @app_commands.guild_only()
+    async def voice_rebuild_stats(self, interaction: discord.Interaction):
+        """日別集計の再構築コマンド（管理者のみ。対象は実行したサーバーの集計だけ）"""
+        log_command_usage(self.logger, interaction, "voice_rebuild_stats")
+        
+        # 管理者権限チェック
+        if not self.permission_manager.is_admin(interaction.user):
+            await interaction.response.send_message(
+                "❌ このコマンドは管理者のみ使用できます。",
+                ephemeral=True
+            )
+            return
+        
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        
+        # 管理者の権限はこのサーバーに限られるため、他のサーバーの集計は作り直さない
+        rows = await self.bot.database.rebuild_daily_stats(str(interaction.guild_id))
+        await interaction.followup.send(
+            f"✅ このサーバーの日別統計を再構築しました（{rows}件）",
+            ephemeral=True
+        )
 
 async def setup(bot: commands.Bot):
     """Cogをセットアップ"""
@@ -2,32 +2,70 @@ import discord
 from discord.ext import commands
 import tempfile
 import os
-from typing import Optional
-import aiosqlite
+import time
+from contextlib import aclosing
+from typing import BinaryIO, Optional
 from services.dify_service import DifyService
 from utils.logger import setup_logger, log_voice_processing, log_error
-from utils.permissions import PermissionManager
+from utils.job_queue import JobQueue
+from utils.transcription_cache import TranscriptionCache
+from utils.downloader import AttachmentDownloader
+from utils.audio_preprocessor import AudioPreprocessor
+from utils.quota import QuotaManager
 
 class VoiceHandler(commands.Cog):
     """音声メッセージの処理を担当"""
     
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.dify_service = DifyService()
+        self.dify_service = DifyService(bot.settings.get('dify'))
         self.logger = setup_logger('VoiceHandler')
-        self.permission_manager = PermissionManager()
+        self.permission_manager = bot.permission_manager
         
         # サポートする音声フォーマット
         self.supported_formats = ('.ogg', '.mp3', '.wav', '.m4a', '.webm')
+        
+        # 追加処理の操作方法（'reaction' または 'button'）
+        self.action_mode = bot.settings.get('reactions', {}).get('mode', 'reaction')
+        
+        # 添付ファイルのダウンロード（サイズ上限付き）
+        self.downloader = AttachmentDownloader(bot.settings.get('audio'))
+        self.max_duration = bot.settings.get('audio', {}).get('max_duration_minutes', 30) * 60
+        
+        # 無音の除去・モノラル16kHz化（オプション）
+        self.preprocessor = AudioPreprocessor(bot.settings.get('preprocess'))
+        
+        # 文字起こしキャッシュ（メモリ + データベース）
+        self.transcription_cache = TranscriptionCache(
+            bot.settings.get('cache'),
+            database=getattr(bot, 'database', None)
+        )
+        
+        # 日次利用制限（メモリ上で判定し、データベースへはまとめて反映）
+        self.quota = QuotaManager(bot.database, bot.settings.get('quota'))
+        
+        # 文字起こしジョブキュー
+        queue_settings = bot.settings.get('queue', {})
+        self.job_queue = JobQueue(
+            handler=self.process_voice_message,
+            workers=queue_settings.get('workers', 4),
+            max_depth=queue_settings.get('max_depth', 50),
+            name='TranscriptionQueue'
+        )
     
     async def cog_load(self):
         """Cogのロード時に実行"""
         await self.dify_service.initialize()
+        await self.downloader.initialize()
+        self.job_queue.start()
         self.logger.info("VoiceHandler cog loaded")
     
     async def cog_unload(self):
         """Cogのアンロード時に実行"""
+        await self.job_queue.stop()
         await self.dify_service.close()
+        await self.downloader.close()
+        self.preprocessor.close()
         self.logger.info("VoiceHandler cog unloaded")
     
     @commands.Cog.listener()
@@ -41,10 +79,17 @@ class VoiceHandler(commands.Cog):
         if self.permission_manager.is_blocked(message.author.id):
             return
         
-        # 音声ファイルの処理
+        # 音声ファイルをキューに登録
+        guild_key = str(message.guild.id) if message.guild else 'DM'
         for attachment in message.attachments:
             if attachment.filename.lower().endswith(self.supported_formats):
-                await self.process_voice_message(message, attachment)
+                # ダウンロード前にサイズ上限をチェック
+                if self.downloader.is_too_large(attachment.size):
+                    await message.reply(f'❌ ファイルサイズが上限（{self.downloader.max_file_size // (1024 * 1024)}MB）を超えています。')
+                    continue
+                if not self.job_queue.submit(guild_key, message, attachment):
+                    await message.reply('⏳ 現在混雑しています。しばらくしてから再度お試しください。')
+                    break
     
     async def process_voice_message(self, message: discord.Message, attachment: discord.Attachment):
         """音声メッセージを処理"""
@@ -53,9 +98,37 @@ class VoiceHandler(commands.Cog):
         # 処理中メッセージ
         processing_msg = await message.reply('🎙️ 音声を処理中...')
         
+        db = self.bot.database
+        usage_reserved = False
+        audio = None
+        processed = None
+        
         try:
-            # 音声ファイルをダウンロード
-            file_data = await attachment.read()
+            # 利用制限チェック（日次リセット・加算をメモリ上で行う）
+            member = message.guild.get_member(message.author.id) if message.guild else None
+            daily_limit = self.permission_manager.get_daily_limit(member)
+            
+            if await self.quota.try_acquire(str(message.author.id), daily_limit) is None:
+                await processing_msg.edit(content='❌ 本日の利用制限に達しました。')
+                return
+            usage_reserved = True
+            
+            # 先頭・末尾だけを取得して長さをチェック（全体のダウンロード前）
+            remote_info = await self.downloader.probe_remote(attachment.url, attachment.size)
+            if remote_info and remote_info.duration is not None and remote_info.duration > self.max_duration:
+                await processing_msg.edit(content=f'❌ 音声の長さが上限（{self.max_duration // 60}分）を超えています。')
+                return
+            
+            # 音声ファイルを一時ファイルへチャンク単位でダウンロード
+            audio = await self.downloader.download(attachment.url, attachment.filename, attachment.content_type)
+            if audio is None:
+                await processing_msg.edit(content='❌ 音声ファイルのダウンロードに失敗しました。')
+                return
+            
+            # ヘッダーから取得した長さで上限をチェック（API呼び出し前）
+            if audio.duration is not None and audio.duration > self.max_duration:
+                await processing_msg.edit(content=f'❌ 音声の長さが上限（{self.max_duration // 60}分）を超えています。')
+                return
             
             # ユーザー情報
             user_info = {
@@ -65,65 +138,84 @@ class VoiceHandler(commands.Cog):
                 'server': message.guild.name if message.guild else 'DM'
             }
             
-            # データベースからユーザー情報を取得/作成
-            db = self.bot.database
-            user_db = await db.get_or_create_user(str(message.author.id))
-            
-            # 利用制限チェック
-            member = message.guild.get_member(message.author.id) if message.guild else None
-            daily_limit = self.permission_manager.get_daily_limit(member)
-            
-            if daily_limit > 0 and user_db['daily_usage'] >= daily_limit:
-                await processing_msg.edit(content='❌ 本日の利用制限に達しました。')
-                return
-            
-            # 文字起こし
-            transcription = await self.dify_service.transcribe_audio(
-                file_data=file_data,
-                filename=attachment.filename,
-                content_type=attachment.content_type or 'audio/ogg',
-                user_info=user_info
-            )
+            # 文字起こし（同じ音声はキャッシュから返す）
+            # 時間圧縮の倍率はギルドごとに異なるためキーに含める
+            speed = self.preprocessor.speed_for(message.guild.id if message.guild else None, audio.duration)
+            cache_key = self.transcription_cache.key_from_digest(audio.digest, 'ja', 'dify', speed)
+            transcription = await self.transcription_cache.get(cache_key)
+            if transcription is None:
+                # 無音の除去・時間圧縮・圧縮（無効または効果がない場合は元の音声を送信）
+                processed = await self.preprocessor.process(audio, speed)
+                upload = processed or audio
+                
+                # アップロードは一時ファイルからチャンク単位で読み出して送信
+                with upload.open() as audio_stream:
+                    if self.dify_service.response_mode == 'streaming':
+                        transcription = await self.transcribe_streaming(
+                            file_data=audio_stream,
+                            filename=upload.filename,
+                            content_type=upload.content_type or 'audio/ogg',
+                            user_info=user_info,
+                            processing_msg=processing_msg
+                        )
+                    else:
+                        transcription = await self.dify_service.transcribe_audio(
+                            file_data=audio_stream,
+                            filename=upload.filename,
+                            content_type=upload.content_type or 'audio/ogg',
+                            user_info=user_info
+                        )
+                await self.transcription_cache.set(cache_key, transcription)
             
             # 処理中メッセージを削除
             await processing_msg.delete()
             
             if transcription:
-                # 使用回数を増やす
-                await db.increment_usage(str(message.author.id))
+                usage_reserved = False
                 
-                # データベースに保存
+                # データベースに保存（結果メッセージIDは送信後に設定する。
+                # 元のメッセージIDは同じメッセージの複数の添付で重複するため使わない）
                 transcription_id = await db.save_transcription(
-                    message_id=str(message.id),
+                    message_id=None,
                     user_id=str(message.author.id),
                     guild_id=str(message.guild.id) if message.guild else None,
                     channel_id=str(message.channel.id),
                     file_name=attachment.filename,
                     file_size=attachment.size,
                     transcription=transcription,
-                    language="ja"
+                    language="ja",
+                    duration=audio.duration
                 )
                 # 結果を表示
+                reaction_handler = self.bot.get_cog('ReactionHandler')
+                use_buttons = self.action_mode == 'button' and reaction_handler is not None
                 embed = self.create_transcription_embed(
                     transcription=transcription,
                     author=message.author,
-                    channel=message.channel
+                    channel=message.channel,
+                    use_buttons=use_buttons
                 )
                 
-                # メッセージを送信し、リアクションを追加
-                result_msg = await message.reply(embed=embed)
+                # メッセージを送信（ボタンモードではボタン付きで送信）
+                if use_buttons:
+                    result_msg = await message.reply(
+                        embed=embed,
+                        view=reaction_handler.create_action_view(transcription_id)
+                    )
+                else:
+                    result_msg = await message.reply(embed=embed)
                 
                 # データベースに結果メッセージIDを更新
-                async with aiosqlite.connect(self.bot.database.db_path) as update_db:
-                    await update_db.execute(
-                        "UPDATE transcriptions SET message_id = ? WHERE id = ?",
-                        (str(result_msg.id), transcription_id)
-                    )
-                    await update_db.commit()
+                await db.update_transcription_message_id(transcription_id, str(result_msg.id))
                 
-                # リアクションを追加（将来の機能拡張用）
-                await result_msg.add_reaction('📝')  # 要約
-                await result_msg.add_reaction('🌐')  # 翻訳
+                # リアクション・ボタン処理用に結果メッセージを登録
+                if reaction_handler:
+                    reaction_handler.register_result(result_msg.id, transcription, transcription_id)
+                
+                # リアクションを追加（ボタンモードでは不要）
+                if not use_buttons:
+                    await result_msg.add_reaction('📝')  # 要約
+                    await result_msg.add_reaction('🌐')  # 翻訳
                 
                 self.logger.info(f"Transcription completed for {attachment.filename}")
             else:
@@ -133,9 +225,45 @@ class VoiceHandler(commands.Cog):
         except Exception as e:
             log_error(self.logger, e, f"during voice processing of {attachment.filename}")
             await processing_msg.edit(content=f'❌ エラーが発生しました: {str(e)}')
+        finally:
+            # 文字起こしに失敗した場合は確保した利用回数を戻す
+            if usage_reserved:
+                self.quota.release(str(message.author.id))
+            if audio:
+                audio.cleanup()
+            if processed:
+                processed.cleanup()
+    
+    async def transcribe_streaming(self, file_data: BinaryIO, filename: str, content_type: str,
+                                  user_info: dict, processing_msg: discord.Message) -> Optional[str]:
+        """ストリーミングモードで文字起こしし、途中経過で処理中メッセージを更新"""
+        edit_interval = self.bot.settings.get('dify', {}).get('stream_edit_interval', 1.5)
+        last_edit = 0.0
+        
+        stream = self.dify_service.transcribe_audio_stream(
+            file_data=file_data,
+            filename=filename,
+            content_type=content_type,
+            user_info=user_info
+        )
+        async with aclosing(stream):
+            async for text, is_final in stream:
+                if is_final:
+                    return text
+                
+                # Discordのレート制限を避けるため一定間隔でのみ編集
+                now = time.monotonic()
+                if text and now - last_edit >= edit_interval:
+                    last_edit = now
+                    try:
+                        await processing_msg.edit(content=f'🎙️ 文字起こし中...\n{text[-1900:]}')
+                    except discord.HTTPException as e:
+                        self.logger.warning(f"Failed to update progress message: {str(e)}")
+        
+        return None
     
     def create_transcription_embed(self, transcription: str, author: discord.User, 
-                                 channel: discord.abc.Messageable) -> discord.Embed:
+                                 channel: discord.abc.Messageable, use_buttons: bool = False) -> discord.Embed:
         """文字起こし結果のEmbedを作成"""
         embed = discord.Embed(
             title="📝 文字起こし結果",
@@ -145,7 +273,10 @@ class VoiceHandler(commands.Cog):
         )
         embed.add_field(name="送信者", value=author.mention, inline=True)
         embed.add_field(name="チャンネル", value=channel.mention if hasattr(channel, 'mention') else 'DM', inline=True)
-        embed.set_footer(text="リアクションを追加して追加の処理を実行できます")
+        if use_buttons:
+            embed.set_footer(text="ボタンを押して追加の処理を実行できます")
+        else:
+            embed.set_footer(text="リアクションを追加して追加の処理を実行できます")
         
         return embed
 
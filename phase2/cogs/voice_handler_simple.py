@@ -5,7 +5,6 @@ import os
 from typing import Optional
 from services.dify_service import DifyService
 from utils.logger import setup_logger, log_voice_processing, log_error
-from utils.permissions import PermissionManager
 
 class VoiceHandlerSimple(commands.Cog):
     """音声メッセージの処理を担当（データベースなし版）"""
@@ -14,7 +13,7 @@ class VoiceHandlerSimple(commands.Cog):
         self.bot = bot
         self.dify_service = DifyService()
         self.logger = setup_logger('VoiceHandler')
-        self.permission_manager = PermissionManager()
+        self.permission_manager = bot.permission_manager
         
         # サポートする音声フォーマット
         self.supported_formats = ('.ogg', '.mp3', '.wav', '.m4a', '.webm')
@@ -3,9 +3,11 @@ from discord.ext import commands
 import os
 import asyncio
 from dotenv import load_dotenv
+from typing import Any, Mapping
 from utils.logger import setup_logger
+from utils.config_service import ConfigService, ConfigError, require
+from utils.permissions import PermissionManager
 from utils.database import Database
-import json
 
 # 環境変数の読み込み
 load_dotenv()
@@ -13,13 +15,22 @@ load_dotenv()
 # ロガーのセットアップ
 logger = setup_logger('VoiceBot')
 
+def validate_settings(settings: Mapping[str, Any]):
+    """settings.jsonの検証"""
+    require(settings, 'bot', Mapping)
+    require(settings['bot'], 'name', str, 'bot.')
+    require(settings['bot'], 'version', str, 'bot.')
+    for key, value in settings.items():
+        if not isinstance(value, Mapping):
+            raise ConfigError(f"{key} must be an object")
+
 class VoiceBot(commands.Bot):
     """カスタムBotクラス"""
     
     def __init__(self):
-        # 設定の読み込み
-        with open('config/settings.json', 'r') as f:
-            self.settings = json.load(f)
+        # 設定ファイルの監視（変更は再起動なしで反映）
+        self.config = ConfigService()
+        self.config.register('settings', 'config/settings.json', validate=validate_settings)
         
         # Intentsの設定
         intents = discord.Intents.default()
@@ -35,11 +46,23 @@ class VoiceBot(commands.Bot):
         # 従来のヘルプコマンドを削除
         self.remove_command('help')
         
+        # 権限管理（全Cogで共有し、メンバー・ロールの更新で判定結果を破棄）
+        self.permission_manager = PermissionManager(self.config, settings=self.settings.get('permissions'))
+        self.permission_manager.register_listeners(self)
+        
         # データベースの初期化
-        self.database = Database()
+        self.database = Database(settings=self.settings.get('database'))
+    
+    @property
+    def settings(self) -> Mapping[str, Any]:
+        """現在の設定（settings.jsonの変更を反映した変更不可のスナップショット）"""
+        return self.config.get('settings')
     
     async def setup_hook(self):
         """Bot起動時のセットアップ"""
+        # 設定ファイルの監視を開始
+        await self.config.start()
+        
         # データベースの初期化
         await self.database.initialize()
         
@@ -64,6 +87,12 @@ class VoiceBot(commands.Bot):
         except Exception as e:
             logger.error(f"Failed to sync slash commands: {str(e)}")
     
+    async def close(self):
+        """Bot終了時のクリーンアップ"""
+        await super().close()
+        await self.config.stop()
+        await self.database.close()
+    
     async def on_ready(self):
         """Bot準備完了時"""
         logger.info(f'{self.user} has connected to Discord!')
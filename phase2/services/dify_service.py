@@ -1,30 +1,69 @@
 import aiohttp
+import json
 import os
-from typing import Dict, Any, Optional
+from contextlib import aclosing
+from typing import Dict, Any, Optional, AsyncIterator, Tuple, Union, BinaryIO
 import tempfile
 from utils.logger import setup_logger
+from utils.adaptive_limiter import AdaptiveLimiter, LimiterRejected, payload_megabytes, report_failure
+from utils.resilience import Resilience, ReplayableBody, CircuitOpenError, UpstreamError, raise_for_status
 
 class DifyService:
     """Dify APIとの連携を管理"""
     
-    def __init__(self):
-        self.api_url = os.getenv('DIFY_API_URL')
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
         self.api_key = os.getenv('DIFY_API_KEY')
         self.logger = setup_logger('DifyService')
         self.session = None
+        
+        # ベースURL（ローカルのモックサーバーに差し替え可能）
+        base_url = os.getenv('DIFY_BASE_URL')
+        self.api_url = os.getenv('DIFY_API_URL') or (f"{base_url.rstrip('/')}/workflows/run" if base_url else None)
+        if not base_url and self.api_url and self.api_url.rstrip('/').endswith('/workflows/run'):
+            base_url = self.api_url.rstrip('/')[:-len('/workflows/run')]
+        self.base_url = (base_url or 'https://api.dify.ai/v1').rstrip('/')
+        
+        # ワークフローの応答モード（blocking / streaming）
+        self.response_mode = settings.get('response_mode', 'blocking')
+        
+        # 接続プールとタイムアウトの設定
+        self.pool_size = settings.get('pool_size', 20)
+        self.pool_size_per_host = settings.get('pool_size_per_host', 10)
+        self.dns_cache_ttl = settings.get('dns_cache_ttl', 300)
+        self.keepalive_timeout = settings.get('keepalive_timeout', 60)
+        self.timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=settings.get('connect_timeout', 10),
+            sock_read=settings.get('read_timeout', 120)
+        )
+        
+        # エンドポイントごとのサーキットブレーカーと再試行
+        self.resilience = Resilience('dify', settings.get('resilience'))
+        
+        # 文字起こしの同時実行数は応答に応じて自動調整
+        self.limiter = AdaptiveLimiter('dify', settings.get('concurrency'))
     
     async def initialize(self):
-        """非同期セッションの初期化"""
-        if not self.session:
-            self.session = aiohttp.ClientSession()
+        """非同期セッションの初期化（キープアライブ付きの共有コネクションプール）"""
+        if not self.session or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                limit_per_host=self.pool_size_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
     
     async def close(self):
         """セッションのクローズ"""
         if self.session:
             await self.session.close()
+            self.session = None
     
-    async def upload_file(self, file_data: bytes, filename: str, content_type: str, user_id: str) -> Optional[str]:
-        """ファイルをDifyにアップロード"""
+    async def upload_file(self, file_data: Union[bytes, BinaryIO], filename: str, content_type: str,
+                          user_id: str) -> Optional[str]:
+        """ファイルをDifyにアップロード（ファイルオブジェクトはチャンク単位で送信される）"""
         if not self.api_url or not self.api_key:
             self.logger.error("Dify API credentials not configured")
             return None
@@ -33,25 +72,34 @@ class DifyService:
             'Authorization': f'Bearer {self.api_key}'
         }
         
-        data = aiohttp.FormData()
-        data.add_field('file', file_data, filename=filename, content_type=content_type)
-        data.add_field('user', user_id)
+        # 再試行時はファイルの先頭から送り直す
+        body = ReplayableBody(file_data)
         
-        try:
-            async with self.session.post(
-                'https://api.dify.ai/v1/files/upload',
-                headers=headers,
-                data=data
-            ) as response:
-                if response.status == 201:
+        async def attempt() -> Optional[str]:
+            with body.open() as payload:
+                data = aiohttp.FormData()
+                data.add_field('file', payload, filename=filename, content_type=content_type)
+                data.add_field('user', user_id)
+                
+                async with self.session.post(
+                    f'{self.base_url}/files/upload',
+                    headers=headers,
+                    data=data
+                ) as response:
+                    await raise_for_status(response, 201)
                     result = await response.json()
-                    file_id = result.get('id')
-                    self.logger.info(f"File uploaded successfully: {file_id}")
-                    return file_id
-                else:
-                    error_text = await response.text()
-                    self.logger.error(f"File upload failed: {response.status} - {error_text}")
-                    return None
+                    return result.get('id')
+        
+        try:
+            file_id = await self.resilience.call('upload', attempt)
+            self.logger.info(f"File uploaded successfully: {file_id}")
+            return file_id
+        except CircuitOpenError as e:
+            self.logger.warning(f"File upload skipped: {str(e)}")
+            return None
+        except UpstreamError as e:
+            self.logger.error(f"File upload failed: {str(e)}")
+            return None
         except Exception as e:
             self.logger.error(f"Error uploading file: {str(e)}")
             return None
@@ -78,27 +126,127 @@ class DifyService:
             'user': user_id
         }
         
-        try:
+        async def attempt() -> Dict[str, Any]:
             async with self.session.post(
                 self.api_url,
                 headers=headers,
                 json=workflow_data
             ) as response:
-                if response.status == 200:
-                    result = await response.json()
-                    self.logger.info("Workflow executed successfully")
-                    return result
-                else:
-                    error_text = await response.text()
-                    self.logger.error(f"Workflow execution failed: {response.status} - {error_text}")
-                    return None
+                await raise_for_status(response)
+                return await response.json()
+        
+        try:
+            result = await self.resilience.call('workflow', attempt)
+            self.logger.info("Workflow executed successfully")
+            return result
+        except CircuitOpenError as e:
+            self.logger.warning(f"Workflow execution skipped: {str(e)}")
+            return None
+        except UpstreamError as e:
+            self.logger.error(f"Workflow execution failed: {str(e)}")
+            return None
         except Exception as e:
             self.logger.error(f"Error executing workflow: {str(e)}")
             return None
     
-    async def transcribe_audio(self, file_data: bytes, filename: str, content_type: str, 
+    async def run_workflow_stream(self, file_id: str, inputs: Dict[str, Any],
+                                  user_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Difyワークフローをストリーミングモードで実行し、SSEイベントを順に返す"""
+        if not self.api_url or not self.api_key:
+            self.logger.error("Dify API credentials not configured")
+            return
+        
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
+        }
+        
+        workflow_data = {
+            'inputs': inputs,
+            'files': [{
+                'transfer_method': 'local_file',
+                'upload_file_id': file_id,
+                'type': 'audio'
+            }],
+            'response_mode': 'streaming',
+            'user': user_id
+        }
+        
+        async def attempt() -> aiohttp.ClientResponse:
+            response = await self.session.post(
+                self.api_url,
+                headers=headers,
+                json=workflow_data
+            )
+            try:
+                await raise_for_status(response)
+            except BaseException:
+                response.release()
+                raise
+            return response
+        
+        try:
+            # 再試行するのはイベントを受け取り始める前（接続・ステータス）まで
+            response = await self.resilience.call('workflow', attempt)
+        except CircuitOpenError as e:
+            self.logger.warning(f"Workflow streaming skipped: {str(e)}")
+            return
+        except UpstreamError as e:
+            self.logger.error(f"Workflow streaming failed: {str(e)}")
+            return
+        except Exception as e:
+            self.logger.error(f"Error streaming workflow: {str(e)}")
+            return
+        
+        try:
+            async with response:
+                # SSEは「data: {...}」行の連続（空行区切り）
+                async for raw_line in response.content:
+                    line = raw_line.decode('utf-8').strip()
+                    if not line.startswith('data:'):
+                        continue
+                    try:
+                        event = json.loads(line[len('data:'):].strip())
+                    except json.JSONDecodeError:
+                        self.logger.warning(f"Invalid SSE payload: {line[:100]}")
+                        continue
+                    yield event
+                    if event.get('event') in ('workflow_finished', 'error'):
+                        break
+        except Exception as e:
+            self.logger.error(f"Error streaming workflow: {str(e)}")
+    
+    def _workflow_inputs(self, user_info: Dict[str, str]) -> Dict[str, str]:
+        """ワークフローの入力値を作成"""
+        return {
+            'username': user_info.get('username', 'Unknown'),
+            'channel': user_info.get('channel', 'Unknown'),
+            'server': user_info.get('server', 'DM')
+        }
+    
+    @staticmethod
+    def _extract_transcription(outputs: Dict[str, Any]) -> str:
+        """ワークフローの出力から文字起こしを取り出す"""
+        return outputs.get('transcription', '') or outputs.get('text', '')
+    
+    async def transcribe_audio(self, file_data: Union[bytes, BinaryIO], filename: str, content_type: str, 
                              user_info: Dict[str, str]) -> Optional[str]:
-        """音声ファイルを文字起こし"""
+        """音声ファイルを文字起こし（同時実行数はリミッターで調整）"""
+        try:
+            async with self.limiter.slot(payload_megabytes(file_data)):
+                transcription = await self._transcribe_audio(file_data, filename, content_type, user_info)
+                if transcription is None:
+                    # 失敗はNoneで返るため、成功のレイテンシとして記録されないよう通知する
+                    report_failure()
+                return transcription
+        except LimiterRejected as e:
+            self.logger.warning(f"Transcription skipped: {str(e)}")
+            return None
+    
+    async def _transcribe_audio(self, file_data: Union[bytes, BinaryIO], filename: str, content_type: str,
+                                user_info: Dict[str, str]) -> Optional[str]:
+        """アップロードとワークフロー実行"""
         await self.initialize()
         
         # ファイルアップロード
@@ -115,21 +263,78 @@ class DifyService:
         # ワークフロー実行
         result = await self.run_workflow(
             file_id=file_id,
-            inputs={
-                'username': user_info.get('username', 'Unknown'),
-                'channel': user_info.get('channel', 'Unknown'),
-                'server': user_info.get('server', 'DM')
-            },
+            inputs=self._workflow_inputs(user_info),
             user_id=user_info.get('user_id', 'unknown')
         )
         
         if result:
             outputs = result.get('data', {}).get('outputs', {})
-            transcription = outputs.get('transcription', '') or outputs.get('text', '')
-            return transcription
+            return self._extract_transcription(outputs)
         
         return None
     
+    async def transcribe_audio_stream(self, file_data: Union[bytes, BinaryIO], filename: str, content_type: str,
+                                      user_info: Dict[str, str]) -> AsyncIterator[Tuple[str, bool]]:
+        """音声ファイルを文字起こしし、途中経過のテキストを順に返す
+        
+        text_chunkイベントごとに(累積テキスト, False)を返し、
+        最後にworkflow_finishedの最終出力を(テキスト, True)として返す。
+        """
+        try:
+            async with self.limiter.slot(payload_megabytes(file_data)):
+                results = self._transcribe_audio_stream(file_data, filename, content_type, user_info)
+                finished = False
+                async with aclosing(results):
+                    async for result in results:
+                        finished = result[1]
+                        yield result
+                if not finished:
+                    # 最終結果が得られなかった場合は成功のレイテンシとして記録しない
+                    report_failure()
+        except LimiterRejected as e:
+            self.logger.warning(f"Transcription skipped: {str(e)}")
+    
+    async def _transcribe_audio_stream(self, file_data: Union[bytes, BinaryIO], filename: str, content_type: str,
+                                       user_info: Dict[str, str]) -> AsyncIterator[Tuple[str, bool]]:
+        """アップロードとストリーミングでのワークフロー実行"""
+        await self.initialize()
+        
+        file_id = await self.upload_file(
+            file_data=file_data,
+            filename=filename,
+            content_type=content_type,
+            user_id=user_info.get('user_id', 'unknown')
+        )
+        
+        if not file_id:
+            return
+        
+        partial = ''
+        events = self.run_workflow_stream(
+            file_id=file_id,
+            inputs=self._workflow_inputs(user_info),
+            user_id=user_info.get('user_id', 'unknown')
+        )
+        async with aclosing(events):
+            async for event in events:
+                event_type = event.get('event')
+                data = event.get('data') or {}
+                
+                if event_type == 'text_chunk':
+                    partial += data.get('text', '')
+                    yield partial, False
+                elif event_type == 'workflow_finished':
+                    if data.get('status', 'succeeded') != 'succeeded':
+                        self.logger.error(f"Workflow finished with status {data.get('status')}: {data.get('error')}")
+                        return
+                    transcription = self._extract_transcription(data.get('outputs') or {}) or partial
+                    self.logger.info("Workflow streaming completed successfully")
+                    yield transcription, True
+                    return
+                elif event_type == 'error':
+                    self.logger.error(f"Workflow streaming error: {event.get('message')}")
+                    return
+    
     async def transcribe_and_summarize(self, file_data: bytes, filename: str, content_type: str,
                                      user_info: Dict[str, str]) -> Dict[str, Optional[str]]:
         """音声ファイルを文字起こしして要約"""
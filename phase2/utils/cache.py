@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+_MISSING = object()
+
+class LRUCache:
+    """件数上限とTTL付きのインメモリLRUキャッシュ"""
+    
+    def __init__(self, max_size: int = 512, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+    
+    def get(self, key: Hashable, default: Any = None, count: bool = True) -> Any:
+        """値を取得（期限切れの場合は削除してdefaultを返す）"""
+        entry = self._data.get(key)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return default
+        
+        value, expires_at = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._data[key]
+            if count:
+                self.misses += 1
+            return default
+        
+        self._data.move_to_end(key)
+        if count:
+            self.hits += 1
+        return value
+    
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """値を保存（上限を超えた場合は最も古いものを削除）"""
+        ttl = ttl if ttl is not None else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+    
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """値を削除して返す"""
+        entry = self._data.pop(key, None)
+        return entry[0] if entry is not None else default
+    
+    def clear(self):
+        """すべての値を削除"""
+        self._data.clear()
\ No newline at end of file
@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import tempfile
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+from utils.logger import setup_logger
+
+# 設定の検証関数（不正な場合はConfigErrorを送出）
+Validator = Callable[[Mapping[str, Any]], None]
+# 設定変更時のコールバック（新しいスナップショットを受け取る）
+Listener = Callable[[Mapping[str, Any]], None]
+
+class ConfigError(ValueError):
+    """設定ファイルの内容が不正"""
+
+def freeze(value: Any) -> Any:
+    """JSONの値を変更不可のスナップショットに変換（dict → MappingProxyType、list → tuple）"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def thaw(value: Any) -> Any:
+    """スナップショットを変更可能なJSONの値に戻す"""
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+def require(data: Mapping[str, Any], key: str, expected: type, where: str = ''):
+    """必須キーの存在と型を検証"""
+    if key not in data:
+        raise ConfigError(f"{where}{key} is required")
+    if not isinstance(data[key], expected):
+        raise ConfigError(f"{where}{key} must be {expected.__name__}")
+
+class _ConfigFile:
+    """監視中の設定ファイル1つ分"""
+    
+    def __init__(self, path: str, validate: Optional[Validator]):
+        self.path = path
+        self.validate = validate
+        self.snapshot: Mapping[str, Any] = MappingProxyType({})
+        self.mtime_ns = 0
+        self.listeners: List[Listener] = []
+
+class ConfigService:
+    """JSON設定ファイルを監視し、変更を再起動なしで反映する
+    
+    ファイルの更新時刻を定期的に確認し、変更があればスレッドで読み込み・検証してから
+    変更不可のスナップショットを差し替える。検証に失敗した場合は以前の内容を使い続ける。
+    書き戻しはスレッドで一時ファイルに書いてから置き換えるため、途中の状態は読まれない。
+    """
+    
+    def __init__(self, poll_interval: float = 2.0):
+        self.poll_interval = poll_interval
+        self._files: Dict[str, _ConfigFile] = {}
+        self._write_lock = asyncio.Lock()
+        self._watch_task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.logger = setup_logger('ConfigService')
+    
+    def register(self, name: str, path: str, default: Optional[Dict[str, Any]] = None,
+                 validate: Optional[Validator] = None) -> Mapping[str, Any]:
+        """設定ファイルを登録して読み込む（起動時のみ同期で読み込む。登録済みなら現在の内容を返す）"""
+        if name in self._files:
+            return self._files[name].snapshot
+        
+        config = _ConfigFile(path, validate)
+        if not os.path.exists(path) and default is not None:
+            self._write_file(path, default)
+        
+        mtime_ns, data = self._read_file(path, validate)
+        config.mtime_ns = mtime_ns
+        config.snapshot = freeze(data)
+        self._files[name] = config
+        return config.snapshot
+    
+    def get(self, name: str) -> Mapping[str, Any]:
+        """現在のスナップショット"""
+        return self._files[name].snapshot
+    
+    def subscribe(self, name: str, listener: Listener):
+        """変更時に呼ばれるコールバックを登録"""
+        self._files[name].listeners.append(listener)
+    
+    async def start(self):
+        """ファイルの監視を開始"""
+        if not self._watch_task:
+            self._watch_task = asyncio.create_task(self._watch_loop())
+    
+    async def stop(self):
+        """ファイルの監視を停止"""
+        if self._watch_task:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+    
+    async def _watch_loop(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                self.logger.error(f"Error watching config files: {str(e)}")
+    
+    async def reload(self):
+        """更新されたファイルを読み込み直す（stat・読み込み・検証はスレッドで行う）"""
+        known = {name: (config.path, config.mtime_ns, config.validate) for name, config in self._files.items()}
+        changed = await asyncio.to_thread(self._read_changed, known)
+        for name, (mtime_ns, data) in changed.items():
+            if data is None:
+                # JSONの構文エラー・検証エラーは以前の内容を使い続ける
+                self._files[name].mtime_ns = mtime_ns
+                continue
+            self._swap(name, mtime_ns, data)
+            self.reloads += 1
+            self.logger.info(f"Reloaded config: {name}")
+    
+    def _read_changed(self, known: Dict[str, Tuple[str, int, Optional[Validator]]]
+                      ) -> Dict[str, Tuple[int, Optional[Dict[str, Any]]]]:
+        """更新時刻が変わったファイルを読み込む（スレッドで実行。不正な内容はNone）"""
+        changed = {}
+        for name, (path, mtime_ns, validate) in known.items():
+            current = mtime_ns
+            try:
+                current = os.stat(path).st_mtime_ns
+                if current == mtime_ns:
+                    continue
+                changed[name] = self._read_file(path, validate)
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError) as e:
+                self.logger.error(f"Ignoring invalid config {path}: {str(e)}")
+                changed[name] = (current, None)
+        return changed
+    
+    @staticmethod
+    def _read_file(path: str, validate: Optional[Validator]) -> Tuple[int, Dict[str, Any]]:
+        with open(path, 'r', encoding='utf-8') as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ConfigError(f"{path} must contain a JSON object")
+        if validate:
+            validate(data)
+        return mtime_ns, data
+    
+    @staticmethod
+    def _write_file(path: str, data: Dict[str, Any]) -> int:
+        """一時ファイルに書いてから置き換える（書き込み途中の内容は読まれない）"""
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.json')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return os.stat(path).st_mtime_ns
+    
+    def _swap(self, name: str, mtime_ns: int, data: Dict[str, Any]):
+        """スナップショットを差し替えてコールバックを呼ぶ"""
+        config = self._files[name]
+        config.mtime_ns = mtime_ns
+        config.snapshot = freeze(data)
+        for listener in config.listeners:
+            try:
+                listener(config.snapshot)
+            except Exception as e:
+                self.logger.error(f"Config listener for {name} failed: {str(e)}")
+    
+    async def update(self, name: str, mutate: Callable[[Dict[str, Any]], None]) -> Mapping[str, Any]:
+        """設定を変更してファイルに書き戻す（書き込みはスレッドで行う）"""
+        async with self._write_lock:
+            config = self._files[name]
+            data = thaw(config.snapshot)
+            mutate(data)
+            if config.validate:
+                config.validate(data)
+            
+            mtime_ns = await asyncio.to_thread(self._write_file, config.path, data)
+            self._swap(name, mtime_ns, data)
+            return config.snapshot
\ No newline at end of file
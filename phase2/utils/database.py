@@ -1,299 +1,683 @@
 import aiosqlite
+import asyncio
 import os
-from datetime import datetime, timedelta
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict, Any
 from utils.logger import setup_logger
+from utils.hyperloglog import HyperLogLog
+
+async def _rebuild_daily_stats(db: aiosqlite.Connection, guild_id: Optional[str] = None) -> int:
+    """文字起こし履歴から日別・ギルド別の集計を作り直す（コミットは呼び出し側）
+    
+    guild_idを指定した場合はそのギルドの行だけを作り直す。
+    """
+    if guild_id is not None:
+        scope, params = "guild_id = ?", (guild_id,)
+    else:
+        scope, params = "guild_id IS NOT NULL", ()
+    await db.execute(f"DELETE FROM daily_stats WHERE {scope}", params)
+    
+    # 日別・ギルド別のユニークユーザースケッチ
+    sketches: Dict[tuple, HyperLogLog] = {}
+    cursor = await db.execute(
+        f"""SELECT DISTINCT created_day, guild_id, user_id
+            FROM transcriptions
+            WHERE {scope}""",
+        params
+    )
+    async for row in cursor:
+        sketches.setdefault((row[0], row[1]), HyperLogLog()).add(row[2])
+    
+    cursor = await db.execute(
+        f"""SELECT created_day, guild_id,
+                   COUNT(*), COALESCE(SUM(duration), 0),
+                   COALESCE(SUM(file_size), 0), COALESCE(SUM(transcription_length), 0)
+            FROM transcriptions
+            WHERE {scope}
+            GROUP BY created_day, guild_id""",
+        params
+    )
+    rows = await cursor.fetchall()
+    
+    # unique_usersは使わない（期間のユニーク数はuser_sketchをマージして求める）
+    await db.executemany(
+        """INSERT INTO daily_stats
+           (date, guild_id, total_transcriptions, total_duration,
+            total_bytes, total_chars, user_sketch)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        [
+            (day, guild, count, duration, total_bytes, total_chars,
+             sketches.get((day, guild), HyperLogLog()).to_bytes())
+            for day, guild, count, duration, total_bytes, total_chars in rows
+        ]
+    )
+    
+    return len(rows)
+
+# スキーママイグレーション（PRAGMA user_versionで適用済みバージョンを管理）
+# 各要素はSQL文字列、または接続を受け取るコルーチン関数
+MIGRATIONS = [
+    # 1: 統計クエリ用の日付列・文字数列とインデックス
+    (1, [
+        "ALTER TABLE transcriptions ADD COLUMN created_day TEXT",
+        "ALTER TABLE transcriptions ADD COLUMN transcription_length INTEGER",
+        """UPDATE transcriptions
+           SET created_day = date(created_at),
+               transcription_length = LENGTH(transcription)""",
+        """CREATE INDEX IF NOT EXISTS idx_transcriptions_guild_day
+           ON transcriptions (guild_id, created_day, user_id, file_size, transcription_length)""",
+        """CREATE INDEX IF NOT EXISTS idx_transcriptions_user_day
+           ON transcriptions (user_id, created_day, file_size)""",
+        """CREATE INDEX IF NOT EXISTS idx_transcriptions_user_channel
+           ON transcriptions (user_id, channel_id)""",
+        """CREATE INDEX IF NOT EXISTS idx_reaction_actions_transcription
+           ON reaction_actions (transcription_id)""",
+    ]),
+    # 2: daily_statsの増分集計列と既存履歴からの再構築
+    (2, [
+        "ALTER TABLE daily_stats ADD COLUMN total_bytes INTEGER DEFAULT 0",
+        "ALTER TABLE daily_stats ADD COLUMN total_chars INTEGER DEFAULT 0",
+        "ALTER TABLE daily_stats ADD COLUMN user_sketch BLOB",
+        _rebuild_daily_stats,
+    ]),
+    # 3: ギルドの期間指定で日別集計を読むためのインデックス
+    (3, [
+        """CREATE INDEX IF NOT EXISTS idx_daily_stats_guild_date
+           ON daily_stats (guild_id, date)""",
+    ]),
+]
 
 class Database:
     """SQLiteデータベース管理クラス"""
     
-    def __init__(self, db_path: str = "data/bot.db"):
+    def __init__(self, db_path: str = "data/bot.db", settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
         self.db_path = db_path
         self.logger = setup_logger('Database')
         
+        # Botの稼働中は1本の接続を使い回す
+        self.db: Optional[aiosqlite.Connection] = None
+        # 複数ステートメントの書き込みを直列化するロック
+        self._write_lock = asyncio.Lock()
+        
+        # 履歴書き込みのライトビハインドバッファ
+        self.write_batch_size = settings.get('write_batch_size', 50)
+        self.flush_interval = settings.get('flush_interval_seconds', 2.0)
+        self._pending_ops: List[tuple] = []
+        self._pending_transcriptions: Dict[int, Dict[str, Any]] = {}
+        self._inflight_transcriptions: Dict[int, Dict[str, Any]] = {}
+        self._next_transcription_id = 1
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_loop_task: Optional[asyncio.Task] = None
+    
     async def initialize(self):
         """データベースの初期化とテーブル作成"""
         # ディレクトリが存在しない場合は作成
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        async with aiosqlite.connect(self.db_path) as db:
-            # ユーザー情報テーブル
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id TEXT PRIMARY KEY,
-                    premium_status INTEGER DEFAULT 0,
-                    daily_usage INTEGER DEFAULT 0,
-                    total_usage INTEGER DEFAULT 0,
-                    last_reset TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # 文字起こし履歴テーブル
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS transcriptions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    message_id TEXT UNIQUE,
-                    user_id TEXT,
-                    guild_id TEXT,
-                    channel_id TEXT,
-                    file_name TEXT,
-                    file_size INTEGER,
-                    duration REAL,
-                    transcription TEXT,
-                    summary TEXT,
-                    language TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
+        # 長寿命の接続を開く（sqlite3のステートメントキャッシュで準備済み文を再利用）
+        self.db = await aiosqlite.connect(self.db_path, cached_statements=256)
+        self.db.row_factory = aiosqlite.Row
+        await self.db.execute("PRAGMA journal_mode=WAL")
+        await self.db.execute("PRAGMA synchronous=NORMAL")
+        
+        db = self.db
+        
+        # ユーザー情報テーブル
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                user_id TEXT PRIMARY KEY,
+                premium_status INTEGER DEFAULT 0,
+                daily_usage INTEGER DEFAULT 0,
+                total_usage INTEGER DEFAULT 0,
+                last_reset TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # 文字起こし履歴テーブル
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS transcriptions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT UNIQUE,
+                user_id TEXT,
+                guild_id TEXT,
+                channel_id TEXT,
+                file_name TEXT,
+                file_size INTEGER,
+                duration REAL,
+                transcription TEXT,
+                summary TEXT,
+                language TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """)
+        
+        # リアクション履歴テーブル
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS reaction_actions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transcription_id INTEGER,
+                user_id TEXT,
+                reaction TEXT,
+                action_type TEXT,
+                result TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (transcription_id) REFERENCES transcriptions(id),
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            )
+        """)
+        
+        # 統計情報テーブル
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS daily_stats (
+                date TEXT,
+                guild_id TEXT,
+                total_transcriptions INTEGER DEFAULT 0,
+                total_duration REAL DEFAULT 0,
+                unique_users INTEGER DEFAULT 0,
+                PRIMARY KEY (date, guild_id)
+            )
+        """)
+        
+        # 文字起こしキャッシュテーブル
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS transcription_cache (
+                cache_key TEXT PRIMARY KEY,
+                transcription TEXT,
+                created_at REAL,
+                last_used REAL
+            )
+        """)
+        
+        await db.commit()
+        
+        # 既存のデータベースをその場でアップグレード
+        await self.migrate()
+        
+        # バッファ中の行にIDを先に割り当てるため、次のIDを取得
+        cursor = await db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM transcriptions")
+        self._next_transcription_id = (await cursor.fetchone())[0]
+        
+        self._flush_loop_task = asyncio.create_task(self._flush_loop())
+        self.logger.info("Database initialized successfully")
+    
+    async def migrate(self):
+        """未適用のマイグレーションを順に適用"""
+        cursor = await self.db.execute("PRAGMA user_version")
+        current_version = (await cursor.fetchone())[0]
+        
+        for version, statements in MIGRATIONS:
+            if version <= current_version:
+                continue
             
-            # リアクション履歴テーブル
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS reaction_actions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    transcription_id INTEGER,
-                    user_id TEXT,
-                    reaction TEXT,
-                    action_type TEXT,
-                    result TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (transcription_id) REFERENCES transcriptions(id),
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
+            self.logger.info(f"Applying database migration {version}")
+            try:
+                await self.db.execute("BEGIN")
+                for statement in statements:
+                    if callable(statement):
+                        await statement(self.db)
+                    else:
+                        await self.db.execute(statement)
+                await self.db.execute(f"PRAGMA user_version = {version}")
+                await self.db.commit()
+            except Exception:
+                await self.db.rollback()
+                raise
+    
+    async def close(self):
+        """バッファを書き出して接続をクローズ"""
+        # 定期書き出しを止め、実行中の書き出しが終わるのを待ってから最後の書き出しを行う
+        if self._flush_loop_task:
+            self._flush_loop_task.cancel()
+        tasks = [task for task in (self._flush_loop_task, self._flush_task) if task]
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._flush_loop_task = None
+        self._flush_task = None
+        
+        if self.db:
+            await self.flush()
+            await self.db.close()
+            self.db = None
+    
+    # ライトビハインドバッファ
+    def _enqueue(self, op: tuple):
+        """書き込み操作をバッファに追加（上限に達したら書き出しを予約）"""
+        self._pending_ops.append(op)
+        if len(self._pending_ops) >= self.write_batch_size and not (self._flush_task and not self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+    
+    async def _flush_loop(self):
+        """一定間隔でバッファを書き出す"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                # 停止時にキャンセルされても、実行中のトランザクションは最後まで書き出す
+                await asyncio.shield(self.flush())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error flushing write buffer: {str(e)}")
+    
+    async def flush(self):
+        """バッファ中の書き込みを1トランザクションで反映
+        
+        書き込めなかった操作はバッファに戻し、次回の書き出しで再試行する。
+        捨てるのは制約違反で何度試しても書き込めない操作だけ。
+        """
+        async with self._write_lock:
+            if not self._pending_ops:
+                return
             
-            # 統計情報テーブル
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS daily_stats (
-                    date TEXT,
-                    guild_id TEXT,
-                    total_transcriptions INTEGER DEFAULT 0,
-                    total_duration REAL DEFAULT 0,
-                    unique_users INTEGER DEFAULT 0,
-                    PRIMARY KEY (date, guild_id)
-                )
-            """)
+            ops = self._pending_ops
+            self._pending_ops = []
+            # 書き出し中の行はこれ以降変更しない（更新は次のバッチに回す）
+            self._inflight_transcriptions = self._pending_transcriptions
+            self._pending_transcriptions = {}
+            written = 0
             
-            await db.commit()
-            self.logger.info("Database initialized successfully")
+            try:
+                try:
+                    await self._execute_ops(ops)
+                    written = len(ops)
+                except Exception as e:
+                    self.logger.error(f"Batch write failed, retrying {len(ops)} operations individually: {str(e)}")
+                    # 問題のある1件だけを捨てるため、1件ずつ書き直す
+                    for op in ops:
+                        try:
+                            await self._execute_ops([op])
+                        except sqlite3.IntegrityError as op_error:
+                            self.logger.error(f"Dropped write operation {op[0]}: {str(op_error)}")
+                        written += 1
+            finally:
+                if written < len(ops):
+                    self._requeue(ops[written:])
+                self._inflight_transcriptions = {}
     
-    # ユーザー管理
-    async def get_or_create_user(self, user_id: str) -> Dict[str, Any]:
-        """ユーザーを取得または作成"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            # 既存ユーザーを確認
-            cursor = await db.execute(
-                "SELECT * FROM users WHERE user_id = ?",
-                (user_id,)
+    async def _execute_ops(self, ops: List[tuple]):
+        """操作を1トランザクションで実行（失敗・キャンセル時はロールバック）
+        
+        文字起こし履歴はまとめて挿入し、日別集計はバッチ内で日・ギルドごとに
+        合算してから1行ずつ更新する。
+        """
+        rows = [data for kind, data in ops if kind == 'transcription']
+        await self.db.execute("BEGIN")
+        try:
+            # 後続の操作（メッセージID・要約の更新など）が参照するため履歴を先に挿入する
+            if rows:
+                await self._insert_transcriptions(rows)
+            for op in ops:
+                if op[0] != 'transcription':
+                    await self._apply_op(op)
+            await self.db.commit()
+        except BaseException:
+            await self.db.rollback()
+            raise
+    
+    def _requeue(self, ops: List[tuple]):
+        """書き込めなかった操作をバッファの先頭に戻す"""
+        self.logger.warning(f"Requeued {len(ops)} write operations for the next flush")
+        self._pending_ops[:0] = ops
+        for kind, data in ops:
+            if kind == 'transcription':
+                self._pending_transcriptions[data['id']] = data
+    
+    async def _insert_transcriptions(self, rows: List[Dict[str, Any]]):
+        """文字起こし履歴をまとめて挿入し、日別集計に加算（書き込みロック内で呼ぶ）"""
+        await self.db.executemany(
+            """INSERT INTO transcriptions
+               (id, message_id, user_id, guild_id, channel_id, file_name,
+                file_size, duration, transcription, summary, language, created_at,
+                created_day, transcription_length)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            [
+                (data['id'], data['message_id'], data['user_id'], data['guild_id'],
+                 data['channel_id'], data['file_name'], data['file_size'], data['duration'],
+                 data['transcription'], data['summary'], data['language'],
+                 data['created_at'], data['created_day'], data['transcription_length'])
+                for data in rows
+            ]
+        )
+        
+        # 日・ギルドごとに合算: [件数, 再生時間, バイト数, 文字数, ユーザーID]
+        totals: Dict[tuple, list] = {}
+        for data in rows:
+            if not data['guild_id']:
+                continue
+            total = totals.setdefault((data['created_day'], data['guild_id']), [0, 0.0, 0, 0, set()])
+            total[0] += 1
+            total[1] += data['duration'] or 0.0
+            total[2] += data['file_size'] or 0
+            total[3] += data['transcription_length']
+            total[4].add(data['user_id'])
+        
+        for (day, guild_id), (count, duration, file_size, chars, user_ids) in totals.items():
+            await self._update_daily_stats(day, guild_id, count, duration, file_size, chars, user_ids)
+    
+    async def _apply_op(self, op: tuple):
+        """バッファ中の1操作を実行（書き込みロック内で呼ぶ。文字起こし履歴は_insert_transcriptionsで挿入）"""
+        kind, data = op
+        
+        if kind == 'message_id':
+            await self.db.execute(
+                "UPDATE transcriptions SET message_id = ? WHERE id = ?",
+                (data[1], data[0])
             )
-            user = await cursor.fetchone()
-            
-            if user:
-                return dict(user)
-            
-            # 新規ユーザーを作成
-            await db.execute(
-                "INSERT INTO users (user_id, last_reset) VALUES (?, ?)",
-                (user_id, datetime.now().date().isoformat())
+        elif kind == 'summary':
+            await self.db.execute(
+                "UPDATE transcriptions SET summary = ? WHERE id = ?",
+                (data[1], data[0])
             )
-            await db.commit()
-            
-            cursor = await db.execute(
-                "SELECT * FROM users WHERE user_id = ?",
-                (user_id,)
+        elif kind == 'usage':
+            # 日次使用量はメモリ上の値で上書きし、累計は差分を加算する
+            user_id, day, daily_usage, total_delta = data
+            await self.db.execute(
+                """INSERT INTO users (user_id, daily_usage, total_usage, last_reset)
+                   VALUES (?, ?, MAX(?, 0), ?)
+                   ON CONFLICT(user_id) DO UPDATE SET
+                       daily_usage = CASE WHEN COALESCE(users.last_reset, '') > excluded.last_reset
+                                          THEN users.daily_usage ELSE excluded.daily_usage END,
+                       total_usage = MAX(users.total_usage + ?, 0),
+                       last_reset = MAX(COALESCE(users.last_reset, ''), excluded.last_reset)""",
+                (user_id, daily_usage, total_delta, day, total_delta)
             )
-            user = await cursor.fetchone()
-            return dict(user)
-    
-    async def check_and_reset_daily_usage(self, user_id: str) -> None:
-        """日次使用量をリセット（必要な場合）"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                "SELECT last_reset FROM users WHERE user_id = ?",
-                (user_id,)
+        elif kind == 'reaction':
+            await self.db.execute(
+                """INSERT INTO reaction_actions
+                   (transcription_id, user_id, reaction, action_type, result, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                data
             )
-            result = await cursor.fetchone()
-            
-            if result:
-                last_reset = datetime.fromisoformat(result[0]).date()
-                today = datetime.now().date()
-                
-                if last_reset < today:
-                    await db.execute(
-                        "UPDATE users SET daily_usage = 0, last_reset = ? WHERE user_id = ?",
-                        (today.isoformat(), user_id)
-                    )
-                    await db.commit()
     
-    async def increment_usage(self, user_id: str) -> int:
-        """使用回数を増やして現在の日次使用量を返す"""
-        await self.check_and_reset_daily_usage(user_id)
-        
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """UPDATE users 
-                   SET daily_usage = daily_usage + 1, 
-                       total_usage = total_usage + 1 
-                   WHERE user_id = ?""",
-                (user_id,)
-            )
-            await db.commit()
-            
-            cursor = await db.execute(
-                "SELECT daily_usage FROM users WHERE user_id = ?",
-                (user_id,)
-            )
-            result = await cursor.fetchone()
-            return result[0] if result else 0
+    # ユーザー管理
+    async def get_usage(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """日次使用量と最終リセット日を取得（バッファ中の書き込みを反映してから読む）"""
+        await self.flush()
+        cursor = await self.db.execute(
+            "SELECT daily_usage, last_reset FROM users WHERE user_id = ?",
+            (user_id,)
+        )
+        row = await cursor.fetchone()
+        return dict(row) if row else None
+    
+    def record_usage(self, user_id: str, day: str, daily_usage: int, total_delta: int):
+        """メモリ上の使用量をバッファ経由で書き込む"""
+        self._enqueue(('usage', (user_id, day, daily_usage, total_delta)))
     
     # 文字起こし履歴
-    async def save_transcription(self, message_id: str, user_id: str, 
+    async def save_transcription(self, message_id: Optional[str], user_id: str,
                                guild_id: Optional[str], channel_id: str,
                                file_name: str, file_size: int,
-                               transcription: str, language: str = "ja") -> int:
-        """文字起こし結果を保存"""
-        async with aiosqlite.connect(self.db_path) as db:
-            cursor = await db.execute(
-                """INSERT INTO transcriptions 
-                   (message_id, user_id, guild_id, channel_id, file_name, 
-                    file_size, transcription, language)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                (message_id, user_id, guild_id, channel_id, file_name, 
-                 file_size, transcription, language)
-            )
-            await db.commit()
-            return cursor.lastrowid
+                               transcription: str, language: str = "ja",
+                               duration: Optional[float] = None) -> int:
+        """文字起こし結果を保存（バッファ経由で書き込み、IDは即時に返す）
+        
+        message_idは結果メッセージのID。送信前に保存する場合はNoneを渡し、
+        送信後にupdate_transcription_message_idで設定する。
+        """
+        now = datetime.now(timezone.utc)
+        transcription_id = self._next_transcription_id
+        self._next_transcription_id += 1
+        
+        row = {
+            'id': transcription_id,
+            'message_id': message_id,
+            'user_id': user_id,
+            'guild_id': guild_id,
+            'channel_id': channel_id,
+            'file_name': file_name,
+            'file_size': file_size,
+            'duration': duration,
+            'transcription': transcription,
+            'summary': None,
+            'language': language,
+            'created_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+            'created_day': now.date().isoformat(),
+            'transcription_length': len(transcription)
+        }
+        self._pending_transcriptions[transcription_id] = row
+        self._enqueue(('transcription', row))
+        return transcription_id
+    
+    async def _update_daily_stats(self, day: str, guild_id: str, count: int, duration: float,
+                                  file_size: int, transcription_length: int, user_ids: set):
+        """日別・ギルド別の集計にバッチ分の合計を加算（書き込みロック内で呼ぶ）
+        
+        期間のユニークユーザー数は読み出し時にスケッチをマージして求めるため、
+        ここではスケッチの更新だけを行い推定値は計算しない。
+        """
+        cursor = await self.db.execute(
+            "SELECT user_sketch FROM daily_stats WHERE date = ? AND guild_id = ?",
+            (day, guild_id)
+        )
+        row = await cursor.fetchone()
+        sketch = HyperLogLog.from_bytes(row[0] if row else None)
+        sketch.update(user_ids)
+        
+        await self.db.execute(
+            """INSERT INTO daily_stats
+               (date, guild_id, total_transcriptions, total_duration,
+                total_bytes, total_chars, user_sketch)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(date, guild_id) DO UPDATE SET
+                   total_transcriptions = total_transcriptions + excluded.total_transcriptions,
+                   total_duration = total_duration + excluded.total_duration,
+                   total_bytes = total_bytes + excluded.total_bytes,
+                   total_chars = total_chars + excluded.total_chars,
+                   user_sketch = excluded.user_sketch""",
+            (day, guild_id, count, duration, file_size, transcription_length, sketch.to_bytes())
+        )
+    
+    async def rebuild_daily_stats(self, guild_id: Optional[str] = None) -> int:
+        """履歴から日別集計を再構築し、作成した行数を返す（guild_id指定時はそのギルドのみ）"""
+        await self.flush()
+        
+        async with self._write_lock:
+            try:
+                await self.db.execute("BEGIN")
+                rows = await _rebuild_daily_stats(self.db, guild_id)
+                await self.db.commit()
+            except Exception:
+                await self.db.rollback()
+                raise
+        
+        self.logger.info(f"Rebuilt daily stats: {rows} rows")
+        return rows
+    
+    async def update_transcription_message_id(self, transcription_id: int, message_id: str):
+        """文字起こしに結果メッセージIDを設定"""
+        pending = self._pending_transcriptions.get(transcription_id)
+        if pending:
+            pending['message_id'] = message_id
+            return
+        self._enqueue(('message_id', (transcription_id, message_id)))
+    
+    async def get_transcription(self, transcription_id: int) -> Optional[Dict[str, Any]]:
+        """IDから文字起こしを取得（未書き込みの行も参照）"""
+        for rows in (self._pending_transcriptions, self._inflight_transcriptions):
+            row = rows.get(transcription_id)
+            if row:
+                return dict(row)
+        
+        cursor = await self.db.execute(
+            "SELECT * FROM transcriptions WHERE id = ?",
+            (transcription_id,)
+        )
+        result = await cursor.fetchone()
+        return dict(result) if result else None
     
     async def get_transcription_by_message(self, message_id: str) -> Optional[Dict[str, Any]]:
-        """メッセージIDから文字起こしを取得"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            cursor = await db.execute(
-                "SELECT * FROM transcriptions WHERE message_id = ?",
-                (message_id,)
-            )
-            result = await cursor.fetchone()
-            return dict(result) if result else None
+        """メッセージIDから文字起こしを取得（未書き込みの行も参照）"""
+        for rows in (self._pending_transcriptions, self._inflight_transcriptions):
+            for row in rows.values():
+                if row['message_id'] == message_id:
+                    return dict(row)
+        
+        cursor = await self.db.execute(
+            "SELECT * FROM transcriptions WHERE message_id = ?",
+            (message_id,)
+        )
+        result = await cursor.fetchone()
+        return dict(result) if result else None
     
     async def update_transcription_summary(self, transcription_id: int, summary: str):
         """文字起こしに要約を追加"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "UPDATE transcriptions SET summary = ? WHERE id = ?",
-                (summary, transcription_id)
-            )
-            await db.commit()
+        pending = self._pending_transcriptions.get(transcription_id)
+        if pending:
+            pending['summary'] = summary
+            return
+        self._enqueue(('summary', (transcription_id, summary)))
     
     # リアクション履歴
     async def save_reaction_action(self, transcription_id: int, user_id: str,
                                  reaction: str, action_type: str, result: str):
-        """リアクションアクションを保存"""
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """INSERT INTO reaction_actions 
-                   (transcription_id, user_id, reaction, action_type, result)
-                   VALUES (?, ?, ?, ?, ?)""",
-                (transcription_id, user_id, reaction, action_type, result)
+        """リアクションアクションを保存（バッファ経由）"""
+        created_at = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        self._enqueue(('reaction', (transcription_id, user_id, reaction, action_type, result, created_at)))
+    
+    # 文字起こしキャッシュ
+    async def get_cached_transcription(self, cache_key: str, max_age: float) -> Optional[str]:
+        """キャッシュされた文字起こしを取得"""
+        now = time.time()
+        cursor = await self.db.execute(
+            "SELECT transcription FROM transcription_cache WHERE cache_key = ? AND created_at >= ?",
+            (cache_key, now - max_age)
+        )
+        result = await cursor.fetchone()
+        
+        if not result:
+            return None
+        
+        async with self._write_lock:
+            await self.db.execute(
+                "UPDATE transcription_cache SET last_used = ? WHERE cache_key = ?",
+                (now, cache_key)
             )
-            await db.commit()
+            await self.db.commit()
+        return result[0]
     
-    # 統計情報
-    async def get_user_stats(self, user_id: str) -> Dict[str, Any]:
-        """ユーザーの統計情報を取得"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            # ユーザー情報
-            cursor = await db.execute(
-                "SELECT * FROM users WHERE user_id = ?",
-                (user_id,)
+    async def save_cached_transcription(self, cache_key: str, transcription: str):
+        """文字起こしをキャッシュに保存"""
+        now = time.time()
+        async with self._write_lock:
+            await self.db.execute(
+                """INSERT OR REPLACE INTO transcription_cache
+                   (cache_key, transcription, created_at, last_used)
+                   VALUES (?, ?, ?, ?)""",
+                (cache_key, transcription, now, now)
             )
-            user = await cursor.fetchone()
-            
-            if not user:
-                return {}
-            
-            # 今月の統計
-            first_day = datetime.now().replace(day=1).date().isoformat()
-            cursor = await db.execute(
-                """SELECT COUNT(*) as monthly_count, 
-                          SUM(file_size) as total_size
-                   FROM transcriptions 
-                   WHERE user_id = ? AND date(created_at) >= ?""",
-                (user_id, first_day)
+            await self.db.commit()
+    
+    async def prune_transcription_cache(self, max_entries: int, max_age: float):
+        """期限切れ・上限超過のキャッシュを削除"""
+        async with self._write_lock:
+            await self.db.execute(
+                "DELETE FROM transcription_cache WHERE created_at < ?",
+                (time.time() - max_age,)
             )
-            monthly_stats = await cursor.fetchone()
-            
-            # よく使うチャンネル
-            cursor = await db.execute(
-                """SELECT channel_id, COUNT(*) as count 
-                   FROM transcriptions 
-                   WHERE user_id = ? 
-                   GROUP BY channel_id 
-                   ORDER BY count DESC 
-                   LIMIT 3""",
-                (user_id,)
+            await self.db.execute(
+                """DELETE FROM transcription_cache WHERE cache_key IN (
+                       SELECT cache_key FROM transcription_cache
+                       ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                   )""",
+                (max_entries,)
             )
-            top_channels = await cursor.fetchall()
-            
-            return {
-                'user': dict(user),
-                'monthly_count': monthly_stats['monthly_count'] or 0,
-                'total_size_mb': (monthly_stats['total_size'] or 0) / 1024 / 1024,
-                'top_channels': [dict(ch) for ch in top_channels]
-            }
+            await self.db.commit()
+    
+    # 統計情報
+    async def get_user_stats(self, user_id: str) -> Dict[str, Any]:
+        """ユーザーの統計情報を取得"""
+        await self.flush()
+        db = self.db
+        
+        # ユーザー情報
+        cursor = await db.execute(
+            "SELECT * FROM users WHERE user_id = ?",
+            (user_id,)
+        )
+        user = await cursor.fetchone()
+        
+        if not user:
+            return {}
+        
+        # 今月の統計
+        first_day = datetime.now().replace(day=1).date().isoformat()
+        cursor = await db.execute(
+            """SELECT COUNT(*) as monthly_count,
+                      SUM(file_size) as total_size
+               FROM transcriptions
+               WHERE user_id = ? AND created_day >= ?""",
+            (user_id, first_day)
+        )
+        monthly_stats = await cursor.fetchone()
+        
+        # よく使うチャンネル
+        cursor = await db.execute(
+            """SELECT channel_id, COUNT(*) as count
+               FROM transcriptions
+               WHERE user_id = ?
+               GROUP BY channel_id
+               ORDER BY count DESC
+               LIMIT 3""",
+            (user_id,)
+        )
+        top_channels = await cursor.fetchall()
+        
+        return {
+            'user': dict(user),
+            'monthly_count': monthly_stats['monthly_count'] or 0,
+            'total_size_mb': (monthly_stats['total_size'] or 0) / 1024 / 1024,
+            'top_channels': [dict(ch) for ch in top_channels]
+        }
     
     async def get_guild_stats(self, guild_id: str, days: int = 30) -> Dict[str, Any]:
-        """ギルドの統計情報を取得"""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            
-            since_date = (datetime.now() - timedelta(days=days)).date().isoformat()
-            
-            # 全体統計
-            cursor = await db.execute(
-                """SELECT COUNT(*) as total_count,
-                          COUNT(DISTINCT user_id) as unique_users,
-                          SUM(file_size) as total_size,
-                          AVG(LENGTH(transcription)) as avg_length
-                   FROM transcriptions 
-                   WHERE guild_id = ? AND date(created_at) >= ?""",
-                (guild_id, since_date)
-            )
-            overall = await cursor.fetchone()
-            
-            # 日別統計
-            cursor = await db.execute(
-                """SELECT date(created_at) as date, 
-                          COUNT(*) as count
-                   FROM transcriptions 
-                   WHERE guild_id = ? AND date(created_at) >= ?
-                   GROUP BY date(created_at)
-                   ORDER BY date DESC""",
-                (guild_id, since_date)
-            )
-            daily_stats = await cursor.fetchall()
-            
-            # アクティブユーザー
-            cursor = await db.execute(
-                """SELECT user_id, COUNT(*) as count 
-                   FROM transcriptions 
-                   WHERE guild_id = ? AND date(created_at) >= ?
-                   GROUP BY user_id 
-                   ORDER BY count DESC 
-                   LIMIT 10""",
-                (guild_id, since_date)
-            )
-            top_users = await cursor.fetchall()
-            
-            return {
-                'total_transcriptions': overall['total_count'] or 0,
-                'unique_users': overall['unique_users'] or 0,
-                'total_size_mb': (overall['total_size'] or 0) / 1024 / 1024,
-                'avg_transcription_length': int(overall['avg_length'] or 0),
-                'daily_stats': [dict(d) for d in daily_stats],
-                'top_users': [dict(u) for u in top_users]
-            }
\ No newline at end of file
+        """ギルドの統計情報を取得（日別集計テーブルから読む）"""
+        await self.flush()
+        db = self.db
+        
+        since_date = (datetime.now() - timedelta(days=days)).date().isoformat()
+        
+        # 日別集計（期間の日数分の行のみ）
+        cursor = await db.execute(
+            """SELECT date, total_transcriptions, total_duration, total_bytes, total_chars, user_sketch
+               FROM daily_stats
+               WHERE guild_id = ? AND date >= ?
+               ORDER BY date DESC""",
+            (guild_id, since_date)
+        )
+        daily_rows = await cursor.fetchall()
+        
+        # 全体統計
+        total_count = sum(row['total_transcriptions'] for row in daily_rows)
+        total_size = sum(row['total_bytes'] or 0 for row in daily_rows)
+        total_chars = sum(row['total_chars'] or 0 for row in daily_rows)
+        total_duration = sum(row['total_duration'] or 0 for row in daily_rows)
+        
+        users = HyperLogLog()
+        for row in daily_rows:
+            users.merge(HyperLogLog.from_bytes(row['user_sketch']))
+        
+        # アクティブユーザー
+        cursor = await db.execute(
+            """SELECT user_id, COUNT(*) as count
+               FROM transcriptions
+               WHERE guild_id = ? AND created_day >= ?
+               GROUP BY user_id
+               ORDER BY count DESC
+               LIMIT 10""",
+            (guild_id, since_date)
+        )
+        top_users = await cursor.fetchall()
+        
+        return {
+            'total_transcriptions': total_count,
+            'unique_users': users.count(),
+            'total_size_mb': total_size / 1024 / 1024,
+            'total_duration_minutes': total_duration / 60,
+            'avg_transcription_length': int(total_chars / total_count) if total_count else 0,
+            'daily_stats': [{'date': row['date'], 'count': row['total_transcriptions']} for row in daily_rows],
+            'top_users': [dict(u) for u in top_users]
+        }
\ No newline at end of file
@@ -0,0 +1,61 @@
+import hashlib
+import math
+from typing import Iterable, Optional
+
+class HyperLogLog:
+    """ユニークユーザー数を概算するHyperLogLogスケッチ
+    
+    レジスタはバイト列として保存でき、日ごとのスケッチを
+    マージすることで任意期間のユニーク数を求められる。
+    """
+    
+    def __init__(self, precision: int = 10, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is not None and len(registers) == self.size:
+            self.registers = bytearray(registers)
+        else:
+            self.registers = bytearray(self.size)
+    
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], precision: int = 10) -> 'HyperLogLog':
+        """保存済みのレジスタから復元"""
+        return cls(precision, data)
+    
+    def to_bytes(self) -> bytes:
+        """保存用のバイト列に変換"""
+        return bytes(self.registers)
+    
+    def add(self, item: str):
+        """要素を追加"""
+        x = int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+        index = x >> (64 - self.precision)
+        remaining = (x << self.precision) & ((1 << 64) - 1)
+        # 残りビットの先頭0の数 + 1（最大値は 64 - precision + 1）
+        rank = min(64 - remaining.bit_length(), 64 - self.precision) + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def update(self, items: Iterable[str]):
+        """複数の要素を追加"""
+        for item in items:
+            self.add(item)
+    
+    def merge(self, other: 'HyperLogLog'):
+        """別のスケッチをマージ"""
+        for i, value in enumerate(other.registers):
+            if value > self.registers[i]:
+                self.registers[i] = value
+    
+    def count(self) -> int:
+        """ユニーク数の推定値"""
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        
+        # 小さい値は線形カウンティングで補正
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        
+        return int(round(estimate))
\ No newline at end of file
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from collections import deque, OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List
+from utils.logger import setup_logger
+
+class JobQueue:
+    """ギルド単位で公平に処理する上限付きジョブキュー"""
+    
+    def __init__(self, handler: Callable[..., Awaitable[Any]], workers: int = 4,
+                 max_depth: int = 50, name: str = 'JobQueue'):
+        self.handler = handler
+        self.worker_count = max(1, workers)
+        self.max_depth = max_depth
+        self.logger = setup_logger(name)
+        
+        # ギルドごとの待ち行列（ラウンドロビンで取り出す）
+        self._queues: "OrderedDict[str, deque]" = OrderedDict()
+        self._available = asyncio.Semaphore(0)
+        self._workers: List[asyncio.Task] = []
+        self._depth = 0
+        
+        # メトリクス
+        self.started = 0
+        self.processed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._recent_waits = deque(maxlen=100)
+    
+    @property
+    def depth(self) -> int:
+        """待機中のジョブ数"""
+        return self._depth
+    
+    def start(self):
+        """ワーカーを起動"""
+        if self._workers:
+            return
+        for i in range(self.worker_count):
+            self._workers.append(asyncio.create_task(self._worker(i)))
+        self.logger.info(f"Started {self.worker_count} workers (max depth: {self.max_depth})")
+    
+    async def stop(self):
+        """ワーカーを停止"""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+    
+    def submit(self, guild_key: str, *args: Any) -> bool:
+        """ジョブを登録（キューが満杯の場合はFalse）"""
+        if self._depth >= self.max_depth:
+            self.rejected += 1
+            self.logger.warning(f"Queue full ({self._depth}/{self.max_depth}), rejected job for guild {guild_key}")
+            return False
+        
+        if guild_key not in self._queues:
+            self._queues[guild_key] = deque()
+        self._queues[guild_key].append((time.monotonic(), args))
+        self._depth += 1
+        self._available.release()
+        return True
+    
+    def _next_job(self):
+        """次に処理するジョブを取り出す（ギルド間で順番に回す）"""
+        guild_key, jobs = self._queues.popitem(last=False)
+        job = jobs.popleft()
+        if jobs:
+            # 残りがあれば最後尾に回して他ギルドを優先
+            self._queues[guild_key] = jobs
+        self._depth -= 1
+        return job
+    
+    async def _worker(self, index: int):
+        """ジョブを取り出して処理するワーカー"""
+        while True:
+            await self._available.acquire()
+            enqueued_at, args = self._next_job()
+            
+            wait = time.monotonic() - enqueued_at
+            self.started += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self._recent_waits.append(wait)
+            
+            try:
+                await self.handler(*args)
+                self.processed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                self.logger.error(f"Worker {index} failed to process job: {str(e)}")
+    
+    def metrics(self) -> Dict[str, Any]:
+        """キューのメトリクスを取得"""
+        recent = sorted(self._recent_waits)
+        return {
+            'depth': self._depth,
+            'max_depth': self.max_depth,
+            'workers': self.worker_count,
+            'processed': self.processed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'avg_wait': self.total_wait / self.started if self.started else 0.0,
+            'p95_wait': recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0,
+            'max_wait': self.max_wait
+        }
\ No newline at end of file
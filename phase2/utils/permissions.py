@@ -1,64 +1,170 @@
 import discord
-from typing import Optional, Dict, Any
-import json
-import os
+from typing import Optional, Dict, Any, FrozenSet, Iterable, Mapping, Tuple
+import time
+from utils.config_service import ConfigService, ConfigError, require
+
+# 権限設定のデフォルト（config/permissions.jsonがない場合に作成）
+DEFAULT_PERMISSIONS = {
+    "premium_roles": ["Premium", "VIP", "Supporter"],
+    "admin_roles": ["Admin", "Moderator"],
+    "daily_limits": {
+        "free": 10,
+        "premium": -1  # 無制限
+    },
+    "blocked_users": []
+}
+
+def validate_permissions(permissions: Mapping[str, Any]):
+    """permissions.jsonの検証"""
+    require(permissions, 'premium_roles', list)
+    require(permissions, 'admin_roles', list)
+    require(permissions, 'daily_limits', dict)
+    require(permissions['daily_limits'], 'free', int, 'daily_limits.')
+    require(permissions['daily_limits'], 'premium', int, 'daily_limits.')
+    for user_id in permissions.get('blocked_users', []):
+        if not str(user_id).isdigit():
+            raise ConfigError(f"blocked_users contains an invalid user ID: {user_id}")
 
 class PermissionManager:
-    """権限とユーザー管理"""
+    """権限とユーザー管理
     
-    def __init__(self, config_path: str = "config/permissions.json"):
+    Bot全体で1つのインスタンスを共有する（bot.permission_manager）。
+    ロールはギルドごとにロールIDのfrozensetへ解決し、メンバーごとの判定結果を
+    メモ化する。メンバーやロールの更新イベントで該当する結果を破棄する。
+    config/permissions.jsonの変更は再起動なしで反映する。
+    """
+    
+    def __init__(self, config: ConfigService, config_path: str = "config/permissions.json",
+                 settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.config = config
         self.config_path = config_path
-        self.permissions = self._load_permissions()
-    
-    def _load_permissions(self) -> Dict[str, Any]:
-        """権限設定の読み込み"""
-        if os.path.exists(self.config_path):
-            with open(self.config_path, 'r') as f:
-                return json.load(f)
-        else:
-            # デフォルト設定
-            default = {
-                "premium_roles": ["Premium", "VIP", "Supporter"],
-                "admin_roles": ["Admin", "Moderator"],
-                "daily_limits": {
-                    "free": 10,
-                    "premium": -1  # 無制限
-                },
-                "blocked_users": []
-            }
-            os.makedirs(os.path.dirname(self.config_path), exist_ok=True)
-            with open(self.config_path, 'w') as f:
-                json.dump(default, f, indent=2)
-            return default
+        # メンバー更新イベントを受け取れない場合（members intentなし）に備えた有効期限
+        self.cache_ttl = settings.get('cache_ttl_seconds', 300)
+        
+        # ギルドID -> (プレミアムロールID, 管理者ロールID)
+        self._guild_roles: Dict[int, Tuple[FrozenSet[int], FrozenSet[int]]] = {}
+        # ギルドID -> メンバーID -> (判定時刻, プレミアム, 管理者)
+        self._member_cache: Dict[int, Dict[int, Tuple[float, bool, bool]]] = {}
+        
+        config.register('permissions', config_path, default=DEFAULT_PERMISSIONS, validate=validate_permissions)
+        config.subscribe('permissions', lambda _: self._compile())
+        self._compile()
+    
+    @property
+    def permissions(self) -> Mapping[str, Any]:
+        """現在の権限設定（変更不可のスナップショット）"""
+        return self.config.get('permissions')
+    
+    def _compile(self):
+        """設定を判定用の集合に変換（設定変更時にも呼ぶ）"""
+        self._premium_names, self._premium_ids = self._split_roles(self.permissions["premium_roles"])
+        self._admin_names, self._admin_ids = self._split_roles(self.permissions["admin_roles"])
+        self._blocked = {int(user_id) for user_id in self.permissions.get("blocked_users", [])}
+        self.invalidate_all()
+    
+    @staticmethod
+    def _split_roles(roles: Iterable[Any]) -> Tuple[FrozenSet[str], FrozenSet[int]]:
+        """ロール設定をロール名とロールIDに分ける（数字のみの値はIDとして扱う）"""
+        names = set()
+        ids = set()
+        for role in roles:
+            if isinstance(role, int) or str(role).isdigit():
+                ids.add(int(role))
+            else:
+                names.add(str(role))
+        return frozenset(names), frozenset(ids)
+    
+    def _role_ids(self, guild: discord.Guild) -> Tuple[FrozenSet[int], FrozenSet[int]]:
+        """ギルドのプレミアム・管理者ロールID（ロール名はここで1回だけIDに解決）"""
+        role_ids = self._guild_roles.get(guild.id)
+        if role_ids is None:
+            premium = {role.id for role in guild.roles if role.name in self._premium_names}
+            admin = {role.id for role in guild.roles if role.name in self._admin_names}
+            role_ids = (frozenset(premium) | self._premium_ids, frozenset(admin) | self._admin_ids)
+            self._guild_roles[guild.id] = role_ids
+        return role_ids
+    
+    def _flags(self, member: discord.Member) -> Tuple[bool, bool]:
+        """メンバーの(プレミアム, 管理者)判定（メモ化）"""
+        now = time.monotonic()
+        members = self._member_cache.setdefault(member.guild.id, {})
+        cached = members.get(member.id)
+        if cached and now - cached[0] < self.cache_ttl:
+            return cached[1], cached[2]
+        
+        premium_ids, admin_ids = self._role_ids(member.guild)
+        member_role_ids = {role.id for role in member.roles}
+        premium = not premium_ids.isdisjoint(member_role_ids)
+        admin = (
+            # サーバー所有者は常に管理者
+            member.guild.owner_id == member.id
+            # Discord権限チェック
+            or member.guild_permissions.administrator
+            # カスタムロールチェック
+            or not admin_ids.isdisjoint(member_role_ids)
+        )
+        members[member.id] = (now, premium, admin)
+        return premium, admin
     
     def is_premium(self, member: discord.Member) -> bool:
         """プレミアムユーザーかどうか"""
-        if not member:
+        if not isinstance(member, discord.Member):
             return False
-        
-        user_roles = [role.name for role in member.roles]
-        return any(role in self.permissions["premium_roles"] for role in user_roles)
+        return self._flags(member)[0]
     
     def is_admin(self, member: discord.Member) -> bool:
         """管理者かどうか"""
-        if not member:
+        if not isinstance(member, discord.Member):
             return False
-        
-        # サーバー所有者は常に管理者
-        if member.guild and member.guild.owner_id == member.id:
-            return True
-        
-        # Discord権限チェック
-        if member.guild_permissions.administrator:
-            return True
-        
-        # カスタムロールチェック
-        user_roles = [role.name for role in member.roles]
-        return any(role in self.permissions["admin_roles"] for role in user_roles)
+        return self._flags(member)[1]
     
     def is_blocked(self, user_id: int) -> bool:
         """ブロックされているユーザーかどうか"""
-        return str(user_id) in self.permissions.get("blocked_users", [])
+        return user_id in self._blocked
+    
+    def invalidate_member(self, guild_id: int, member_id: int):
+        """メンバーの判定結果を破棄（ロール変更時）"""
+        members = self._member_cache.get(guild_id)
+        if members:
+            members.pop(member_id, None)
+    
+    def invalidate_guild(self, guild_id: int):
+        """ギルドのロールIDと判定結果を破棄（ロールの作成・変更・削除、所有者の変更時）"""
+        self._guild_roles.pop(guild_id, None)
+        self._member_cache.pop(guild_id, None)
+    
+    def invalidate_all(self):
+        """すべての判定結果を破棄"""
+        self._guild_roles.clear()
+        self._member_cache.clear()
+    
+    def register_listeners(self, bot: discord.Client):
+        """メンバー・ロールの更新イベントで判定結果を破棄するリスナーを登録"""
+        async def on_member_update(before: discord.Member, after: discord.Member):
+            if before.roles != after.roles:
+                self.invalidate_member(after.guild.id, after.id)
+        
+        async def on_member_remove(member: discord.Member):
+            self.invalidate_member(member.guild.id, member.id)
+        
+        async def on_guild_role_change(role: discord.Role, *args):
+            self.invalidate_guild(role.guild.id)
+        
+        async def on_guild_update(before: discord.Guild, after: discord.Guild):
+            if before.owner_id != after.owner_id:
+                self.invalidate_guild(after.id)
+        
+        async def on_guild_remove(guild: discord.Guild):
+            self.invalidate_guild(guild.id)
+        
+        bot.add_listener(on_member_update, 'on_member_update')
+        bot.add_listener(on_member_remove, 'on_member_remove')
+        bot.add_listener(on_guild_role_change, 'on_guild_role_create')
+        bot.add_listener(on_guild_role_change, 'on_guild_role_update')
+        bot.add_listener(on_guild_role_change, 'on_guild_role_delete')
+        bot.add_listener(on_guild_update, 'on_guild_update')
+        bot.add_listener(on_guild_remove, 'on_guild_remove')
     
     def get_daily_limit(self, member: Optional[discord.Member]) -> int:
         """日次利用制限を取得"""
@@ -66,27 +172,20 @@ class PermissionManager:
             return self.permissions["daily_limits"]["premium"]
         return self.permissions["daily_limits"]["free"]
     
-    def add_premium_role(self, role_name: str):
+    async def add_premium_role(self, role_name: str):
         """プレミアムロールを追加"""
         if role_name not in self.permissions["premium_roles"]:
-            self.permissions["premium_roles"].append(role_name)
-            self._save_permissions()
+            await self.config.update('permissions', lambda data: data["premium_roles"].append(role_name))
     
-    def block_user(self, user_id: int):
+    async def block_user(self, user_id: int):
         """ユーザーをブロック"""
-        user_id_str = str(user_id)
-        if user_id_str not in self.permissions["blocked_users"]:
-            self.permissions["blocked_users"].append(user_id_str)
-            self._save_permissions()
+        if not self.is_blocked(user_id):
+            await self.config.update('permissions', lambda data: data["blocked_users"].append(str(user_id)))
     
-    def unblock_user(self, user_id: int):
+    async def unblock_user(self, user_id: int):
         """ユーザーのブロックを解除"""
-        user_id_str = str(user_id)
-        if user_id_str in self.permissions["blocked_users"]:
-            self.permissions["blocked_users"].remove(user_id_str)
-            self._save_permissions()
-    
-    def _save_permissions(self):
-        """権限設定を保存"""
-        with open(self.config_path, 'w') as f:
-            json.dump(self.permissions, f, indent=2)
\ No newline at end of file
+        def remove(data: Dict[str, Any]):
+            data["blocked_users"] = [u for u in data["blocked_users"] if int(u) != user_id]
+        
+        if self.is_blocked(user_id):
+            await self.config.update('permissions', remove)
\ No newline at end of file
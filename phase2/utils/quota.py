@@ -0,0 +1,107 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+from utils.logger import setup_logger
+
+class _Usage:
+    """1ユーザー分の日次使用量"""
+    
+    __slots__ = ('day', 'used')
+    
+    def __init__(self, day: str, used: int):
+        self.day = day
+        self.used = used
+
+class QuotaManager:
+    """日次利用制限をメモリ上のカウンターで判定する
+    
+    ユーザーごとの使用量は初回アクセス時にデータベースから読み込み、
+    以降の判定はメモリだけで行う。変更はDatabaseの書き込みバッファに積み、
+    定期的にまとめて反映するため、再起動後も同じ使用量から再開できる。
+    """
+    
+    def __init__(self, database, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.database = database
+        # メモリに保持するユーザー数の上限（古いものから破棄し、次回はDBから読み直す）
+        self.max_users = settings.get('max_users', 10000)
+        self._usage: "OrderedDict[str, _Usage]" = OrderedDict()
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.loads = 0
+        self.denied = 0
+        self.logger = setup_logger('QuotaManager')
+    
+    @staticmethod
+    def _today() -> str:
+        return datetime.now().date().isoformat()
+    
+    async def _load(self, user_id: str) -> _Usage:
+        """データベースから使用量を読み込む"""
+        self.loads += 1
+        row = await self.database.get_usage(user_id)
+        today = self._today()
+        if row and row.get('last_reset') == today:
+            usage = _Usage(today, row['daily_usage'] or 0)
+        else:
+            usage = _Usage(today, 0)
+        
+        self._usage[user_id] = usage
+        while len(self._usage) > self.max_users:
+            self._usage.popitem(last=False)
+        return usage
+    
+    async def _get(self, user_id: str) -> _Usage:
+        """メモリ上の使用量（なければ読み込み、同時の読み込みは1回にまとめる）"""
+        usage = self._usage.get(user_id)
+        if usage is not None:
+            self.hits += 1
+            self._usage.move_to_end(user_id)
+            return usage
+        
+        loading = self._loading.get(user_id)
+        if loading is None:
+            loading = asyncio.ensure_future(self._load(user_id))
+            self._loading[user_id] = loading
+            loading.add_done_callback(lambda _: self._loading.pop(user_id, None))
+        return await asyncio.shield(loading)
+    
+    async def try_acquire(self, user_id: str, daily_limit: int = -1) -> Optional[int]:
+        """使用回数を1回分加算して現在の日次使用量を返す
+        
+        daily_limitが正の値で、既に上限に達している場合は加算せずNoneを返す。
+        """
+        usage = await self._get(user_id)
+        
+        # 日付が変わっていればリセット
+        today = self._today()
+        if usage.day != today:
+            usage.day = today
+            usage.used = 0
+        
+        if daily_limit > 0 and usage.used >= daily_limit:
+            self.denied += 1
+            return None
+        
+        usage.used += 1
+        self.database.record_usage(user_id, usage.day, usage.used, 1)
+        return usage.used
+    
+    def release(self, user_id: str):
+        """加算済みの使用回数を1回分戻す（処理失敗時）"""
+        usage = self._usage.get(user_id)
+        if usage is None or usage.day != self._today() or usage.used <= 0:
+            return
+        usage.used -= 1
+        self.database.record_usage(user_id, usage.day, usage.used, -1)
+    
+    def metrics(self) -> Dict[str, Any]:
+        """メモリ上のユーザー数とヒット率"""
+        total = self.hits + self.loads
+        return {
+            'users': len(self._usage),
+            'hit_rate': self.hits / total if total else 0.0,
+            'loads': self.loads,
+            'denied': self.denied
+        }
\ No newline at end of file
@@ -1,59 +1,126 @@
+import aiohttp
+import asyncio
 import os
-import openai
-from typing import Optional
-import tempfile
+from typing import Optional, Dict, Any, List, Union, BinaryIO
 from utils.logger import setup_logger
+from utils.adaptive_limiter import AdaptiveLimiter, LimiterRejected, payload_megabytes
+from utils.resilience import Resilience, ReplayableBody, CircuitOpenError, UpstreamError, raise_for_status
 
 class OpenAIService:
     """OpenAI APIとの連携を管理"""
     
-    def __init__(self):
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
         self.api_key = os.getenv('OPENAI_API_KEY')
+        self.base_url = os.getenv('OPENAI_BASE_URL', 'https://api.openai.com/v1').rstrip('/')
         self.logger = setup_logger('OpenAIService')
+        self.session = None
         
-        if self.api_key:
-            # 環境変数を設定（古い方式）
-            openai.api_key = self.api_key
-        else:
+        # 同時に実行するAPIリクエスト数の上限（要約・翻訳）
+        self.max_concurrency = settings.get('max_concurrency', 4)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        
+        # 文字起こしの同時実行数は応答に応じて自動調整
+        self.limiter = AdaptiveLimiter('openai', settings.get('concurrency'))
+        self.timeout = aiohttp.ClientTimeout(total=settings.get('timeout_seconds', 120))
+        
+        # エンドポイントごとのサーキットブレーカーと再試行
+        self.resilience = Resilience('openai', settings.get('resilience'))
+        
+        if not self.api_key:
             self.logger.error("OpenAI API key not found in environment variables")
     
-    async def transcribe_audio(self, file_data: bytes, filename: str) -> Optional[str]:
-        """音声ファイルを文字起こし"""
+    async def initialize(self):
+        """非同期セッションの初期化"""
+        if not self.session:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+    
+    async def close(self):
+        """セッションのクローズ"""
+        if self.session:
+            await self.session.close()
+            self.session = None
+    
+    async def transcribe_audio(self, file_data: Union[bytes, BinaryIO], filename: str) -> Optional[str]:
+        """音声ファイルを文字起こし（ファイルオブジェクトはチャンク単位で送信される）"""
         if not self.api_key:
             self.logger.error("OpenAI API key not configured")
             return None
         
+        await self.initialize()
+        
+        # 再試行時はファイルの先頭から送り直す
+        megabytes = payload_megabytes(file_data)
+        body = ReplayableBody(file_data)
+        
+        async def attempt() -> Dict[str, Any]:
+            with body.open() as payload:
+                data = aiohttp.FormData()
+                data.add_field('file', payload, filename=filename)
+                data.add_field('model', 'whisper-1')
+                data.add_field('language', 'ja')  # 日本語指定
+                
+                async with self.session.post(
+                    f'{self.base_url}/audio/transcriptions',
+                    headers={'Authorization': f'Bearer {self.api_key}'},
+                    data=data
+                ) as response:
+                    await raise_for_status(response)
+                    return await response.json()
+        
         try:
-            # 一時ファイルに保存
-            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as tmp_file:
-                tmp_file.write(file_data)
-                tmp_file_path = tmp_file.name
-            
-            # Whisper APIで文字起こし
-            with open(tmp_file_path, 'rb') as audio_file:
-                response = openai.Audio.transcribe(
-                    model="whisper-1",
-                    file=audio_file,
-                    language="ja"  # 日本語指定
-                )
-            
-            # 一時ファイルを削除
-            os.unlink(tmp_file_path)
-            
-            transcription = response.get('text', '')
+            async with self.limiter.slot(megabytes):
+                result = await self.resilience.call('transcriptions', attempt)
+            transcription = result.get('text', '')
             self.logger.info(f"Transcription completed: {len(transcription)} characters")
             return transcription
-            
+        
+        except (CircuitOpenError, LimiterRejected) as e:
+            self.logger.warning(f"Transcription skipped: {str(e)}")
+            return None
+        
+        except UpstreamError as e:
+            self.logger.error(f"Transcription failed: {str(e)}")
+            return None
+        
         except Exception as e:
             self.logger.error(f"Error transcribing audio: {str(e)}")
-            if 'tmp_file_path' in locals():
-                try:
-                    os.unlink(tmp_file_path)
-                except:
-                    pass
             return None
     
-    def summarize_text(self, text: str, max_length: int = 100) -> Optional[str]:
+    async def _chat_completion(self, messages: List[Dict[str, str]], max_tokens: int,
+                               temperature: float) -> Optional[str]:
+        """ChatCompletion APIを呼び出して応答テキストを返す"""
+        await self.initialize()
+        
+        payload = {
+            'model': 'gpt-3.5-turbo',
+            'messages': messages,
+            'max_tokens': max_tokens,
+            'temperature': temperature
+        }
+        
+        async def attempt() -> Dict[str, Any]:
+            async with self._semaphore:
+                async with self.session.post(
+                    f'{self.base_url}/chat/completions',
+                    headers={'Authorization': f'Bearer {self.api_key}'},
+                    json=payload
+                ) as response:
+                    await raise_for_status(response)
+                    return await response.json()
+        
+        try:
+            result = await self.resilience.call('chat', attempt)
+        except CircuitOpenError as e:
+            self.logger.warning(f"Chat completion skipped: {str(e)}")
+            return None
+        except UpstreamError as e:
+            self.logger.error(f"Chat completion failed: {str(e)}")
+            return None
+        
+        return result['choices'][0]['message']['content'].strip()
+    
+    async def summarize_text(self, text: str, max_length: int = 100) -> Optional[str]:
         """テキストを要約"""
         if not self.api_key:
             self.logger.error("OpenAI API key not configured")
@@ -63,8 +130,7 @@ class OpenAIService:
             return "短いテキストのため要約は不要です。"
         
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
+            summary = await self._chat_completion(
                 messages=[
                     {"role": "system", "content": "あなたは要約の専門家です。日本語のテキストを簡潔に要約してください。"},
                     {"role": "user", "content": f"以下のテキストを{max_length}文字以内で要約してください：\n\n{text}"}
@@ -73,23 +139,22 @@ class OpenAIService:
                 temperature=0.5
             )
             
-            summary = response.choices[0].message['content'].strip()
-            self.logger.info(f"Summary generated: {len(summary)} characters")
+            if summary:
+                self.logger.info(f"Summary generated: {len(summary)} characters")
             return summary
-            
+        
         except Exception as e:
             self.logger.error(f"Error summarizing text: {str(e)}")
             return None
     
-    def translate_text(self, text: str, target_language: str = "English") -> Optional[str]:
+    async def translate_text(self, text: str, target_language: str = "English") -> Optional[str]:
         """テキストを翻訳"""
         if not self.api_key:
             self.logger.error("OpenAI API key not configured")
             return None
         
         try:
-            response = openai.ChatCompletion.create(
-                model="gpt-3.5-turbo",
+            translation = await self._chat_completion(
                 messages=[
                     {"role": "system", "content": f"あなたは翻訳の専門家です。日本語のテキストを{target_language}に翻訳してください。"},
                     {"role": "user", "content": f"以下のテキストを{target_language}に翻訳してください：\n\n{text}"}
@@ -98,10 +163,10 @@ class OpenAIService:
                 temperature=0.3
             )
             
-            translation = response.choices[0].message['content'].strip()
-            self.logger.info(f"Translation completed to {target_language}")
+            if translation:
+                self.logger.info(f"Translation completed to {target_language}")
             return translation
-            
+        
         except Exception as e:
             self.logger.error(f"Error translating text: {str(e)}")
             return None
\ No newline at end of file
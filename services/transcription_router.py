@@ -0,0 +1,199 @@
+import asyncio
+import mimetypes
+import time
+from collections import deque
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Union
+from utils.logger import setup_logger
+from utils.resilience import ReplayableBody
+
+# バックエンド1回分の文字起こし（音声データ, ファイル名, ユーザー情報）
+BackendFunc = Callable[[Union[bytes, BinaryIO], str, Dict[str, str]], Awaitable[Optional[str]]]
+
+class TranscriptionBackend:
+    """文字起こしバックエンドと直近のレイテンシ・エラー率"""
+    
+    def __init__(self, name: str, transcribe: BackendFunc, window_size: int = 200):
+        self.name = name
+        self.transcribe = transcribe
+        self._latencies = deque(maxlen=window_size)
+        self._outcomes = deque(maxlen=window_size)
+        self.requests = 0
+        self.failures = 0
+        self.cancelled = 0
+        self.hedged = 0
+        self.wins = 0
+    
+    def record(self, latency: float, success: Optional[bool]):
+        """1回分の結果を記録（successがNoneの場合は結果が出ていないためレイテンシのみ）"""
+        self._latencies.append(latency)
+        if success is None:
+            self.cancelled += 1
+            return
+        self.requests += 1
+        if not success:
+            self.failures += 1
+        self._outcomes.append(success)
+    
+    @property
+    def samples(self) -> int:
+        return len(self._latencies)
+    
+    @property
+    def completed(self) -> int:
+        """エラー率の計算に含まれる（成否が確定した）リクエスト数"""
+        return len(self._outcomes)
+    
+    def percentile(self, q: float) -> float:
+        """直近のレイテンシのパーセンタイル（秒）"""
+        recent = sorted(self._latencies)
+        return recent[min(len(recent) - 1, int(len(recent) * q))] if recent else 0.0
+    
+    @property
+    def error_rate(self) -> float:
+        """直近のエラー率"""
+        if not self._outcomes:
+            return 0.0
+        return 1 - sum(self._outcomes) / len(self._outcomes)
+    
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'cancelled': self.cancelled,
+            'error_rate': self.error_rate,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'hedged': self.hedged,
+            'wins': self.wins
+        }
+
+class TranscriptionRouter:
+    """複数の文字起こしバックエンドを共通の transcribe_audio で扱うルーター
+    
+    優先バックエンドの応答がそのp95を超えても返らない場合は次のバックエンドへ
+    同じ音声を送り（ヘッジ）、先に返った結果を採用して残りはキャンセルする。
+    失敗した場合は待たずに次のバックエンドへフェイルオーバーする。
+    """
+    
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.primary = settings.get('primary', 'openai')
+        self.hedge = settings.get('hedge', True)
+        # p95が安定するまではこの待ち時間でヘッジする
+        self.min_samples = settings.get('hedge_min_samples', 20)
+        self.default_delay = settings.get('hedge_default_delay_seconds', 15.0)
+        self.min_delay = settings.get('hedge_min_delay_seconds', 1.0)
+        self.window_size = settings.get('window_size', 200)
+        # エラー率がこれを超えたバックエンドは優先順位を下げる
+        self.max_error_rate = settings.get('max_error_rate', 0.5)
+        self.backends: List[TranscriptionBackend] = []
+        self.logger = setup_logger('TranscriptionRouter')
+    
+    def add_backend(self, name: str, transcribe: BackendFunc):
+        """バックエンドを登録"""
+        self.backends.append(TranscriptionBackend(name, transcribe, self.window_size))
+    
+    def ordered_backends(self) -> List[TranscriptionBackend]:
+        """試行順のバックエンド（設定の優先バックエンドを先頭、エラー率の高いものは後ろ）"""
+        def rank(backend: TranscriptionBackend):
+            unhealthy = backend.completed >= self.min_samples and backend.error_rate > self.max_error_rate
+            return (unhealthy, backend.name != self.primary)
+        return sorted(self.backends, key=rank)
+    
+    def hedge_delay(self, backend: TranscriptionBackend) -> float:
+        """ヘッジを送るまでの待ち時間（秒）"""
+        if backend.samples < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, backend.percentile(0.95))
+    
+    async def _attempt(self, backend: TranscriptionBackend, source: ReplayableBody, filename: str,
+                       user_info: Dict[str, str]) -> Optional[str]:
+        """1つのバックエンドで文字起こし"""
+        started = time.monotonic()
+        try:
+            with source.open() as file_data:
+                result = await backend.transcribe(file_data, filename, user_info)
+        except asyncio.CancelledError:
+            # キャンセルまでの時間は実際のレイテンシの下限として記録する
+            # （記録しないと遅いバックエンドのp95が更新されなくなる）。
+            # 成否は分からないためエラー率には含めない
+            backend.record(time.monotonic() - started, None)
+            raise
+        except Exception as e:
+            self.logger.error(f"Backend {backend.name} raised: {str(e)}")
+            result = None
+        
+        backend.record(time.monotonic() - started, result is not None)
+        return result
+    
+    async def transcribe_audio(self, file_data: Union[bytes, BinaryIO], filename: str,
+                               user_info: Optional[Dict[str, str]] = None) -> Optional[str]:
+        """音声ファイルを文字起こし（ヘッジ・フェイルオーバー付き）"""
+        remaining = self.ordered_backends()
+        if not remaining:
+            self.logger.error("No transcription backend configured")
+            return None
+        
+        source = ReplayableBody(file_data)
+        user_info = user_info or {}
+        pending: Dict[asyncio.Task, TranscriptionBackend] = {}
+        
+        def start(backend: TranscriptionBackend) -> TranscriptionBackend:
+            task = asyncio.create_task(self._attempt(backend, source, filename, user_info))
+            pending[task] = backend
+            return backend
+        
+        latest = start(remaining.pop(0))
+        try:
+            while pending:
+                timeout = self.hedge_delay(latest) if self.hedge and remaining else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not done:
+                    # 応答が遅い: 次のバックエンドへ同じ音声を送る
+                    latest = start(remaining.pop(0))
+                    latest.hedged += 1
+                    self.logger.info(f"Hedging {filename} to {latest.name} after {timeout:.1f}s")
+                    continue
+                
+                for task in done:
+                    backend = pending.pop(task)
+                    result = task.result()
+                    if result is not None:
+                        backend.wins += 1
+                        return result
+                    self.logger.warning(f"Backend {backend.name} failed for {filename}")
+                
+                # 失敗: 実行中のものがなければ次のバックエンドへフェイルオーバー
+                if not pending and remaining:
+                    latest = start(remaining.pop(0))
+            
+            self.logger.error(f"All transcription backends failed for {filename}")
+            return None
+        
+        finally:
+            # 負けた（または不要になった）リクエストをキャンセル
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """バックエンドごとのメトリクス"""
+        return {backend.name: backend.metrics() for backend in self.backends}
+
+def openai_backend(service) -> BackendFunc:
+    """OpenAIServiceを共通インターフェースに合わせる"""
+    async def transcribe(file_data: Union[bytes, BinaryIO], filename: str,
+                         user_info: Dict[str, str]) -> Optional[str]:
+        return await service.transcribe_audio(file_data, filename)
+    return transcribe
+
+def dify_backend(service) -> BackendFunc:
+    """DifyServiceを共通インターフェースに合わせる"""
+    async def transcribe(file_data: Union[bytes, BinaryIO], filename: str,
+                         user_info: Dict[str, str]) -> Optional[str]:
+        content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        return await service.transcribe_audio(file_data, filename, content_type, user_info)
+    return transcribe
\ No newline at end of file
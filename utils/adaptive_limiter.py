@@ -0,0 +1,183 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, BinaryIO, Dict, Optional, Union
+from utils.logger import setup_logger
+
+class LimiterRejected(Exception):
+    """同時実行数の空きを待ちきれずに拒否された"""
+
+class _Slot:
+    """実行中の1件（上流から過負荷の応答があったか・結果が得られなかったかを記録）"""
+    
+    def __init__(self, saturated: bool):
+        self.saturated = saturated
+        self.overloaded = False
+        self.failed = False
+
+_current_slot: contextvars.ContextVar[Optional[_Slot]] = contextvars.ContextVar('limiter_slot', default=None)
+
+def report_overload():
+    """実行中の呼び出しで429・5xx・タイムアウトが発生したことを通知（再試行で回復した場合も含む）"""
+    slot = _current_slot.get()
+    if slot is not None:
+        slot.overloaded = True
+
+def report_failure():
+    """実行中の呼び出しが結果を得られずに終わったことを通知
+    
+    エラーを送出せずにNoneを返す呼び出し元で使う。ブレーカーによる即時の失敗などの
+    所要時間は上流のレイテンシではないため、基準レイテンシの計算に含めない。
+    """
+    slot = _current_slot.get()
+    if slot is not None:
+        slot.failed = True
+
+def payload_megabytes(file_data: Union[bytes, BinaryIO]) -> float:
+    """送信する音声のサイズ（MB）。レイテンシを音声の長さで正規化するのに使う"""
+    try:
+        if isinstance(file_data, (bytes, bytearray)):
+            size = len(file_data)
+        else:
+            size = os.fstat(file_data.fileno()).st_size - file_data.tell()
+    except (AttributeError, OSError, ValueError):
+        return 0.0
+    return size / 1024 / 1024
+
+class AdaptiveLimiter:
+    """上流APIの同時実行数をAIMDで調整するリミッター
+    
+    レイテンシが安定している間は上限を加算的に増やし、429・5xx・タイムアウトや
+    レイテンシの急増があれば乗算的に減らす。レイテンシはサイズ（MB）で正規化し、
+    長い音声が遅いことを過負荷と誤認しないようにする。
+    """
+    
+    def __init__(self, name: str, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.name = name
+        self.min_limit = settings.get('min_limit', 1)
+        self.max_limit = settings.get('max_limit', 16)
+        self.limit = float(min(self.max_limit, max(self.min_limit, settings.get('initial_limit', 4))))
+        self.decrease_factor = settings.get('decrease_factor', 0.5)
+        # 正規化レイテンシが基準のこの倍数を超えたら急増とみなす
+        self.latency_tolerance = settings.get('latency_tolerance', 2.0)
+        # 1回の過負荷で何度も減らさないための間隔
+        self.decrease_cooldown = settings.get('decrease_cooldown_seconds', 2.0)
+        # これより小さい音声は固定のオーバーヘッドが大半なので同じ重みで扱う
+        self.min_weight = settings.get('min_weight_mb', 0.25)
+        self.max_wait = settings.get('max_wait_seconds', 60.0)
+        
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self.rejected = 0
+        self.decreases = 0
+        self._last_decrease = 0.0
+        self._waiters = deque()
+        self.logger = setup_logger(f'AdaptiveLimiter.{name}')
+    
+    @property
+    def capacity(self) -> int:
+        return max(self.min_limit, int(self.limit))
+    
+    async def _acquire(self) -> bool:
+        """空きを待って1件分を確保（上限まで使っている状態ならTrue）"""
+        if self.in_flight < self.capacity and not self._waiters:
+            self.in_flight += 1
+            return self.in_flight >= self.capacity
+        
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self.rejected += 1
+            raise LimiterRejected(f"{self.name}: no slot within {self.max_wait:.0f}s (limit {self.capacity})")
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        return True
+    
+    def _abandon(self, waiter: asyncio.Future):
+        """待機をやめる（すでに枠を受け取っていれば返す）"""
+        if waiter.done() and not waiter.cancelled():
+            self._release()
+            return
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+    
+    def _release(self):
+        self.in_flight -= 1
+        self._wake()
+    
+    def _wake(self):
+        """上限に空きがあれば待機中の呼び出しに枠を渡す"""
+        while self._waiters and self.in_flight < self.capacity:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+    
+    def _decrease(self, reason: str):
+        now = time.monotonic()
+        if now - self._last_decrease < self.decrease_cooldown:
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        previous = self.capacity
+        self.limit = max(float(self.min_limit), self.limit * self.decrease_factor)
+        self.logger.info(f"Concurrency {previous} -> {self.capacity} ({reason})")
+    
+    def _on_success(self, latency: float, slot: _Slot):
+        if self.baseline is None:
+            self.baseline = latency
+            return
+        
+        baseline = self.baseline
+        # 急増時も少しずつ追従し、上流が恒常的に遅くなった場合に減らし続けないようにする
+        self.baseline += (latency - baseline) * 0.05
+        if latency > baseline * self.latency_tolerance:
+            self._decrease(f"latency {latency:.2f}s/MB vs {baseline:.2f}s/MB")
+            return
+        
+        # 上限まで使っていたときだけ増やす（約1往復ごとに+1）
+        if slot.saturated and self.limit < self.max_limit:
+            previous = self.capacity
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            if self.capacity != previous:
+                self._wake()
+    
+    @asynccontextmanager
+    async def slot(self, megabytes: float = 0.0) -> AsyncIterator[None]:
+        """上流への1回の呼び出しを囲む（上限に達していれば空きを待つ）"""
+        slot = _Slot(await self._acquire())
+        token = _current_slot.set(slot)
+        started = time.monotonic()
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            _current_slot.reset(token)
+            self._release()
+            if slot.overloaded:
+                self._decrease("upstream overloaded")
+            elif completed and not slot.failed:
+                self._on_success((time.monotonic() - started) / max(megabytes, self.min_weight), slot)
+    
+    def metrics(self) -> Dict[str, Any]:
+        """現在の上限・実行中・待機中・拒否数"""
+        return {
+            'limit': self.capacity,
+            'in_flight': self.in_flight,
+            'waiting': len(self._waiters),
+            'rejected': self.rejected,
+            'decreases': self.decreases,
+            'baseline': self.baseline or 0.0
+        }
\ No newline at end of file
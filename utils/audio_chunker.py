@@ -0,0 +1,190 @@
+import asyncio
+import io
+import os
+import shutil
+import wave
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
+from utils.downloader import AudioFile
+from utils.logger import setup_logger
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.1
+# これより短い一致は偶然とみなして重複除去しない
+MIN_OVERLAP_CHARS = 4
+
+# 1リクエスト分の文字起こし関数（音声データ, ファイル名）
+TranscribeFunc = Callable[[Union[bytes, BinaryIO], str], Awaitable[Optional[str]]]
+
+class AudioChunker:
+    """長い音声を無音区間で分割し、並列に文字起こしして結合する
+    
+    デコードにはffmpegを使用する。ffmpegがない環境では分割せずに
+    1回のリクエストで文字起こしする。
+    """
+    
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.enabled = settings.get('enabled', True)
+        # このサイズ以下のファイルはデコードせずにそのまま送信
+        self.min_file_size = settings.get('min_file_size_mb', 1) * 1024 * 1024
+        # APIのアップロード上限（これを超える場合は必ず分割）
+        self.max_upload_size = settings.get('max_upload_size_mb', 25) * 1024 * 1024
+        self.chunk_seconds = settings.get('chunk_seconds', 120)
+        self.overlap_seconds = settings.get('overlap_seconds', 2.0)
+        self.search_seconds = settings.get('silence_search_seconds', 10.0)
+        self.max_parallel = settings.get('max_parallel', 4)
+        self.max_overlap_chars = settings.get('max_overlap_chars', 80)
+        # 境界で途切れた語の揺れとして読み飛ばす文字数（前後のチャンクの端から）
+        self.overlap_slack_chars = settings.get('overlap_slack_chars', 8)
+        self.ffmpeg = shutil.which('ffmpeg')
+        self.logger = setup_logger('AudioChunker')
+        
+        if self.enabled and not self.ffmpeg:
+            self.logger.warning("ffmpeg not found, long audio will be sent without chunking")
+    
+    async def transcribe(self, audio: AudioFile, transcribe: TranscribeFunc) -> Optional[str]:
+        """必要に応じて分割して文字起こし"""
+        if not self.enabled or not self.ffmpeg or audio.size <= self.min_file_size:
+            return await self._transcribe_whole(audio, transcribe)
+        
+        # ヘッダーから長さが分かり、分割不要な場合はデコードしない
+        if (audio.duration is not None and audio.duration <= self.chunk_seconds * 1.5
+                and audio.size <= self.max_upload_size):
+            return await self._transcribe_whole(audio, transcribe)
+        
+        samples = await self.decode(audio.path)
+        if samples is None:
+            return await self._transcribe_whole(audio, transcribe)
+        
+        loop = asyncio.get_running_loop()
+        boundaries = await loop.run_in_executor(None, self.split, samples)
+        if len(boundaries) == 1 and audio.size <= self.max_upload_size:
+            return await self._transcribe_whole(audio, transcribe)
+        
+        duration = len(samples) / SAMPLE_RATE
+        self.logger.info(f"Split {audio.filename} ({duration:.0f}s) into {len(boundaries)} chunks")
+        
+        stem = os.path.splitext(audio.filename)[0]
+        semaphore = asyncio.Semaphore(self.max_parallel)
+        
+        async def transcribe_chunk(index: int, start: int, end: int) -> Optional[str]:
+            async with semaphore:
+                # WAVへのエンコードは送信直前に行い、同時に保持するチャンクを減らす
+                chunk = self.encode_wav(samples[start:end])
+                return await transcribe(chunk, f"{stem}_part{index + 1}.wav")
+        
+        texts = await asyncio.gather(*[
+            transcribe_chunk(i, start, end) for i, (start, end) in enumerate(boundaries)
+        ])
+        
+        if any(text is None for text in texts):
+            self.logger.error(f"Chunked transcription failed for {audio.filename}")
+            return None
+        
+        return self.stitch(texts)
+    
+    async def _transcribe_whole(self, audio: AudioFile, transcribe: TranscribeFunc) -> Optional[str]:
+        """分割せずに1回のリクエストで文字起こし"""
+        with audio.open() as f:
+            return await transcribe(f, audio.filename)
+    
+    async def decode(self, path: str) -> Optional[np.ndarray]:
+        """ffmpegで16kHzモノラルのPCMにデコード"""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                self.ffmpeg, '-nostdin', '-loglevel', 'error', '-i', path,
+                '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1',
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+            if process.returncode != 0:
+                self.logger.error(f"ffmpeg decode failed: {stderr.decode(errors='ignore')[:200]}")
+                return None
+            
+            return np.frombuffer(stdout, dtype=np.int16)
+        
+        except Exception as e:
+            self.logger.error(f"Error decoding audio: {str(e)}")
+            return None
+    
+    def split(self, samples: np.ndarray) -> List[Tuple[int, int]]:
+        """無音に近い位置で区切り、前後にオーバーラップを付けた区間を返す"""
+        total = len(samples)
+        chunk = int(self.chunk_seconds * SAMPLE_RATE)
+        if total <= chunk * 1.5:
+            return [(0, total)]
+        
+        # 100msごとのRMS（音量）
+        frame = int(FRAME_SECONDS * SAMPLE_RATE)
+        frame_count = total // frame
+        frames = samples[:frame_count * frame].astype(np.float32).reshape(frame_count, frame)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+        
+        # 目標位置の前後で最も静かなフレームを区切りにする
+        cuts = [0]
+        search = int(self.search_seconds / FRAME_SECONDS)
+        while total - cuts[-1] > chunk * 1.5:
+            target = (cuts[-1] + chunk) // frame
+            low = max(target - search, cuts[-1] // frame + 1)
+            high = min(target + search, frame_count)
+            quietest = low + int(np.argmin(rms[low:high]))
+            cuts.append(quietest * frame + frame // 2)
+        cuts.append(total)
+        
+        overlap = int(self.overlap_seconds * SAMPLE_RATE)
+        return [
+            (max(0, start - overlap), min(total, end + overlap))
+            for start, end in zip(cuts, cuts[1:])
+        ]
+    
+    @staticmethod
+    def encode_wav(samples: np.ndarray) -> bytes:
+        """PCMをWAVにエンコード"""
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            w.writeframes(samples.tobytes())
+        return buffer.getvalue()
+    
+    def stitch(self, texts: List[str]) -> str:
+        """チャンクごとの文字起こしを結合（オーバーラップ部分の重複を除去）
+        
+        重複とみなすのは前のチャンクの末尾と次のチャンクの先頭が一致する場合だけ。
+        境界で途切れた語の揺れを許すため、両端からoverlap_slack_chars文字までの
+        ずれは認める。チャンクの途中で同じ言い回しが繰り返されても本文は削らず、
+        一致が見つからなければそのまま連結する。
+        """
+        result = texts[0].strip()
+        for text in texts[1:]:
+            text = text.strip()
+            overlap = self._find_overlap(result, text)
+            if overlap:
+                tail_skip, head_skip, length = overlap
+                result = result[:len(result) - tail_skip] + text[head_skip + length:]
+            else:
+                result += text
+        return result
+    
+    def _find_overlap(self, previous: str, text: str) -> Optional[Tuple[int, int, int]]:
+        """前のチャンクの末尾と次のチャンクの先頭の重複を探す
+        
+        (前のチャンク末尾で捨てる文字数, 次のチャンク先頭で捨てる文字数, 重複の長さ) を返す。
+        最も長い重複を優先し、同じ長さなら端からのずれが小さいものを選ぶ。
+        """
+        slack = self.overlap_slack_chars
+        longest = min(self.max_overlap_chars, len(previous), len(text))
+        for length in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+            candidates = sorted(
+                (tail_skip + head_skip, tail_skip, head_skip)
+                for tail_skip in range(min(slack, len(previous) - length) + 1)
+                for head_skip in range(min(slack, len(text) - length) + 1)
+            )
+            for _, tail_skip, head_skip in candidates:
+                end = len(previous) - tail_skip
+                if previous[end - length:end] == text[head_skip:head_skip + length]:
+                    return tail_skip, head_skip, length
+        return None
\ No newline at end of file
@@ -0,0 +1,279 @@
+import asyncio
+import multiprocessing
+import os
+import shutil
+import subprocess
+import tempfile
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from utils.audio_probe import probe_file
+from utils.downloader import AudioFile
+from utils.logger import setup_logger
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+
+def _speech_segments(samples: np.ndarray, threshold_db: float, padding: float,
+                     max_silence: float) -> List[Tuple[int, int]]:
+    """フレームごとのエネルギーで音声区間を検出し、残す区間を返す"""
+    frame = int(FRAME_SECONDS * SAMPLE_RATE)
+    frame_count = len(samples) // frame
+    if frame_count == 0:
+        return [(0, len(samples))]
+    
+    frames = samples[:frame_count * frame].astype(np.float32).reshape(frame_count, frame) / 32768.0
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    
+    # 背景ノイズ（下位10%）より十分大きいフレームを音声とみなす
+    # （無音区間がない音声で全体が除去されないよう、しきい値の上限は threshold_db + 20dB）
+    noise_floor = np.percentile(energy_db, 10)
+    speech = energy_db > max(threshold_db, min(noise_floor + 10, threshold_db + 20))
+    if not speech.any():
+        return []
+    
+    # 前後にパディングを付けて語頭・語尾を削らないようにする
+    pad = int(padding / FRAME_SECONDS)
+    if pad:
+        speech = np.convolve(speech, np.ones(2 * pad + 1), mode='same') > 0
+    
+    # 連続する音声フレームを区間にまとめ、長い無音は max_silence まで詰める
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    segments = []
+    keep_gap = int(max_silence / FRAME_SECONDS)
+    for start, end in zip(starts, ends):
+        if segments and start - segments[-1][1] <= keep_gap:
+            segments[-1] = (segments[-1][0], end)
+        else:
+            if segments:
+                # 詰めた無音の代わりに前の区間の後ろへ max_silence 分を残す
+                segments[-1] = (segments[-1][0], min(segments[-1][1] + keep_gap, start))
+            segments.append((start, end))
+    
+    last = len(samples)
+    return [(start * frame, min(end * frame, last)) for start, end in segments]
+
+def time_stretch(samples: np.ndarray, speed: float) -> np.ndarray:
+    """WSOLAで音程を変えずに再生速度を上げる
+    
+    40msの窓を50%重ねて並べ直し、各窓の読み出し位置を前の窓の自然な続きと
+    最も相関が高い位置（±8ms）に合わせることで位相のずれによる濁りを抑える。
+    """
+    frame = int(0.04 * SAMPLE_RATE)
+    hop_out = frame // 2
+    hop_in = hop_out * speed
+    tolerance = int(0.008 * SAMPLE_RATE)
+    # 相関の探索は1/4に間引いた信号で行う
+    step = 4
+    
+    x = np.concatenate([
+        samples.astype(np.float32),
+        np.zeros(frame + 2 * tolerance + hop_out, dtype=np.float32)
+    ])
+    frame_count = int(len(samples) / hop_in)
+    window = np.hanning(frame).astype(np.float32)
+    out = np.zeros(frame_count * hop_out + frame, dtype=np.float32)
+    norm = np.zeros_like(out)
+    
+    position = 0
+    for k in range(frame_count):
+        if k:
+            nominal = max(int(k * hop_in), tolerance)
+            template = x[position + hop_out:position + hop_out + frame:step]
+            region = x[nominal - tolerance:nominal + tolerance + frame:step]
+            offset = int(np.argmax(np.correlate(region, template, mode='valid')))
+            position = nominal - tolerance + offset * step
+        
+        out_start = k * hop_out
+        out[out_start:out_start + frame] += x[position:position + frame] * window
+        norm[out_start:out_start + frame] += window
+    
+    out = out[:int(len(samples) / speed)] / np.maximum(norm[:int(len(samples) / speed)], 1e-3)
+    return np.clip(out, -32768, 32767).astype(np.int16)
+
+def _decode(ffmpeg: str, path: str) -> Optional[np.ndarray]:
+    """ffmpegでモノラル16kHzのPCMにデコード（ダウンミックス・リサンプルを含む）"""
+    decoded = subprocess.run(
+        [ffmpeg, '-nostdin', '-loglevel', 'error', '-i', path,
+         '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), 'pipe:1'],
+        capture_output=True
+    )
+    if decoded.returncode != 0:
+        return None
+    return np.frombuffer(decoded.stdout, dtype=np.int16)
+
+def preprocess_audio(ffmpeg: str, src_path: str, options: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """デコード・無音の除去・時間圧縮・再エンコードを行う（プロセスプールで実行）"""
+    samples = _decode(ffmpeg, src_path)
+    if samples is None:
+        return None
+    
+    trimmed = samples
+    if options['trim_silence']:
+        segments = _speech_segments(
+            samples,
+            threshold_db=options['silence_threshold_db'],
+            padding=options['padding_seconds'],
+            max_silence=options['max_silence_seconds']
+        )
+        if not segments:
+            return None
+        trimmed = np.concatenate([samples[start:end] for start, end in segments])
+    
+    if options['speed'] > 1.0:
+        trimmed = time_stretch(trimmed, options['speed'])
+    
+    # Opusで圧縮して保存（エンコーダーがない場合はWAV）
+    fd, dst_path = tempfile.mkstemp(prefix='voice_pre_', suffix='.ogg')
+    os.close(fd)
+    encoded = subprocess.run(
+        [ffmpeg, '-nostdin', '-loglevel', 'error', '-y',
+         '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-i', 'pipe:0',
+         '-c:a', 'libopus', '-b:a', f"{options['bitrate_kbps']}k", '-application', 'voip', dst_path],
+        input=trimmed.tobytes(),
+        capture_output=True
+    )
+    content_type = 'audio/ogg'
+    if encoded.returncode != 0:
+        os.remove(dst_path)
+        fd, dst_path = tempfile.mkstemp(prefix='voice_pre_', suffix='.wav')
+        with os.fdopen(fd, 'wb') as f, wave.open(f, 'wb') as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(SAMPLE_RATE)
+            w.writeframes(trimmed.tobytes())
+        content_type = 'audio/wav'
+    
+    return {
+        'path': dst_path,
+        'content_type': content_type,
+        'original_seconds': len(samples) / SAMPLE_RATE,
+        'processed_seconds': len(trimmed) / SAMPLE_RATE,
+        'processed_bytes': os.path.getsize(dst_path),
+        'speed': options['speed']
+    }
+
+class AudioPreprocessor:
+    """文字起こし前の音声前処理（無音の除去・時間圧縮・モノラル16kHz化・圧縮）
+    
+    処理はCPUを使うため別プロセスで実行し、イベントループをブロックしない。
+    """
+    
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.trim_silence = settings.get('trim_silence', False)
+        self.workers = settings.get('workers', 2)
+        self.min_saved_seconds = settings.get('min_saved_seconds', 1.0)
+        
+        # 時間圧縮の倍率（ギルドごとに上書き可能、1.0で無効）
+        self.speed = self._clamp_speed(settings.get('speed', 1.0))
+        self.guild_speeds = {
+            str(guild_id): self._clamp_speed(speed)
+            for guild_id, speed in settings.get('guild_speeds', {}).items()
+        }
+        self.speed_min_duration = settings.get('speed_min_duration_seconds', 60)
+        
+        self.enabled = self.trim_silence or self.speed > 1.0 or any(
+            speed > 1.0 for speed in self.guild_speeds.values()
+        )
+        self.options = {
+            'silence_threshold_db': settings.get('silence_threshold_db', -45.0),
+            'padding_seconds': settings.get('padding_seconds', 0.2),
+            'max_silence_seconds': settings.get('max_silence_seconds', 0.8),
+            'bitrate_kbps': settings.get('bitrate_kbps', 24)
+        }
+        self.ffmpeg = shutil.which('ffmpeg')
+        self.logger = setup_logger('AudioPreprocessor')
+        self._executor = None
+        
+        # メトリクス
+        self.processed = 0
+        self.saved_bytes = 0
+        self.saved_seconds = 0.0
+        
+        if self.enabled and not self.ffmpeg:
+            self.logger.warning("ffmpeg not found, audio preprocessing is disabled")
+            self.enabled = False
+    
+    @staticmethod
+    def _clamp_speed(speed: float) -> float:
+        """倍率を 1.0（無効）〜1.5 に制限（速すぎると認識精度が落ちる）"""
+        return 1.0 if speed <= 1.0 else min(speed, 1.5)
+    
+    def speed_for(self, guild_id: Optional[int], duration: Optional[float]) -> float:
+        """ギルドと音声の長さから時間圧縮の倍率を決める（短い音声は圧縮しない）"""
+        if duration is None or duration < self.speed_min_duration:
+            return 1.0
+        return self.guild_speeds.get(str(guild_id), self.speed)
+    
+    def close(self):
+        """プロセスプールを停止"""
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+    
+    async def process(self, audio: AudioFile, speed: float = 1.0) -> Optional[AudioFile]:
+        """前処理済みの音声を返す（無効・失敗・効果がない場合はNone）"""
+        if not self.enabled or (not self.trim_silence and speed <= 1.0):
+            return None
+        
+        if not self._executor:
+            # スレッドを持つプロセスからのforkを避けるためspawnで起動
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(
+                self._executor, preprocess_audio, self.ffmpeg, audio.path,
+                dict(self.options, trim_silence=self.trim_silence, speed=speed)
+            )
+        except Exception as e:
+            self.logger.error(f"Error preprocessing {audio.filename}: {str(e)}")
+            return None
+        
+        if result is None:
+            return None
+        
+        saved_bytes = audio.size - result['processed_bytes']
+        saved_seconds = result['original_seconds'] - result['processed_seconds']
+        
+        # 時間も容量もほとんど減らない場合は元の音声を使う
+        if saved_seconds < self.min_saved_seconds and saved_bytes <= 0:
+            os.remove(result['path'])
+            return None
+        
+        self.processed += 1
+        self.saved_bytes += saved_bytes
+        self.saved_seconds += saved_seconds
+        self.logger.info(
+            f"Preprocessed {audio.filename} (x{result['speed']:.2f}): "
+            f"{result['original_seconds']:.1f}s -> {result['processed_seconds']:.1f}s ({saved_seconds:+.1f}s saved), "
+            f"{audio.size / 1024:.1f}KB -> {result['processed_bytes'] / 1024:.1f}KB ({saved_bytes / 1024:+.1f}KB saved)"
+        )
+        
+        stem = os.path.splitext(audio.filename)[0]
+        extension = os.path.splitext(result['path'])[1]
+        return AudioFile(
+            path=result['path'],
+            filename=f"{stem}{extension}",
+            content_type=result['content_type'],
+            size=result['processed_bytes'],
+            # キャッシュキーは元の音声のハッシュのまま
+            digest=audio.digest,
+            info=probe_file(result['path'])
+        )
+    
+    def metrics(self) -> Dict[str, Any]:
+        """メトリクスを取得"""
+        return {
+            'processed': self.processed,
+            'saved_bytes': self.saved_bytes,
+            'saved_seconds': self.saved_seconds
+        }
\ No newline at end of file
@@ -0,0 +1,437 @@
+import os
+import struct
+from typing import Callable, NamedTuple, Optional, Tuple
+
+# ファイル先頭・末尾から読み込むバイト数
+PROBE_BYTES = 64 * 1024
+
+class AudioInfo(NamedTuple):
+    """デコードせずにコンテナのヘッダーから得た音声情報"""
+    duration_us: Optional[int]
+    codec: str
+    sample_rate: int
+    channels: int
+    
+    @property
+    def duration(self) -> Optional[float]:
+        """再生時間（秒）"""
+        return self.duration_us / 1_000_000 if self.duration_us is not None else None
+
+class ProbeReader:
+    """任意の位置からバイト列を読み出す（範囲外は短いバイト列を返す）"""
+    
+    def __init__(self, read: Callable[[int, int], bytes], size: int, tail: Optional[bytes] = None):
+        self._read = read
+        self._tail = tail
+        self.size = size
+    
+    @classmethod
+    def from_parts(cls, head: bytes, tail: bytes, size: int) -> 'ProbeReader':
+        """先頭・末尾のバイト列だけから読み出す（中間部分は読めない）"""
+        tail_start = size - len(tail)
+        
+        def read(offset: int, length: int) -> bytes:
+            if offset < len(head):
+                return head[offset:offset + length]
+            if offset >= tail_start:
+                return tail[offset - tail_start:offset - tail_start + length]
+            return b''
+        
+        return cls(read, size, tail)
+    
+    def read(self, offset: int, length: int) -> bytes:
+        if offset < 0 or offset >= self.size:
+            return b''
+        return self._read(offset, length)
+    
+    def read_tail(self, length: int) -> bytes:
+        """末尾のバイト列を読み出す（末尾だけを持つ場合はその範囲のみ）"""
+        if self._tail is not None:
+            return self._tail[-length:]
+        start = max(0, self.size - length)
+        return self.read(start, self.size - start)
+
+def probe_file(path: str) -> Optional[AudioInfo]:
+    """ファイルのヘッダー・末尾だけを読んで音声情報を取得"""
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            
+            def read(offset: int, length: int) -> bytes:
+                f.seek(offset)
+                return f.read(length)
+            
+            return probe(ProbeReader(read, size))
+    except OSError:
+        return None
+
+def probe_bytes(head: bytes, tail: bytes, size: int) -> Optional[AudioInfo]:
+    """先頭・末尾のバイト列とファイルサイズから音声情報を取得"""
+    return probe(ProbeReader.from_parts(head, tail, size))
+
+def probe(reader: ProbeReader) -> Optional[AudioInfo]:
+    """先頭のマジックナンバーからコンテナを判定して解析"""
+    head = reader.read(0, 12)
+    try:
+        if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+            return _probe_wav(reader)
+        if head[:4] == b'OggS':
+            return _probe_ogg(reader)
+        if head[4:8] == b'ftyp':
+            return _probe_mp4(reader)
+        if head[:4] == b'\x1a\x45\xdf\xa3':
+            return _probe_webm(reader)
+        if head[:3] == b'ID3' or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0):
+            return _probe_mp3(reader)
+    except (struct.error, IndexError, ValueError, ZeroDivisionError):
+        pass
+    return None
+
+# ---- WAV ----
+
+WAV_CODECS = {1: 'pcm', 3: 'pcm_float', 6: 'alaw', 7: 'mulaw', 0xFFFE: 'pcm'}
+
+def _probe_wav(reader: ProbeReader) -> Optional[AudioInfo]:
+    """RIFFチャンクを順に読み、fmt と data のサイズから再生時間を求める"""
+    offset = 12
+    fmt = None
+    while offset + 8 <= reader.size:
+        header = reader.read(offset, 8)
+        if len(header) < 8:
+            break
+        chunk_id, chunk_size = header[:4], struct.unpack('<I', header[4:])[0]
+        
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack('<HHIIHH', reader.read(offset + 8, 16))
+        elif chunk_id == b'data' and fmt:
+            format_tag, channels, sample_rate, byte_rate = fmt[:4]
+            # ストリーミング書き出しでサイズが未確定の場合はファイル末尾まで
+            data_size = min(chunk_size, reader.size - offset - 8)
+            duration_us = data_size * 1_000_000 // byte_rate if byte_rate else None
+            codec = WAV_CODECS.get(format_tag, f'wav_0x{format_tag:04x}')
+            return AudioInfo(duration_us, codec, sample_rate, channels)
+        
+        offset += 8 + chunk_size + (chunk_size & 1)
+    return None
+
+# ---- Ogg ----
+
+def _probe_ogg(reader: ProbeReader) -> Optional[AudioInfo]:
+    """先頭ページのコーデックヘッダーと最終ページのグラニュール位置から再生時間を求める"""
+    first = reader.read(0, 27)
+    serial = first[14:18]
+    segment_count = first[26]
+    packet = reader.read(27 + segment_count, 64)
+    
+    if packet[:8] == b'OpusHead':
+        channels = packet[9]
+        pre_skip = struct.unpack('<H', packet[10:12])[0]
+        input_rate = struct.unpack('<I', packet[12:16])[0]
+        # Opusのグラニュール位置は常に48kHz単位
+        codec, granule_rate, skip, sample_rate = 'opus', 48000, pre_skip, input_rate or 48000
+    elif packet[:7] == b'\x01vorbis':
+        channels = packet[11]
+        sample_rate = struct.unpack('<I', packet[12:16])[0]
+        codec, granule_rate, skip = 'vorbis', sample_rate, 0
+    elif packet[:5] == b'\x7fFLAC':
+        # FLAC-in-Ogg: STREAMINFOはマッピングヘッダー(13バイト)の後
+        info = packet[17:35]
+        bits = int.from_bytes(info[10:14], 'big')
+        sample_rate = bits >> 12
+        channels = ((bits >> 9) & 0x7) + 1
+        codec, granule_rate, skip = 'flac', sample_rate, 0
+    else:
+        return None
+    
+    # 末尾から同じストリームの最後のページを探す
+    tail = reader.read_tail(PROBE_BYTES)
+    position = len(tail)
+    while True:
+        position = tail.rfind(b'OggS', 0, position)
+        if position < 0:
+            return AudioInfo(None, codec, sample_rate, channels)
+        page = tail[position:position + 27]
+        if len(page) == 27 and page[4] == 0 and page[14:18] == serial:
+            granule = struct.unpack('<q', page[6:14])[0]
+            if granule >= 0:
+                duration_us = max(0, granule - skip) * 1_000_000 // granule_rate
+                return AudioInfo(duration_us, codec, sample_rate, channels)
+
+# ---- MP3 ----
+
+MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 2.5: [11025, 12000, 8000]}
+
+def _parse_mp3_frame(header: bytes) -> Optional[Tuple[float, int, int, int, int, int]]:
+    """フレームヘッダーを解析して(バージョン, レイヤー, ビットレート, サンプルレート, チャンネル数, フレーム長)を返す"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = {3: 1, 2: 2, 0: 2.5}.get((header[1] >> 3) & 0x3)
+    layer = {3: 1, 2: 2, 1: 3}.get((header[1] >> 1) & 0x3)
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 0x3
+    if version is None or layer is None or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    
+    bitrate = MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    padding = (header[2] >> 1) & 0x1
+    channels = 1 if header[3] >> 6 == 3 else 2
+    
+    if layer == 1:
+        length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        length = (144 if version == 1 or layer == 2 else 72) * bitrate // sample_rate + padding
+    return version, layer, bitrate, sample_rate, channels, length
+
+def _probe_mp3(reader: ProbeReader) -> Optional[AudioInfo]:
+    """Xing/VBRIヘッダーのフレーム数、なければ先頭フレーム群の平均ビットレートから再生時間を求める"""
+    # ID3v2タグを読み飛ばす
+    start = 0
+    header = reader.read(0, 10)
+    if header[:3] == b'ID3':
+        size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        start = 10 + size + (10 if header[5] & 0x10 else 0)
+    
+    # 最初のフレーム同期を探す
+    data = reader.read(start, PROBE_BYTES)
+    position = 0
+    frame = None
+    while position < len(data) - 4:
+        frame = _parse_mp3_frame(data[position:position + 4])
+        if frame:
+            break
+        position = data.find(b'\xff', position + 1)
+        if position < 0:
+            return None
+    if not frame:
+        return None
+    
+    version, layer, bitrate, sample_rate, channels, length = frame
+    samples_per_frame = 384 if layer == 1 else (1152 if version == 1 or layer == 2 else 576)
+    
+    # Xing/Info ヘッダー（サイド情報の直後）
+    side_info = (32 if channels == 2 else 17) if version == 1 else (17 if channels == 2 else 9)
+    xing = data[position + 4 + side_info:position + 4 + side_info + 12]
+    frames = None
+    if xing[:4] in (b'Xing', b'Info') and struct.unpack('>I', xing[4:8])[0] & 0x1:
+        frames = struct.unpack('>I', xing[8:12])[0]
+    
+    # VBRI ヘッダー（フレームヘッダーから32バイト後）
+    vbri = data[position + 36:position + 54]
+    if frames is None and vbri[:4] == b'VBRI':
+        frames = struct.unpack('>I', vbri[14:18])[0]
+    
+    codec = f'mp{layer}'
+    if frames is not None:
+        duration_us = frames * samples_per_frame * 1_000_000 // sample_rate
+        return AudioInfo(duration_us, codec, sample_rate, channels)
+    
+    # ヘッダーがない場合は読み込んだ範囲のフレームを辿って平均ビットレートを求める
+    total_bits = 0
+    total_frames = 0
+    while frame and position + frame[5] <= len(data):
+        total_bits += frame[5] * 8
+        total_frames += 1
+        position += frame[5]
+        frame = _parse_mp3_frame(data[position:position + 4])
+    
+    if not total_frames:
+        return AudioInfo(None, codec, sample_rate, channels)
+    
+    average_bitrate = total_bits * sample_rate / (total_frames * samples_per_frame)
+    audio_bytes = reader.size - start
+    if reader.read(reader.size - 128, 3) == b'TAG':
+        audio_bytes -= 128
+    duration_us = int(audio_bytes * 8 * 1_000_000 / average_bitrate)
+    return AudioInfo(duration_us, codec, sample_rate, channels)
+
+# ---- MP4 / M4A ----
+
+MP4_CONTAINERS = (b'moov', b'trak', b'mdia', b'minf', b'stbl')
+
+def _mp4_boxes(reader: ProbeReader, start: int, end: int):
+    """指定範囲のボックスを(種類, データ開始位置, 終了位置)で列挙"""
+    offset = start
+    while offset + 8 <= end:
+        header = reader.read(offset, 16)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>I', header[:4])[0], header[4:8]
+        data_start = offset + 8
+        if size == 1:
+            if len(header) < 16:
+                return
+            size = struct.unpack('>Q', header[8:16])[0]
+            data_start = offset + 16
+        elif size == 0:
+            size = end - offset
+        if size < 8:
+            return
+        yield box_type, data_start, offset + size
+        offset += size
+
+def _probe_mp4(reader: ProbeReader) -> Optional[AudioInfo]:
+    """moov/mvhd のタイムスケールと長さ、stsd のサンプルエントリーから情報を求める"""
+    moov = next(((s, e) for t, s, e in _mp4_boxes(reader, 0, reader.size) if t == b'moov'), None)
+    if not moov:
+        return None
+    
+    duration_us = None
+    codec, sample_rate, channels = 'unknown', 0, 0
+    
+    stack = [moov]
+    while stack:
+        start, end = stack.pop()
+        for box_type, data_start, box_end in _mp4_boxes(reader, start, end):
+            if box_type == b'mvhd':
+                data = reader.read(data_start, 32)
+                if data[0] == 1:
+                    timescale, duration = struct.unpack('>IQ', data[20:32])
+                else:
+                    timescale, duration = struct.unpack('>II', data[12:20])
+                if timescale:
+                    duration_us = duration * 1_000_000 // timescale
+            elif box_type == b'stsd' and codec == 'unknown':
+                # フルボックスヘッダー(4) + エントリー数(4) の後に最初のサンプルエントリー
+                entry = reader.read(data_start + 8, 36)
+                entry_type = entry[4:8]
+                if entry_type in (b'mp4a', b'alac', b'Opus', b'fLaC', b'ac-3', b'ec-3'):
+                    codec = 'aac' if entry_type == b'mp4a' else entry_type.decode('ascii').lower()
+                    channels = struct.unpack('>H', entry[24:26])[0]
+                    sample_rate = struct.unpack('>I', entry[32:36])[0] >> 16
+            elif box_type in MP4_CONTAINERS:
+                stack.append((data_start, box_end))
+    
+    return AudioInfo(duration_us, codec, sample_rate, channels)
+
+# ---- WebM / Matroska ----
+
+EBML_SEGMENT = 0x18538067
+EBML_INFO = 0x1549A966
+EBML_TRACKS = 0x1654AE6B
+EBML_TRACK_ENTRY = 0xAE
+EBML_AUDIO = 0xE1
+EBML_CLUSTER = 0x1F43B675
+EBML_UNKNOWN_SIZE = -1
+
+def _ebml_vint(data: bytes, offset: int, keep_marker: bool) -> Tuple[int, int]:
+    """可変長整数を読み、(値, 次の位置)を返す"""
+    first = data[offset]
+    length = 8 - first.bit_length() + 1
+    if length > 8:
+        raise ValueError('invalid vint')
+    value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+    for byte in data[offset + 1:offset + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = EBML_UNKNOWN_SIZE
+    return value, offset + length
+
+def _ebml_elements(data: bytes, start: int, end: int):
+    """指定範囲の要素を(ID, データ開始位置, データサイズ)で列挙"""
+    offset = start
+    while offset < min(end, len(data)) - 1:
+        element_id, offset = _ebml_vint(data, offset, keep_marker=True)
+        size, offset = _ebml_vint(data, offset, keep_marker=False)
+        yield element_id, offset, size
+        if size == EBML_UNKNOWN_SIZE:
+            return
+        offset += size
+
+def _ebml_uint(data: bytes) -> int:
+    return int.from_bytes(data, 'big')
+
+def _ebml_float(data: bytes) -> float:
+    return struct.unpack('>f' if len(data) == 4 else '>d', data)[0]
+
+def _probe_webm(reader: ProbeReader) -> Optional[AudioInfo]:
+    """Segment/Info の Duration と Tracks の音声情報を読む（Durationがなければ最後のClusterから推定）"""
+    data = reader.read(0, PROBE_BYTES)
+    timecode_scale = 1_000_000
+    duration = None
+    codec, sample_rate, channels = 'unknown', 0, 0
+    
+    segment = None
+    for element_id, start, size in _ebml_elements(data, 0, len(data)):
+        if element_id == EBML_SEGMENT:
+            segment = (start, len(data) if size == EBML_UNKNOWN_SIZE else start + size)
+            break
+    if not segment:
+        return None
+    
+    for element_id, start, size in _ebml_elements(data, *segment):
+        end = start + size
+        if element_id == EBML_INFO:
+            for child_id, child_start, child_size in _ebml_elements(data, start, end):
+                value = data[child_start:child_start + child_size]
+                if child_id == 0x2AD7B1:
+                    timecode_scale = _ebml_uint(value)
+                elif child_id == 0x4489:
+                    duration = _ebml_float(value)
+        elif element_id == EBML_TRACKS:
+            for entry_id, entry_start, entry_size in _ebml_elements(data, start, end):
+                if entry_id != EBML_TRACK_ENTRY or codec != 'unknown':
+                    continue
+                track_codec, track_audio = None, None
+                for child_id, child_start, child_size in _ebml_elements(data, entry_start, entry_start + entry_size):
+                    if child_id == 0x86:
+                        track_codec = data[child_start:child_start + child_size].decode('ascii', 'ignore')
+                    elif child_id == EBML_AUDIO:
+                        track_audio = (child_start, child_start + child_size)
+                if track_codec and track_audio:
+                    codec = track_codec.lower().replace('a_', '', 1)
+                    for child_id, child_start, child_size in _ebml_elements(data, *track_audio):
+                        value = data[child_start:child_start + child_size]
+                        if child_id == 0xB5:
+                            sample_rate = int(_ebml_float(value))
+                        elif child_id == 0x9F:
+                            channels = _ebml_uint(value)
+        elif element_id == EBML_CLUSTER or size == EBML_UNKNOWN_SIZE:
+            break
+    
+    if duration is None:
+        duration = _webm_last_timecode(reader)
+    
+    duration_us = int(duration * timecode_scale / 1000) if duration is not None else None
+    return AudioInfo(duration_us, codec, sample_rate, channels)
+
+def _webm_last_timecode(reader: ProbeReader) -> Optional[int]:
+    """末尾の最後のClusterのタイムコードとブロックの相対時間から長さを推定"""
+    tail = reader.read_tail(PROBE_BYTES)
+    position = tail.rfind(b'\x1f\x43\xb6\x75')
+    if position < 0:
+        return None
+    
+    _, start = _ebml_vint(tail, position, keep_marker=True)
+    size, start = _ebml_vint(tail, start, keep_marker=False)
+    end = len(tail) if size == EBML_UNKNOWN_SIZE else min(len(tail), start + size)
+    
+    cluster_timecode = None
+    last_block = 0
+    try:
+        for element_id, child_start, child_size in _ebml_elements(tail, start, end):
+            if element_id == 0xE7:
+                cluster_timecode = _ebml_uint(tail[child_start:child_start + child_size])
+            elif element_id in (0xA3, 0xA0):
+                block_start = child_start
+                if element_id == 0xA0:
+                    # BlockGroup内のBlock
+                    block_start = next((s for i, s, _ in _ebml_elements(tail, child_start, child_start + child_size)
+                                        if i == 0xA1), None)
+                    if block_start is None:
+                        continue
+                _, timecode_start = _ebml_vint(tail, block_start, keep_marker=False)
+                relative = struct.unpack('>h', tail[timecode_start:timecode_start + 2])[0]
+                last_block = max(last_block, relative)
+    except (IndexError, ValueError, struct.error):
+        pass
+    
+    return cluster_timecode + last_block if cluster_timecode is not None else None
\ No newline at end of file
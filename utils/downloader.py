@@ -0,0 +1,149 @@
+import aiohttp
+import hashlib
+import os
+import tempfile
+from typing import Any, BinaryIO, Dict, Optional
+from utils.audio_probe import AudioInfo, probe_bytes, probe_file
+from utils.logger import setup_logger
+
+class AudioFile:
+    """ダウンロードして一時ファイルに保存した音声"""
+    
+    def __init__(self, path: str, filename: str, content_type: Optional[str], size: int, digest: str,
+                 info: Optional[AudioInfo] = None):
+        self.path = path
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        # SHA-256（キャッシュキーに使用）
+        self.digest = digest
+        # ヘッダーから取得した再生時間・コーデックなど（解析できない形式はNone）
+        self.info = info
+    
+    @property
+    def duration(self) -> Optional[float]:
+        """再生時間（秒）"""
+        return self.info.duration if self.info else None
+    
+    def __enter__(self) -> 'AudioFile':
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.cleanup()
+    
+    def open(self) -> BinaryIO:
+        """読み込み用に開く（アップロード時にチャンク単位で読み出される）"""
+        return open(self.path, 'rb')
+    
+    def read(self) -> bytes:
+        """全体を読み込む"""
+        with self.open() as f:
+            return f.read()
+    
+    def cleanup(self):
+        """一時ファイルを削除"""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+class AttachmentDownloader:
+    """添付ファイルを一定サイズのチャンクで一時ファイルへダウンロード
+    
+    ダウンロード中にハッシュを計算するため、ファイル全体をメモリに保持しない。
+    """
+    
+    def __init__(self, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.max_file_size = settings.get('max_file_size_mb', 50) * 1024 * 1024
+        self.chunk_size = settings.get('download_chunk_kb', 64) * 1024
+        # 事前解析で取得する先頭・末尾のバイト数
+        self.probe_size = settings.get('probe_kb', 16) * 1024
+        self.timeout = aiohttp.ClientTimeout(total=None, connect=10, sock_read=60)
+        self.logger = setup_logger('AttachmentDownloader')
+        self.session = None
+    
+    async def initialize(self):
+        """非同期セッションの初期化"""
+        if not self.session:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+    
+    async def close(self):
+        """セッションのクローズ"""
+        if self.session:
+            await self.session.close()
+            self.session = None
+    
+    def is_too_large(self, size: int) -> bool:
+        """ダウンロード前のサイズチェック"""
+        return size > self.max_file_size
+    
+    async def probe_remote(self, url: str, size: int) -> Optional[AudioInfo]:
+        """Rangeリクエストで先頭・末尾だけを取得して音声情報を解析（全体のダウンロード前）"""
+        # 小さいファイルはそのままダウンロードした方が早い
+        if size <= self.probe_size * 2:
+            return None
+        
+        await self.initialize()
+        
+        try:
+            # 先頭の応答でRange対応を確認してから末尾を要求する
+            # （非対応のサーバーに全体の送信を2回させない）
+            head = await self._fetch_range(url, f'bytes=0-{self.probe_size - 1}')
+            if head is None:
+                return None
+            tail = await self._fetch_range(url, f'bytes=-{self.probe_size}')
+        except Exception as e:
+            self.logger.error(f"Error probing {url}: {str(e)}")
+            return None
+        
+        if tail is None:
+            return None
+        return probe_bytes(head, tail, size)
+    
+    async def _fetch_range(self, url: str, byte_range: str) -> Optional[bytes]:
+        """指定範囲を取得（Range非対応のサーバーでは本文を読まずにNone）"""
+        async with self.session.get(url, headers={'Range': byte_range}) as response:
+            if response.status != 206:
+                self.logger.warning(f"Range request not supported: {response.status}")
+                response.close()
+                return None
+            return await response.read()
+    
+    async def download(self, url: str, filename: str, content_type: Optional[str] = None) -> Optional[AudioFile]:
+        """URLからダウンロード（上限を超えた場合は途中で中断してNone）"""
+        await self.initialize()
+        
+        fd, path = tempfile.mkstemp(prefix='voice_', suffix=os.path.splitext(filename)[1])
+        digest = hashlib.sha256()
+        size = 0
+        completed = False
+        
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                async with self.session.get(url) as response:
+                    if response.status != 200:
+                        self.logger.error(f"Download failed: {response.status} - {filename}")
+                        return None
+                    
+                    if response.content_length and self.is_too_large(response.content_length):
+                        self.logger.warning(f"File too large: {filename} ({response.content_length} bytes)")
+                        return None
+                    
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        size += len(chunk)
+                        if self.is_too_large(size):
+                            self.logger.warning(f"File exceeded size limit while downloading: {filename}")
+                            return None
+                        digest.update(chunk)
+                        f.write(chunk)
+            
+            completed = True
+            return AudioFile(path, filename, content_type, size, digest.hexdigest(), info=probe_file(path))
+        
+        except Exception as e:
+            self.logger.error(f"Error downloading {filename}: {str(e)}")
+            return None
+        finally:
+            if not completed:
+                os.remove(path)
\ No newline at end of file
@@ -0,0 +1,281 @@
+import asyncio
+import email.utils
+import os
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, Iterator, Optional, TypeVar, Union
+import aiohttp
+from utils.logger import setup_logger
+from utils.adaptive_limiter import report_overload
+
+T = TypeVar('T')
+
+class UpstreamError(Exception):
+    """上流APIのエラー応答（statusがNoneの場合は接続エラー）"""
+    
+    def __init__(self, status: Optional[int], message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status} - {message}" if status else message)
+        self.status = status
+        self.retry_after = retry_after
+    
+    @property
+    def retryable(self) -> bool:
+        """再試行で回復しうるエラーか（接続エラー・429・5xx）"""
+        return self.status is None or self.status == 429 or self.status >= 500
+
+class CircuitOpenError(Exception):
+    """サーキットブレーカーが開いているため呼び出しを行わなかった"""
+    
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit for {endpoint} is open (retry in {retry_in:.1f}s)")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-Afterヘッダー（秒数またはHTTP日付）を秒数に変換"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+async def raise_for_status(response: aiohttp.ClientResponse, expected: int = 200):
+    """期待したステータス以外の応答をUpstreamErrorに変換"""
+    if response.status != expected:
+        error_text = await response.text()
+        raise UpstreamError(
+            response.status,
+            error_text[:500],
+            parse_retry_after(response.headers.get('Retry-After'))
+        )
+
+class ReplayableBody:
+    """再試行ごとに先頭から送り直せるリクエストボディ
+    
+    aiohttpは送信後にファイルオブジェクトを閉じるため、ファイルは試行ごとに
+    パスから開き直す。パスを持たないストリームは最初にメモリへ読み込む。
+    """
+    
+    def __init__(self, file_data: Union[bytes, BinaryIO]):
+        self.data: Optional[bytes] = None
+        self.path: Optional[str] = None
+        self.position = 0
+        
+        if isinstance(file_data, (bytes, bytearray)):
+            self.data = bytes(file_data)
+        elif isinstance(getattr(file_data, 'name', None), str) and os.path.isfile(file_data.name):
+            self.path = file_data.name
+            self.position = file_data.tell()
+        else:
+            self.data = file_data.read()
+    
+    @contextmanager
+    def open(self) -> Iterator[Union[bytes, BinaryIO]]:
+        if self.path is None:
+            yield self.data
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self.position)
+            yield f
+
+class CircuitBreaker:
+    """エンドポイントごとのサーキットブレーカー（closed / open / half-open）
+    
+    連続して失敗するとopenになり、reset_timeoutの間は呼び出しを即座に拒否する。
+    その後half-openで1件だけ試行を通し、成功すればclosedに戻る。
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+        self._probing = False
+    
+    def allow(self) -> bool:
+        """呼び出してよいか（half-openでは同時に1件のみ）"""
+        if self.state == self.CLOSED:
+            return True
+        
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        
+        if self._probing:
+            self.rejected += 1
+            return False
+        self._probing = True
+        return True
+    
+    def retry_in(self) -> float:
+        """openの間、次に試行できるまでの秒数"""
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+    
+    def release(self):
+        """結果を記録せずにhalf-openの試行枠を返す"""
+        self._probing = False
+    
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+    
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.trips += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+class RetryBudget:
+    """再試行の予算（直近のリクエスト数に対する割合で再試行数を制限）
+    
+    障害時に全リクエストが再試行して上流への負荷が倍増するのを防ぐ。
+    """
+    
+    def __init__(self, ratio: float = 0.2, min_retries: int = 3, window: float = 10.0):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests = deque()
+        self._retries = deque()
+        self.exhausted = 0
+    
+    def _trim(self, now: float):
+        for events in (self._requests, self._retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+    
+    def record_request(self):
+        self._requests.append(time.monotonic())
+    
+    def try_spend(self) -> bool:
+        """再試行を1回分使う（予算がなければFalse）"""
+        now = time.monotonic()
+        self._trim(now)
+        if len(self._retries) >= max(self.min_retries, len(self._requests) * self.ratio):
+            self.exhausted += 1
+            return False
+        self._retries.append(now)
+        return True
+
+class Resilience:
+    """サーキットブレーカーと再試行（指数バックオフ＋ジッター）をまとめた呼び出しラッパー
+    
+    ブレーカーはエンドポイントごと、再試行の予算はサービス全体で共有する。
+    """
+    
+    def __init__(self, name: str, settings: Optional[Dict[str, Any]] = None):
+        settings = settings or {}
+        self.name = name
+        self.max_retries = settings.get('max_retries', 2)
+        self.base_delay = settings.get('base_delay_seconds', 0.5)
+        self.max_delay = settings.get('max_delay_seconds', 8.0)
+        # Retry-Afterがこれより長い場合は再試行せずに失敗とする
+        self.max_retry_after = settings.get('max_retry_after_seconds', 30.0)
+        self.failure_threshold = settings.get('failure_threshold', 5)
+        self.reset_timeout = settings.get('reset_timeout_seconds', 30.0)
+        self.budget = RetryBudget(
+            ratio=settings.get('retry_budget_ratio', 0.2),
+            min_retries=settings.get('retry_budget_min', 3),
+            window=settings.get('retry_budget_window_seconds', 10.0)
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.retries = 0
+        self.logger = setup_logger(f'Resilience.{name}')
+    
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        """エンドポイントのブレーカー（なければ作成）"""
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return self.breakers[endpoint]
+    
+    def backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """次の試行までの待ち時間（full jitter。Retry-Afterがあればそれ以上待つ）"""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+    
+    async def call(self, endpoint: str, attempt: Callable[[], Awaitable[T]]) -> T:
+        """attemptを実行し、回復しうるエラーは予算の範囲で再試行する
+        
+        ブレーカーが開いている場合はCircuitOpenErrorを即座に送出する。
+        attemptは試行ごとに呼ばれるため、リクエストボディは毎回作り直すこと。
+        """
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise CircuitOpenError(f"{self.name}.{endpoint}", breaker.retry_in())
+        
+        self.budget.record_request()
+        tries = 0
+        while True:
+            try:
+                result = await attempt()
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                # 接続失敗・切断・タイムアウトだけをネットワーク障害として再試行する
+                error = UpstreamError(None, f"{type(e).__name__}: {e}")
+            except UpstreamError as e:
+                error = e
+            except aiohttp.ClientError:
+                # 応答を受け取った後の解析エラー（ContentTypeErrorなど）は再試行しても
+                # 同じ結果になるため、上流は応答できたものとしてそのまま送出する
+                breaker.record_success()
+                raise
+            except BaseException:
+                # キャンセルなど結果が分からない場合はhalf-openの試行枠だけ返す
+                breaker.release()
+                raise
+            else:
+                breaker.record_success()
+                return result
+            
+            if not error.retryable:
+                # 4xxはリクエスト側の問題なので上流は正常とみなす
+                breaker.record_success()
+                raise error
+            
+            breaker.record_failure()
+            report_overload()
+            if tries >= self.max_retries:
+                raise error
+            if error.retry_after is not None and error.retry_after > self.max_retry_after:
+                raise error
+            if not breaker.allow() or not self.budget.try_spend():
+                raise error
+            
+            delay = self.backoff(tries, error.retry_after)
+            tries += 1
+            self.retries += 1
+            self.logger.warning(f"{endpoint} failed ({error}), retry {tries}/{self.max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+    
+    def metrics(self) -> Dict[str, Any]:
+        """ブレーカーの状態と再試行数"""
+        return {
+            'retries': self.retries,
+            'budget_exhausted': self.budget.exhausted,
+            'breakers': {
+                endpoint: {'state': b.state, 'trips': b.trips, 'rejected': b.rejected}
+                for endpoint, b in self.breakers.items()
+            }
+        }
\ No newline at end of file
@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+from utils.cache import LRUCache
+
+class SingleFlight:
+    """同じキーの同時実行を1回の呼び出しにまとめ、結果をTTL付きで保持する"""
+    
+    def __init__(self, max_size: int = 512, ttl: Optional[float] = 3600):
+        self.results = LRUCache(max_size=max_size, ttl=ttl)
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        
+        # メトリクス
+        self.calls = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+    
+    @staticmethod
+    def make_key(text: str, action: str, language: str = '') -> Tuple[str, str, str]:
+        """本文のハッシュ・アクション・対象言語からキーを生成"""
+        digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return (digest, action, language)
+    
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """キーごとに1回だけfuncを実行し、同時に待っている呼び出し元へ結果を配る
+        
+        Noneや例外はキャッシュしない（次の呼び出しで再実行される）。
+        """
+        result = self.results.get(key)
+        if result is not None:
+            self.cache_hits += 1
+            return result
+        
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self.coalesced += 1
+        
+        # 呼び出し元がキャンセルされても共有の処理は続ける
+        return await asyncio.shield(task)
+    
+    def _on_done(self, key: Hashable, task: asyncio.Task):
+        """実行完了時に結果をキャッシュへ移す"""
+        self._inflight.pop(key, None)
+        if task.cancelled():
+            return
+        if task.exception() is None and task.result() is not None:
+            self.results.set(key, task.result())
+    
+    def metrics(self) -> Dict[str, Any]:
+        """メトリクスを取得"""
+        return {
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'cache_hits': self.cache_hits,
+            'in_flight': len(self._inflight),
+            'cached': len(self.results)
+        }
@@ -0,0 +1,76 @@
+import hashlib
+from typing import Any, Dict, Optional
+from utils.cache import LRUCache
+from utils.logger import setup_logger
+
+class TranscriptionCache:
+    """音声データのハッシュをキーにした文字起こしキャッシュ"""
+    
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, database=None):
+        settings = settings or {}
+        self.ttl = settings.get('ttl_hours', 168) * 3600
+        self.persistent_max_entries = settings.get('persistent_max_entries', 10000)
+        self.memory = LRUCache(max_size=settings.get('max_entries', 512), ttl=self.ttl)
+        # 永続層（phase2のDatabase）。Noneの場合はメモリのみ
+        self.database = database
+        self.logger = setup_logger('TranscriptionCache')
+        self._writes = 0
+    
+    @staticmethod
+    def make_key(file_data: bytes, language: str, backend: Optional[str], speed: float = 1.0) -> str:
+        """音声バイト列・言語・バックエンド・時間圧縮の倍率からキャッシュキーを生成"""
+        return TranscriptionCache.key_from_digest(hashlib.sha256(file_data).hexdigest(), language, backend, speed)
+    
+    @staticmethod
+    def key_from_digest(digest: str, language: str, backend: Optional[str], speed: float = 1.0) -> str:
+        """計算済みのSHA-256からキャッシュキーを生成
+        
+        時間圧縮した音声は文字起こし結果が変わりうるため、倍率ごとに別のキーにする
+        （等倍のキーは倍率を含まない以前の形式のまま）。
+        backendがNoneの場合はバックエンドを区別しない（ルーターがどれかを選ぶ場合）。
+        """
+        prefix = f"{backend}:{language}" if backend else language
+        if speed == 1.0:
+            return f"{prefix}:{digest}"
+        return f"{prefix}:x{speed:g}:{digest}"
+    
+    async def get(self, key: str) -> Optional[str]:
+        """キャッシュから文字起こし結果を取得"""
+        transcription = self.memory.get(key)
+        if transcription is not None:
+            self.logger.info(f"Cache hit (memory): {key[:40]}")
+            return transcription
+        
+        if self.database:
+            try:
+                transcription = await self.database.get_cached_transcription(key, max_age=self.ttl)
+            except Exception as e:
+                self.logger.error(f"Error reading transcription cache: {str(e)}")
+                return None
+            
+            if transcription is not None:
+                self.memory.set(key, transcription)
+                self.logger.info(f"Cache hit (database): {key[:40]}")
+                return transcription
+        
+        return None
+    
+    async def set(self, key: str, transcription: str):
+        """文字起こし結果をキャッシュに保存"""
+        if not transcription:
+            return
+        
+        self.memory.set(key, transcription)
+        
+        if self.database:
+            try:
+                await self.database.save_cached_transcription(key, transcription)
+                self._writes += 1
+                # 書き込み数回ごとに期限切れ・上限超過分を削除
+                if self._writes % 50 == 0:
+                    await self.database.prune_transcription_cache(
+                        max_entries=self.persistent_max_entries,
+                        max_age=self.ttl
+                    )
+            except Exception as e:
+                self.logger.error(f"Error writing transcription cache: {str(e)}")
\ No newline at end of file